@@ -59,6 +59,8 @@ INSTALLED_APPS = [
 SITE_ID = 1
 
 MIDDLEWARE = [
+    'guild.middlewares.PerformanceMiddleware',
+    'guild.middlewares.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     # 'guild.middlewares.TwoFactorAuthMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -69,10 +71,8 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.contrib.flatpages.middleware.FlatpageFallbackMiddleware',
     'django.middleware.locale.LocaleMiddleware',
-    # 'guild.middlewares.TimezoneMiddleware',
-    'django.middleware.cache.UpdateCacheMiddleware',
-    # 'django.middleware.common.CommonMiddleware',
-    # 'django.middleware.cache.FetchFromCacheMiddleware',
+    'guild.middlewares.TimezoneMiddleware',
+    # Ленту и страницы постов для анонимных пользователей кэширует AnonymousPageCacheMixin
 ]
 
 ROOT_URLCONF = 'MMORPG.urls'
@@ -96,17 +96,56 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'MMORPG.wsgi.application'
+ASGI_APPLICATION = 'MMORPG.asgi.application'
+# Асинхронные представления чтения (guild/async_views.py) - для запуска под ASGI (uvicorn MMORPG.asgi:application)
+ASYNC_READ_VIEWS = os.getenv("ASYNC_READ_VIEWS", "") == "1"
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
+        # django.db.backends.sqlite3 с BEGIN IMMEDIATE для транзакций (guild/sqlite_backend)
+        "ENGINE": "guild.sqlite_backend",
         "NAME": "mmorpg.sqlite3",
+        # Соединение живёт между запросами (открытие файла и применение PRAGMA - не на каждый запрос)
+        "CONN_MAX_AGE": int(os.getenv("CONN_MAX_AGE", 600)),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# Реплики только для чтения (guild/routers.py): файлы SQLite через запятую в DATABASE_REPLICAS,
+# например копии основной базы, которые поддерживает litestream или sqlite3 .backup по расписанию.
+# В тестах реплики указывают на тестовую основную базу (MIRROR)
+DATABASE_REPLICAS = []
+for number, name in enumerate(filter(None, os.getenv("DATABASE_REPLICAS", "").split(",")), start=1):
+    DATABASES[f"replica{number}"] = {
+        **DATABASES["default"],
+        "NAME": name.strip(),
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(f"replica{number}")
+DATABASE_ROUTERS = ['guild.routers.ReplicaRouter']
+# Чтения пользователя после записи идут в основную базу столько секунд (больше отставания реплик)
+REPLICA_PIN_SECONDS = int(os.getenv("REPLICA_PIN_SECONDS", 10))
+
+# Режим журнала SQLite: WAL - читатели не блокируют писателя и наоборот. Режим хранится в файле
+# базы, поэтому включается один раз миграцией guild 0010 (manage.py migrate), а не при каждом
+# соединении. После этого рядом с базой появляются файлы mmorpg.sqlite3-wal и -shm (в .gitignore);
+# чтобы вернуть обычный журнал, откатите миграцию: manage.py migrate guild 0009
+SQLITE_JOURNAL_MODE = 'WAL'
+# PRAGMA для каждого нового соединения с SQLite (guild/sqlite.py):
+# synchronous=NORMAL в режиме WAL не теряет целостность при сбое (только последние транзакции
+# при отключении питания), busy_timeout - писатели ждут освобождения блокировки вместо
+# немедленной ошибки "database is locked"
+SQLITE_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000)),
+    'cache_size': -64000,  # в КиБ (отрицательное значение): 64 МБ страничного кэша на соединение
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
 '''DATABASES = {
     'default': {
         
@@ -183,6 +222,20 @@ LOGIN_REDIRECT_URL = "/"
 MEDIA_URL = '/images/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'images')
 
+# Загрузки хранятся по sha256 содержимого, одинаковые файлы - один раз (guild.storage)
+STORAGES = {
+    'default': {'BACKEND': 'guild.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+# Размер и тип загруженных изображений проверяют поля форм (guild.uploads.validate_image_upload)
+MEDIA_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+MEDIA_ALLOWED_TYPES = ('image/jpeg', 'image/png', 'image/gif', 'image/webp')
+# Отдача загруженных файлов (guild.media): 'django', 'x-accel-redirect' (nginx) или 'x-sendfile'.
+# Для nginx нужен internal location MEDIA_ACCEL_PREFIX с alias на MEDIA_ROOT
+MEDIA_SERVE_MODE = os.getenv('MEDIA_SERVE_MODE', 'django')
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+MEDIA_CACHE_MAX_AGE = 60 * 60
+
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
     # 'allauth.account.auth_backends.AuthenticationBackend',
@@ -216,6 +269,16 @@ ADMINS = (
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 SERVER_EMAIL = os.getenv("EMAIL_HOST_USER")
 
+# Очередь исходящих писем (guild.mail, manage.py send_outbox).
+# Воркер отправляет письма через EMAIL_BACKEND: в разработке и тестах это console/locmem, в проде - SMTP
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_BACKOFF = 60
+
+# Уменьшенные копии изображений (manage.py process_images)
+IMAGE_WIDTHS = (150, 300, 600, 1200)
+IMAGE_QUALITY = 80
+
 SITE_URL = 'http://127.0.0.1:8000/'
 
 APSCHEDULER_DATETIME_FORMAT = "N j, Y, f:s a"
@@ -230,13 +293,74 @@ APSCHEDULER_RUN_NOW_TIMEOUT = 25
 # CELERY_TASK_SERIALIZER = 'json'
 
 # настройки кеширования
+# default - двухуровневый кэш: LRU в памяти процесса + общий кэш 'shared'.
+# В проде общий кэш - Redis (переменная окружения CACHE_REDIS_URL, нужен пакет redis),
+# локально и в тестах - файловый кэш
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
 CACHES = {
     'default': {
+        'BACKEND': 'guild.cache_backends.TieredCache',
+        'TIMEOUT': 60,
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 5,
+            # версии и поколения, по которым сбрасывается кэш, и индекс подписок, который правится
+            # чтением и записью на месте (guild/subscribers.py), всегда читаются из общего кэша
+            'LOCAL_EXCLUDE': [r':version$', r':generation$', r'^subscribers:'],
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_REDIS_URL,
+        'TIMEOUT': 60,
+    } if CACHE_REDIS_URL else {
         'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
         'LOCATION': os.path.join(BASE_DIR, 'cache_files'),
         # Указываем, куда будем сохранять кэшируемые файлы! Не забываем создать папку cache_files внутри папки с manage.py!
         'TIMEOUT': 60,
-    }
+    },
+}
+# Замеры производительности запросов (guild.middlewares.PerformanceMiddleware):
+# доля запросов, профилируемых cProfile, и папка для .prof файлов
+PERF_PROFILE_SAMPLE_RATE = float(os.getenv("PERF_PROFILE_SAMPLE_RATE", 0))
+PERF_PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+# Метрики Prometheus на /metrics (guild/metrics.py): общая папка для снимков процессов
+# (несколько воркеров gunicorn - очищать перед запуском) и токен сборщика
+METRICS_DIR = os.getenv("METRICS_DIR") or None
+METRICS_TOKEN = os.getenv("METRICS_TOKEN") or None
+# События для потоков SSE на /events/ (guild/events.py): между процессами - через Redis,
+# без него - в памяти процесса (один воркер, разработка)
+EVENTS_REDIS_URL = os.getenv("EVENTS_REDIS_URL") or CACHE_REDIS_URL
+EVENTS_STREAM_TIMEOUT = int(os.getenv("EVENTS_STREAM_TIMEOUT", 300))
+
+# Строка лога guild.performance на каждый запрос (PerformanceMiddleware) выводится только при
+# PERF_LOG_LEVEL=INFO; по умолчанию WARNING - вывод тестов и консоль разработки не засоряются
+PERF_LOG_LEVEL = os.getenv("PERF_LOG_LEVEL", "WARNING")
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'performance': {
+            'format': '{asctime} | {message}',
+            'datefmt': '%Y-%m-%d %H:%M:%S',
+            'style': '{',
+        },
+    },
+    'handlers': {
+        'performance': {
+            'level': 'INFO',
+            'class': 'logging.StreamHandler',
+            'formatter': 'performance',
+        },
+    },
+    'loggers': {
+        'guild.performance': {
+            'handlers': ['performance'],
+            'level': PERF_LOG_LEVEL,
+            'propagate': False,
+        },
+    },
 }
 """
 LOGGING = {
@@ -364,4 +488,14 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ]
 }
-"""
\ No newline at end of file
+"""
+
+REST_FRAMEWORK = {
+    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    'DEFAULT_PAGINATION_CLASS': 'guild.pagination.PostCursorPagination',
+    'DEFAULT_RENDERER_CLASSES': [
+        'guild.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'PAGE_SIZE': 10,
+}
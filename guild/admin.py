@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Post, Profile, Response, Category, Subscription
+from .models import Post, Profile, Response, Category, Subscription, OutboxEmail, ImageJob
 
 from modeltranslation.admin import \
     TranslationAdmin  # импортируем модель амдинки (вспоминаем модуль про переопределение стандартных админ-инструментов)
@@ -22,3 +22,23 @@ admin.site.register(Post)
 admin.site.register(Profile)
 admin.site.register(Response)
 admin.site.register(Subscription)
+
+
+# Очередь писем: неотправленные (dead) письма можно найти по фильтру статуса
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject', 'last_error')
+
+
+admin.site.register(OutboxEmail, OutboxEmailAdmin)
+
+
+# Очередь изображений: задания с ошибкой (failed) можно найти по фильтру статуса
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ('target', 'object_id', 'source', 'status', 'attempts', 'processed_at')
+    list_filter = ('status', 'target')
+    search_fields = ('source', 'last_error')
+
+
+admin.site.register(ImageJob, ImageJobAdmin)
@@ -7,3 +7,5 @@ class GuildConfig(AppConfig):
 
     def ready(self):
         import guild.signals
+        import guild.sqlite
+        import guild.instrumentation
@@ -0,0 +1,226 @@
+import asyncio
+import hashlib
+
+import pytz
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views import View
+from rest_framework.request import Request
+
+from services.modules.mixins import AsyncAnonymousPageCacheMixin
+
+from . import events, routers
+from .caching import aboard_generation, aget_post_snapshot, apost_version, generation_time
+from .filters import PostFilter
+from .models import Post, Profile
+from .pagination import KeysetPaginator, PostCursorPagination
+from .renderers import FastJSONRenderer
+from .search import search_page
+from .serializers import POST_READ_FIELDS, PostSerializer, post_rows, post_values
+from .subscribers import is_subscribed
+from .views import PostListCreate, PostListView, ResponseView
+
+# Асинхронные версии представлений чтения для ASGI (settings.ASYNC_READ_VIEWS, см. guild/urls.py):
+# лента, пост, отклики к посту и GET /api/post/. Кэш читается cache.aget, ORM - через async-итерацию
+# и afirst/aaggregate; синхронные части (пользователь сессии, валидация фильтра, поиск FTS)
+# выполняются через sync_to_async. Ответы те же, что у синхронных представлений.
+# В Django 4.2 async ORM и async-методы кэша сами выполняют синхронный код в одном потоке, поэтому
+# выигрыш - в ожидании медленных клиентов и внешних сервисов, а не в параллельных запросах к базе
+
+
+async def _set_timezone(request):
+    await sync_to_async(request.session.__setitem__)('django_timezone', request.POST['timezone'])
+    return redirect('/')
+
+
+def _is_authenticated(request):
+    return sync_to_async(lambda: request.user.is_authenticated)()
+
+
+# Форма фильтра проверяется синхронно: ModelChoiceFilter читает категорию из базы
+def _is_valid(filterset):
+    return sync_to_async(filterset.is_valid)()
+
+
+class AsyncPostListView(AsyncAnonymousPageCacheMixin, View):
+    template_name = 'post_list.html'
+    paginate_by = PostListView.paginate_by
+
+    def get_queryset(self):
+        return PostListView.get_queryset(self)
+
+    async def get(self, request, *args, **kwargs):
+        filterset = PostFilter(request.GET or None, queryset=self.get_queryset(), request=request)
+        if not filterset.is_bound or await _is_valid(filterset):
+            queryset = filterset.qs
+        else:
+            queryset = filterset.queryset.none()
+        cursor = request.GET.get('cursor')
+        query = getattr(filterset.form, 'cleaned_data', {}).get('content')
+        if query:
+            page = await sync_to_async(search_page)(queryset, query, self.paginate_by, cursor)
+        else:
+            page = await KeysetPaginator(queryset, self.paginate_by).apage(cursor)
+
+        query_params = request.GET.copy()
+        query_params.pop('cursor', None)
+        query_params.pop('page', None)
+        return TemplateResponse(request, self.template_name, {
+            'view': self,
+            'filter': filterset,
+            'filterset': filterset,
+            'object_list': page.object_list,
+            'page_obj': page,
+            'posts': page,
+            'is_paginated': page.has_other_pages(),
+            'query_string': query_params.urlencode(),
+            'current_time': timezone.localtime(timezone.now()),
+            'timezones': pytz.common_timezones,
+        })
+
+    async def post(self, request):
+        return await _set_timezone(request)
+
+
+class AsyncPostDetailView(AsyncAnonymousPageCacheMixin, View):
+    template_name = 'post_detail.html'
+
+    async def get_page_generation(self):
+        return await apost_version(self.kwargs['pk'])
+
+    async def get(self, request, *args, **kwargs):
+        post = await aget_post_snapshot(self.kwargs['pk'])
+        if post is None:
+            raise Http404('Объявление не найдено')
+        context = {
+            'view': self,
+            'object': post,
+            'post': post,
+            'current_time': timezone.localtime(timezone.now()),
+            'timezones': pytz.common_timezones,
+        }
+        if await _is_authenticated(request):
+            context['is_subscribed'] = await sync_to_async(is_subscribed)(request.user.pk, post.category_id)
+        return TemplateResponse(request, self.template_name, context)
+
+    async def post(self, request, *args, **kwargs):
+        return await _set_timezone(request)
+
+
+class AsyncResponseView(View):
+    template_name = ResponseView.template_name
+
+    async def get(self, request, *args, **kwargs):
+        queryset = ResponseView(kwargs=self.kwargs).get_queryset()
+        responses = [response async for response in queryset]
+        return TemplateResponse(request, self.template_name, {
+            'view': self,
+            'object_list': responses,
+            'responses': responses,
+            'is_paginated': False,
+            'page_obj': None,
+            'paginator': None,
+        })
+
+
+# GET /api/post/ с тем же ETag, курсором и форматом, что у PostListCreate. Создание постов,
+# OPTIONS и браузерный API (Accept: text/html) обрабатывает синхронное представление DRF
+class AsyncPostListAPIView(View):
+    sync_view = staticmethod(PostListCreate.as_view())
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # Как у APIView: CSRF для сессий проверяет аутентификация DRF
+        view.csrf_exempt = True
+        return view
+
+    async def get(self, request, *args, **kwargs):
+        if 'text/html' in request.headers.get('Accept', ''):
+            return await self.delegate(request, *args, **kwargs)
+        api_request = Request(request)
+        generation = await aboard_generation()
+        raw = f'{generation}|{request.get_full_path()}|json'
+        etag = quote_etag(hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest())
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            with routers.use_primary_since(generation_time(generation)):
+                response = await self.list(request, api_request)
+            if response.status_code != 200:
+                return response
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(generation_time(generation))
+        return response
+
+    async def list(self, request, api_request):
+        filterset = PostFilter(api_request.query_params, queryset=Post.objects.all(), request=api_request)
+        if not await _is_valid(filterset):
+            errors = filterset.errors.get_json_data()
+            return self.render({name: [error['message'] for error in items] for name, items in errors.items()},
+                               status=400)
+        requested = PostSerializer.requested_fields(api_request)
+        fields = [name for name in POST_READ_FIELDS if requested is None or name in requested]
+        pagination = PostCursorPagination()
+        page = await pagination.apaginate_queryset(post_values(filterset.qs, fields), api_request)
+        return self.render(pagination.get_paginated_data(post_rows(page, fields, request)))
+
+    async def post(self, request, *args, **kwargs):
+        return await self.delegate(request, *args, **kwargs)
+
+    async def options(self, request, *args, **kwargs):
+        return await self.delegate(request, *args, **kwargs)
+
+    async def delegate(self, request, *args, **kwargs):
+        return await sync_to_async(self.sync_view)(request, *args, **kwargs)
+
+    def render(self, data, status=200):
+        return HttpResponse(FastJSONRenderer().render(data), status=status, content_type=FastJSONRenderer.media_type)
+
+
+# Поток событий пользователя (text/event-stream, guild/events.py) вместо опроса страницы модерации.
+# Первым идёт текущее число откликов на модерации - состояние после переподключения, затем события
+# по мере публикации и комментарий раз в EVENTS_KEEPALIVE секунд. Через EVENTS_STREAM_TIMEOUT поток
+# закрывается, EventSource переподключается сам. Держать соединения открытыми может только ASGI:
+# под WSGI ответ содержит одно состояние, и браузер повторяет запрос через EVENTS_RETRY_MS
+class EventStreamView(View):
+    async def get(self, request, *args, **kwargs):
+        if not await _is_authenticated(request):
+            return HttpResponse(status=401)
+        user_id = request.user.pk
+        if isinstance(request, ASGIRequest):
+            content = self.stream(user_id)
+        else:
+            content = [f'retry: {events.EVENTS_RETRY_MS}\n\n', await self.state(user_id)]
+        response = StreamingHttpResponse(content, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # nginx не должен буферизовать поток
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def state(self, user_id):
+        pending = await (
+            Profile.objects.filter(user_id=user_id).values_list('pending_moderation_count', flat=True).afirst()
+        )
+        return events.format_frame('moderation.pending', {'pending': pending or 0})
+
+    # Подписка до чтения состояния: событие между ними не потеряется
+    async def stream(self, user_id):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + events.EVENTS_STREAM_TIMEOUT
+        async with events.get_broker().subscribe(events.user_channel(user_id)) as subscription:
+            yield f'retry: {events.EVENTS_RETRY_MS}\n\n'
+            yield await self.state(user_id)
+            while (remaining := deadline - loop.time()) > 0:
+                try:
+                    message = await asyncio.wait_for(subscription.get(), min(events.EVENTS_KEEPALIVE, remaining))
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield events.format_event(message)
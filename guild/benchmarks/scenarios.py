@@ -0,0 +1,234 @@
+import math
+import random
+import secrets
+import threading
+import time
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPRedirectHandler, Request, build_opener
+
+from django.contrib.auth.models import User
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+from guild.benchmarks.world import CATEGORY_PREFIX, USERNAME_PREFIX
+from guild.models import Category, Post, Profile, Subscription
+
+
+# Сценарии нагрузки по настоящим маршрутам сайта (весь стек: middleware, кэш, шаблоны).
+# Каждый сценарий по генератору случайных чисел и данным мира выдаёт запрос (метод, путь, данные)
+# и указывает, от чьего имени он выполняется: anonymous, reader (случайный пользователь мира)
+# или author (автор с наибольшим числом откликов на модерации)
+
+class World:
+    def __init__(self):
+        bench = Post.objects.filter(author__user__username__startswith=USERNAME_PREFIX)
+        self.post_ids = list(bench.order_by('id').values_list('id', flat=True))
+        self.category_ids = list(
+            Category.objects.filter(name__startswith=CATEGORY_PREFIX).order_by('id').values_list('id', flat=True)
+        )
+        self.readers = list(
+            User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('id').values_list('id', flat=True)
+        )
+        self.author = (
+            Profile.objects.filter(user__username__startswith=USERNAME_PREFIX)
+            .order_by('-pending_moderation_count', 'id').values_list('user_id', flat=True).first()
+        )
+        days = bench.dates('created_at', 'day')
+        self.days = [day.isoformat() for day in days]
+
+    def __bool__(self):
+        return bool(self.post_ids and self.category_ids and self.readers)
+
+    def counts(self):
+        return {'posts': len(self.post_ids), 'categories': len(self.category_ids), 'users': len(self.readers)}
+
+
+def post_list(rng, world):
+    query = {}
+    roll = rng.random()
+    if roll < 0.4:
+        query['category'] = rng.choice(world.category_ids)
+    if 0.3 < roll < 0.6 and world.days:
+        query['created_at'] = rng.choice(world.days)
+    if roll > 0.9:
+        query['content'] = rng.choice(('танк', 'рейд', 'куплю меч', 'гильдия'))
+    return 'GET', reverse('post-list'), query
+
+
+def post_detail(rng, world):
+    return 'GET', reverse('post-detail', kwargs={'pk': rng.choice(world.post_ids)}), {}
+
+
+def response_moderation(rng, world):
+    return 'GET', reverse('response-moderation'), {}
+
+
+def post_api(rng, world):
+    query = {'page_size': rng.choice((10, 50, 100))}
+    if rng.random() < 0.5:
+        query['category'] = rng.choice(world.category_ids)
+    return 'GET', reverse('post-api'), query
+
+
+def subscribe(rng, world):
+    delivery = rng.choice([delivery for delivery, _ in Subscription.DELIVERY_CHOICES])
+    return 'POST', reverse('subscribe', kwargs={'pk': rng.choice(world.category_ids)}), {'delivery': delivery}
+
+
+# имя: (функция запроса, от чьего имени)
+SCENARIOS = {
+    'post-list': (post_list, 'anonymous'),
+    'post-detail': (post_detail, 'reader'),
+    'response-moderation': (response_moderation, 'author'),
+    'post-api': (post_api, 'anonymous'),
+    'subscribe': (subscribe, 'reader'),
+}
+
+
+# Запросы внутри процесса через django.test.Client
+class LocalTransport:
+    def __init__(self, user_id=None):
+        self.client = Client(raise_request_exception=False)
+        if user_id is not None:
+            self.client.force_login(User.objects.get(pk=user_id))
+
+    def request(self, method, path, data):
+        if method == 'GET':
+            response = self.client.get(path, data)
+        else:
+            response = self.client.post(path, data)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response.status_code
+
+
+# Редирект (после подписки) не выполняется: замеряется сам запрос, как и в LocalTransport
+class NoRedirect(HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+# Запросы по HTTP к запущенному серверу (--base-url): сессия создаётся через ту же базу,
+# что и у сервера, CSRF - токеном в cookie и заголовке. Статус 0 - ответа нет (таймаут, обрыв соединения)
+class HttpTransport:
+    def __init__(self, base_url, user_id=None, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.csrf_token = secrets.token_hex(16)
+        self.headers = {'X-CSRFToken': self.csrf_token, 'Referer': self.base_url + '/'}
+        cookies = {'csrftoken': self.csrf_token}
+        if user_id is not None:
+            client = Client()
+            client.force_login(User.objects.get(pk=user_id))
+            cookies.update({name: morsel.value for name, morsel in client.cookies.items()})
+        self.headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in cookies.items())
+        self.opener = build_opener(NoRedirect)
+
+    def request(self, method, path, data):
+        url = self.base_url + path
+        body = None
+        if method == 'GET' and data:
+            url = f'{url}?{urlencode(data)}'
+        elif data:
+            body = urlencode(data).encode()
+        try:
+            with self.opener.open(Request(url, data=body, headers=self.headers, method=method),
+                                  timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except HTTPError as exc:
+            return exc.code
+        except (URLError, OSError):
+            return 0
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+
+
+# requests запросов сценария в concurrency потоках, у каждого потока свой клиент и пользователь.
+# Первые warmup запросов каждого потока не учитываются (прогрев кэшей и соединений)
+def run_scenario(name, world, requests=200, concurrency=1, warmup=10, seed=1, base_url=None, timeout=30):
+    make_request, role = SCENARIOS[name]
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    per_thread = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    barrier = threading.Barrier(concurrency + 1)
+
+    def worker(number, count):
+        rng = random.Random(f'{seed}:{name}:{number}')
+        user_id = {'anonymous': None, 'author': world.author}.get(role, world.readers[number % len(world.readers)])
+        try:
+            transport = HttpTransport(base_url, user_id, timeout) if base_url else LocalTransport(user_id)
+            for _ in range(warmup):
+                transport.request(*make_request(rng, world))
+            own_latencies, own_statuses = [], {}
+        except BaseException:
+            # остальные потоки и замер не должны ждать упавший поток
+            barrier.abort()
+            connections.close_all()
+            raise
+        try:
+            barrier.wait()
+            for _ in range(count):
+                method, path, data = make_request(rng, world)
+                started = time.perf_counter()
+                status = transport.request(method, path, data)
+                own_latencies.append(time.perf_counter() - started)
+                own_statuses[status] = own_statuses.get(status, 0) + 1
+            with lock:
+                latencies.extend(own_latencies)
+                for status, total in own_statuses.items():
+                    statuses[status] = statuses.get(status, 0) + total
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker, args=(i, count)) for i, count in enumerate(per_thread)]
+    for thread in threads:
+        thread.start()
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        for thread in threads:
+            thread.join()
+        raise RuntimeError(f'Сценарий {name}: поток завершился с ошибкой при подготовке')
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    errors = sum(total for status, total in statuses.items() if status == 0 or status >= 400)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'statuses': {str(status): total for status, total in sorted(statuses.items())},
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+# Сравнение с сохранённым прогоном: изменение rps и p95 в процентах по общим сценариям
+def compare(current, baseline):
+    rows = []
+    for name, result in current['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        rows.append({
+            'scenario': name,
+            'rps': (result['rps'], before['rps'], _change(result['rps'], before['rps'])),
+            'p95_ms': (result['p95_ms'], before['p95_ms'], _change(result['p95_ms'], before['p95_ms'])),
+        })
+    return rows
+
+
+def _change(value, before):
+    return round((value - before) / before * 100, 1) if before else None
@@ -0,0 +1,134 @@
+import asyncio
+import importlib.util
+import os
+import socket
+import subprocess
+import sys
+import time
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit
+from urllib.request import urlopen
+
+from django.conf import settings
+
+# Серверы приложения для сравнения WSGI и ASGI на одной базе и одних данных.
+# Оба запускаются отдельными процессами с тем же числом воркеров; ASGI - с асинхронными
+# представлениями чтения (ASYNC_READ_VIEWS=1). Команды: имя модуля сервера и аргументы после адреса
+SERVERS = {
+    'wsgi': {
+        'module': 'gunicorn',
+        'args': lambda port, workers: ['MMORPG.wsgi:application', '--bind', f'127.0.0.1:{port}',
+                                       '--workers', str(workers), '--log-level', 'warning'],
+        'env': {},
+    },
+    'asgi': {
+        'module': 'uvicorn',
+        'args': lambda port, workers: ['MMORPG.asgi:application', '--host', '127.0.0.1', '--port', str(port),
+                                       '--workers', str(workers), '--log-level', 'warning', '--no-access-log'],
+        'env': {'ASYNC_READ_VIEWS': '1'},
+    },
+}
+
+
+def server_available(name):
+    return importlib.util.find_spec(SERVERS[name]['module']) is not None
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class ServerError(Exception):
+    pass
+
+
+# Запущенный сервер: base_url для HttpTransport, остановка - при выходе из with
+class Server:
+    def __init__(self, name, workers=2, log=None, ready_timeout=30):
+        self.name = name
+        self.port = free_port()
+        self.base_url = f'http://127.0.0.1:{self.port}'
+        config = SERVERS[name]
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'MMORPG.settings'),
+               **config['env']}
+        output = open(log, 'ab') if log else subprocess.DEVNULL
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', config['module'], *config['args'](self.port, workers)],
+            cwd=settings.BASE_DIR, env=env, stdout=output, stderr=output,
+        )
+        if log:
+            output.close()
+        try:
+            self.wait_ready(ready_timeout)
+        except BaseException:
+            self.stop()
+            raise
+
+    def wait_ready(self, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise ServerError(f'{self.name}: сервер завершился с кодом {self.process.returncode}')
+            try:
+                with urlopen(f'{self.base_url}/metrics', timeout=1):
+                    return
+            except HTTPError:
+                # любой ответ HTTP (например, 401 без токена метрик) - сервер уже принимает запросы
+                return
+            except (URLError, OSError):
+                time.sleep(0.2)
+        raise ServerError(f'{self.name}: сервер не ответил за {timeout} с')
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+# Медленные клиенты (мобильная сеть): каждый держит соединение, отправляя запрос по частям
+# в течение seconds, и повторяет это, пока не установлен stop. Синхронный воркер gunicorn занят
+# таким клиентом всё это время; асинхронный сервер ждёт его байты, не занимая приложение
+async def _slow_client(host, port, path, seconds, stop, totals):
+    request = f'GET {path} HTTP/1.1\r\nHost: {host}\r\nUser-Agent: slow-client\r\nConnection: close\r\n\r\n'.encode()
+    parts = 10
+    size = -(-len(request) // parts)
+    while not stop.is_set():
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), 30)
+            try:
+                for start in range(0, len(request), size):
+                    writer.write(request[start:start + size])
+                    await writer.drain()
+                    await asyncio.sleep(seconds / parts)
+                status_line = await asyncio.wait_for(reader.readline(), 60)
+                await asyncio.wait_for(reader.read(), 60)
+            finally:
+                writer.close()
+            status = int(status_line.split()[1]) if status_line else 0
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+            status = 0
+        key = 'completed' if 200 <= status < 400 else 'failed'
+        totals[key] += 1
+
+
+def run_slow_clients(base_url, path, count, seconds, stop, totals):
+    address = urlsplit(base_url)
+
+    async def main():
+        await asyncio.gather(*(
+            _slow_client(address.hostname, address.port, path, seconds, stop, totals) for _ in range(count)
+        ))
+
+    asyncio.run(main())
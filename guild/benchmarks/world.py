@@ -0,0 +1,130 @@
+import random
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from guild import counters
+from guild.caching import bump_board_generation
+from guild.models import Category, Post, Profile, Response, Subscription
+from guild.search import index_posts, remove_posts
+from guild.signals import muted
+
+USERNAME_PREFIX = 'bench_user_'
+CATEGORY_PREFIX = 'Bench '
+PASSWORD = 'bench-password'
+# Даты постов отсчитываются от фиксированного дня, а не от текущего времени: тот же seed - те же данные
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+WORDS = (
+    'танк', 'хил', 'дд', 'торговец', 'гилдмастер', 'квестодатель', 'кузнец', 'кожевник', 'зельевар',
+    'мастер', 'заклинаний', 'рейд', 'подземелье', 'ищу', 'группу', 'вечером', 'опыт', 'награда',
+    'босс', 'сет', 'броня', 'меч', 'лук', 'посох', 'гильдия', 'набор', 'обмен', 'продам', 'куплю',
+)
+
+
+# Синтетический мир для нагрузочных тестов: пользователи, категории, посты, отклики и подписки.
+# Всё создаётся bulk_create в транзакции с отключёнными сигналами отдельных строк, затем одним
+# проходом пересчитываются счётчики откликов и индекс поиска. Объекты мира отличаются префиксами
+# (bench_user_*, категории "Bench *"), поэтому clear_world удаляет только их
+
+# Словарь с распределением Ципфа, как в живом тексте: несколько частых слов встречаются почти
+# в каждом посте, длинный хвост - редко (иначе каждое слово совпадает со всеми постами, и поиск
+# на синтетических данных медленнее, чем на настоящих)
+def _vocabulary(size=5000):
+    rng = random.Random(0)
+    syllables = ['ка', 'ро', 'ми', 'ла', 'то', 'ве', 'ст', 'ор', 'ан', 'ри', 'ну', 'ск', 'да', 'бе', 'гу', 'зо']
+    words = list(WORDS)
+    seen = set(words)
+    while len(words) < size:
+        word = ''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    cumulative, total = [], 0.0
+    for rank in range(1, len(words) + 1):
+        total += 1 / rank
+        cumulative.append(total)
+    return words, cumulative
+
+
+VOCABULARY, CUMULATIVE_WEIGHTS = _vocabulary()
+
+
+def _text(rng, words):
+    return ' '.join(rng.choices(VOCABULARY, cum_weights=CUMULATIVE_WEIGHTS, k=words)).capitalize()
+
+
+def clear_world():
+    with transaction.atomic(), muted():
+        posts = Post.objects.filter(author__user__username__startswith=USERNAME_PREFIX)
+        remove_posts(list(posts.values_list('id', flat=True)))
+        posts.delete()
+        User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+        Category.objects.filter(name__startswith=CATEGORY_PREFIX).delete()
+    bump_board_generation()
+
+
+def seed_world(users=100, categories=10, posts=10000, responses=30000, subscriptions=300,
+               days=90, seed=1, batch_size=1000):
+    rng = random.Random(seed)
+    password = make_password(PASSWORD)
+
+    with transaction.atomic(), muted():
+        user_objects = User.objects.bulk_create(
+            [User(username=f'{USERNAME_PREFIX}{i}', email=f'{USERNAME_PREFIX}{i}@example.com', password=password)
+             for i in range(users)],
+            batch_size=batch_size,
+        )
+        profiles = Profile.objects.bulk_create(
+            [Profile(user=user, email_confirmed=True) for user in user_objects], batch_size=batch_size,
+        )
+        category_objects = Category.objects.bulk_create(
+            [Category(name=f'{CATEGORY_PREFIX}{i}') for i in range(categories)], batch_size=batch_size,
+        )
+
+        post_objects = [
+            Post(author=rng.choice(profiles), category=rng.choice(category_objects),
+                 title=_text(rng, rng.randint(3, 8)), content=_text(rng, rng.randint(20, 120)))
+            for _ in range(posts)
+        ]
+        # Даты по возрастанию вместе с id, как у постов, созданных через сайт
+        dates = sorted(EPOCH + timedelta(seconds=rng.randrange(days * 86400)) for _ in range(posts))
+        Post.objects.bulk_create(post_objects, batch_size=batch_size)
+        for post, created_at in zip(post_objects, dates):
+            post.created_at = post.updated_at = created_at
+        Post.objects.bulk_update(post_objects, ['created_at', 'updated_at'], batch_size=200)
+
+        response_objects, response_dates = [], []
+        for _ in range(responses if post_objects else 0):
+            post = rng.choice(post_objects)
+            response_objects.append(Response(post=post, author=rng.choice(profiles),
+                                             content=_text(rng, rng.randint(5, 30)), is_approved=rng.random() < 0.6))
+            response_dates.append(post.created_at + timedelta(minutes=rng.randrange(1, 7 * 24 * 60)))
+        Response.objects.bulk_create(response_objects, batch_size=batch_size)
+        for response, created_at in zip(response_objects, response_dates):
+            response.created_at = created_at
+        Response.objects.bulk_update(response_objects, ['created_at'], batch_size=200)
+
+        pairs = {(rng.randrange(users), rng.randrange(categories))
+                 for _ in range(subscriptions)} if users and categories else set()
+        deliveries = [delivery for delivery, _ in Subscription.DELIVERY_CHOICES]
+        Subscription.objects.bulk_create(
+            [Subscription(profile=profiles[user], category=category_objects[category], subscribed=True,
+                          delivery=rng.choice(deliveries))
+             for user, category in sorted(pairs)],
+            batch_size=batch_size,
+        )
+
+        counters.recount_all()
+        index_posts([post.pk for post in post_objects])
+    bump_board_generation()
+
+    return {
+        'users': len(profiles),
+        'categories': len(category_objects),
+        'posts': len(post_objects),
+        'responses': len(response_objects),
+        'subscriptions': len(pairs),
+    }
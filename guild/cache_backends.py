@@ -0,0 +1,311 @@
+import asyncio
+import inspect
+import math
+import pickle
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.functional import cached_property
+
+from guild.instrumentation import record_cache
+
+PREFIX_RE = re.compile(r'[:.]')
+
+
+# Значение, записанное через get_or_set: вместе с ним хранится срок жизни и время вычисления,
+# по которым решается, не пора ли обновить ключ заранее
+class _Entry:
+    __slots__ = ('value', 'expires_at', 'delta')
+
+    def __init__(self, value, expires_at, delta):
+        self.value = value
+        self.expires_at = expires_at
+        self.delta = delta
+
+    def __getstate__(self):
+        return self.value, self.expires_at, self.delta
+
+    def __setstate__(self, state):
+        self.value, self.expires_at, self.delta = state
+
+
+def _unwrap(value):
+    return value.value if isinstance(value, _Entry) else value
+
+
+# Ограниченный по размеру и времени жизни LRU-кэш внутри процесса.
+# Значения хранятся сериализованными, как в LocMemCache, чтобы вызывающий код не мог их изменить
+class _LocalLRU:
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return False, None
+            expires_at, pickled = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+        return True, pickle.loads(pickled)
+
+    def set(self, key, value, timeout):
+        ttl = self.timeout if timeout is None else min(timeout, self.timeout)
+        if ttl <= 0:
+            self.delete(key)
+            return
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, pickled)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# Двухуровневый кэш: LRU в памяти процесса перед общим кэшем (Redis/memcached в проде).
+#   OPTIONS:
+#     SHARED             - алиас общего кэша из settings.CACHES
+#     LOCAL_MAX_ENTRIES  - размер LRU в процессе
+#     LOCAL_TIMEOUT      - сколько секунд значение живёт в процессе (другие процессы
+#                          увидят изменение не позже, чем через это время)
+#     LOCAL_EXCLUDE      - регулярные выражения ключей, которые всегда читаются из общего кэша
+#                          (версии и счётчики поколений, по которым сбрасывается кэш)
+#     LOCK_TIMEOUT, LOCK_WAIT, EARLY_REFRESH_BETA - защита от "набега" в get_or_set
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options.get('SHARED', 'shared')
+        self._local = _LocalLRU(options.get('LOCAL_MAX_ENTRIES', 1000), options.get('LOCAL_TIMEOUT', 5))
+        self._local_exclude = [re.compile(pattern) for pattern in options.get('LOCAL_EXCLUDE', [])]
+        self._lock_timeout = options.get('LOCK_TIMEOUT', 10)
+        self._lock_wait = options.get('LOCK_WAIT', 2.0)
+        self._beta = options.get('EARLY_REFRESH_BETA', 1.0)
+        self._stats = defaultdict(lambda: {'local_hits': 0, 'shared_hits': 0, 'misses': 0})
+        self._stats_lock = threading.Lock()
+
+    @cached_property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    # Счётчики попаданий и промахов по префиксу ключа (часть до первого ':' или '.')
+    def _record(self, key, outcome):
+        record_cache(outcome != 'misses')
+        prefix = PREFIX_RE.split(key, 1)[0]
+        with self._stats_lock:
+            self._stats[prefix][outcome] += 1
+
+    def stats(self):
+        with self._stats_lock:
+            return {prefix: dict(counters) for prefix, counters in self._stats.items()}
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats.clear()
+
+    def _local_allowed(self, key):
+        return not any(pattern.search(key) for pattern in self._local_exclude)
+
+    def _local_timeout(self, timeout, value=None):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if isinstance(value, _Entry) and value.expires_at is not None:
+            remaining = value.expires_at - time.time()
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        return timeout
+
+    def _get_raw(self, key, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        use_local = self._local_allowed(key)
+        if use_local:
+            found, value = self._local.get(local_key)
+            if found:
+                self._record(key, 'local_hits')
+                return value
+        value = self.shared.get(key, version=version)
+        if value is None:
+            self._record(key, 'misses')
+            return None
+        self._record(key, 'shared_hits')
+        if use_local:
+            self._local.set(local_key, value, self._local_timeout(DEFAULT_TIMEOUT, value))
+        return value
+
+    def _set_raw(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        self.shared.set(key, value, timeout=timeout, version=version)
+        if self._local_allowed(key):
+            self._local.set(local_key, value, self._local_timeout(timeout, value))
+
+    def get(self, key, default=None, version=None):
+        value = self._get_raw(key, version=version)
+        return default if value is None else _unwrap(value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._set_raw(key, value, timeout=timeout, version=version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._local.delete(self.make_and_validate_key(key, version=version))
+        return self.shared.add(key, value, timeout=timeout, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._local.delete(self.make_and_validate_key(key, version=version))
+        return self.shared.touch(key, timeout=timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._local.delete(self.make_and_validate_key(key, version=version))
+        return self.shared.delete(key, version=version)
+
+    def has_key(self, key, version=None):
+        return self._get_raw(key, version=version) is not None
+
+    def incr(self, key, delta=1, version=None):
+        self._local.delete(self.make_and_validate_key(key, version=version))
+        return self.shared.incr(key, delta=delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        self._local.delete(self.make_and_validate_key(key, version=version))
+        return self.shared.decr(key, delta=delta, version=version)
+
+    def get_many(self, keys, version=None):
+        result = {}
+        missing = []
+        for key in keys:
+            found = False
+            if self._local_allowed(key):
+                found, value = self._local.get(self.make_and_validate_key(key, version=version))
+            if found:
+                self._record(key, 'local_hits')
+                result[key] = _unwrap(value)
+            else:
+                missing.append(key)
+        if missing:
+            fetched = self.shared.get_many(missing, version=version)
+            for key in missing:
+                if key in fetched:
+                    self._record(key, 'shared_hits')
+                    value = fetched[key]
+                    if self._local_allowed(key):
+                        self._local.set(self.make_and_validate_key(key, version=version), value,
+                                        self._local_timeout(DEFAULT_TIMEOUT, value))
+                    result[key] = _unwrap(value)
+                else:
+                    self._record(key, 'misses')
+        return result
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout=timeout, version=version)
+        for key, value in data.items():
+            if key not in failed and self._local_allowed(key):
+                self._local.set(self.make_and_validate_key(key, version=version), value,
+                                self._local_timeout(timeout))
+        return failed
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self._local.delete(self.make_and_validate_key(key, version=version))
+        self.shared.delete_many(keys, version=version)
+
+    def clear(self):
+        self._local.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+    def _compute(self, key, default, timeout, version):
+        started = time.monotonic()
+        value = default() if callable(default) else default
+        if value is not None:
+            self._store(key, value, time.monotonic() - started, timeout, version)
+        return value
+
+    def _store(self, key, value, delta, timeout, version):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        expires_at = None if timeout is None else time.time() + timeout
+        self._set_raw(key, _Entry(value, expires_at, delta), timeout=timeout, version=version)
+
+    # Вероятностное раннее обновление (XFetch): чем ближе истечение и чем дороже вычисление,
+    # тем вероятнее, что один из запросов пересчитает значение до того, как ключ пропадёт
+    def _should_refresh(self, entry):
+        if not isinstance(entry, _Entry) or entry.expires_at is None or not entry.delta:
+            return False
+        return time.time() - entry.delta * self._beta * math.log(1.0 - random.random()) >= entry.expires_at
+
+    # get_or_set с защитой от "набега": значение пересчитывает только тот процесс, который взял
+    # блокировку в общем кэше; остальные отдают предыдущее значение или ждут результата
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        entry = self._get_raw(key, version=version)
+        if entry is not None and not self._should_refresh(entry):
+            return _unwrap(entry)
+
+        lock_key = f'{key}:lock'
+        if self.shared.add(lock_key, 1, timeout=self._lock_timeout, version=version):
+            try:
+                return self._compute(key, default, timeout, version)
+            finally:
+                self.shared.delete(lock_key, version=version)
+
+        if entry is not None:
+            return _unwrap(entry)
+        deadline = time.monotonic() + self._lock_wait
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = self.shared.get(key, version=version)
+            if entry is not None:
+                return _unwrap(entry)
+        # Владелец блокировки не успел: считаем сами, чтобы не отдавать пустой ответ
+        return self._compute(key, default, timeout, version)
+
+    async def _acompute(self, key, default, timeout, version):
+        started = time.monotonic()
+        value = default() if callable(default) else default
+        if inspect.isawaitable(value):
+            value = await value
+        if value is not None:
+            await sync_to_async(self._store)(key, value, time.monotonic() - started, timeout, version)
+        return value
+
+    # То же для асинхронного кода: default может вернуть корутину (async ORM, рендер в потоке),
+    # ожидание чужого пересчёта не занимает поток
+    async def aget_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        entry = await sync_to_async(self._get_raw)(key, version=version)
+        if entry is not None and not self._should_refresh(entry):
+            return _unwrap(entry)
+
+        lock_key = f'{key}:lock'
+        if await self.shared.aadd(lock_key, 1, timeout=self._lock_timeout, version=version):
+            try:
+                return await self._acompute(key, default, timeout, version)
+            finally:
+                await self.shared.adelete(lock_key, version=version)
+
+        if entry is not None:
+            return _unwrap(entry)
+        deadline = time.monotonic() + self._lock_wait
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            entry = await self.shared.aget(key, version=version)
+            if entry is not None:
+                return _unwrap(entry)
+        return await self._acompute(key, default, timeout, version)
@@ -0,0 +1,146 @@
+import hashlib
+import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone, translation
+
+from guild.models import Post
+
+POST_CACHE_TIMEOUT = getattr(settings, 'POST_CACHE_TIMEOUT', 60 * 15)
+PAGE_CACHE_TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 60 * 5)
+BOARD_GENERATION_KEY = 'board:generation'
+
+
+# Кэш постов для PostDetailView.
+# Ключ снимка содержит версию поста: post:<pk>:<version>. Версия меняется при любом изменении
+# поста или его откликов, поэтому старый снимок просто перестаёт читаться и вытесняется по таймауту.
+# Это исключает гонку "удалили ключ - параллельный запрос записал устаревший объект обратно"
+
+def _version_key(pk):
+    return f'post:{pk}:version'
+
+
+def post_version(pk):
+    version = cache.get(_version_key(pk))
+    if version is None:
+        # add, а не set: если версию уже создал другой процесс, используем её
+        cache.add(_version_key(pk), uuid4().hex, None)
+        version = cache.get(_version_key(pk))
+    return version
+
+
+async def apost_version(pk):
+    version = await cache.aget(_version_key(pk))
+    if version is None:
+        await cache.aadd(_version_key(pk), uuid4().hex, None)
+        version = await cache.aget(_version_key(pk))
+    return version
+
+
+def bump_post_version(pk):
+    cache.set(_version_key(pk), uuid4().hex, None)
+
+
+# Снимок поста со всем, что нужно шаблону: автор и категория загружаются одним запросом
+# (число откликов - денормализованные поля поста), поэтому рендер из кэша не обращается к базе
+def post_snapshot_queryset():
+    return (
+        Post.objects
+        .select_related('author__user', 'category')
+        .only(
+            'id', 'title', 'content', 'image', 'image_variants', 'created_at', 'updated_at',
+            'response_count', 'approved_response_count', 'last_response_at',
+            'author', 'author__user', 'author__user__username',
+            'category', 'category__name',
+        )
+    )
+
+
+def _load_snapshot(pk):
+    # Снимок читается из основной базы: отстающая реплика записала бы в новую версию старые данные
+    return post_snapshot_queryset().using(DEFAULT_DB_ALIAS).filter(pk=pk).first()
+
+
+# Снимок заполняется через get_or_set кэша (guild.cache_backends.TieredCache): при промахе
+# горячего поста базу читает один процесс, остальные ждут его результата
+def get_post_snapshot(pk):
+    version = post_version(pk)
+    return cache.get_or_set(f'post:{pk}:{version}', lambda: _load_snapshot(pk), POST_CACHE_TIMEOUT)
+
+
+# То же для асинхронных представлений; снимок тот же, что у синхронной версии
+async def aget_post_snapshot(pk):
+    version = await apost_version(pk)
+    return await cache.aget_or_set(
+        f'post:{pk}:{version}',
+        post_snapshot_queryset().using(DEFAULT_DB_ALIAS).filter(pk=pk).afirst,
+        POST_CACHE_TIMEOUT,
+    )
+
+
+# Сброс снимка (удаление поста, изменение откликов)
+def invalidate_post(pk):
+    bump_post_version(pk)
+
+
+# Запись нового снимка сразу после сохранения поста (write-through)
+def refresh_post(pk):
+    # Сначала снимок, потом версия: читатели сразу попадают в готовый снимок
+    version = uuid4().hex
+    post = _load_snapshot(pk)
+    if post is not None:
+        cache.set(f'post:{pk}:{version}', post, POST_CACHE_TIMEOUT)
+    cache.set(_version_key(pk), version, None)
+
+
+# Поколение ленты объявлений: меняется при создании, изменении и удалении постов и откликов.
+# Входит в ключи кэша страниц ленты и в ETag API постов, поэтому смена поколения сбрасывает их все
+# разом. Значение - время смены и случайная часть: по времени видно, могли ли реплики отстать
+def _new_generation():
+    return f'{time.time():.3f}-{uuid4().hex}'
+
+
+def generation_time(generation):
+    try:
+        return float(str(generation).partition('-')[0])
+    except ValueError:
+        return 0.0
+
+
+def board_generation():
+    generation = cache.get(BOARD_GENERATION_KEY)
+    if generation is None:
+        cache.add(BOARD_GENERATION_KEY, _new_generation(), None)
+        generation = cache.get(BOARD_GENERATION_KEY)
+    return generation
+
+
+async def aboard_generation():
+    generation = await cache.aget(BOARD_GENERATION_KEY)
+    if generation is None:
+        await cache.aadd(BOARD_GENERATION_KEY, _new_generation(), None)
+        generation = await cache.aget(BOARD_GENERATION_KEY)
+    return generation
+
+
+def bump_board_generation():
+    cache.set(BOARD_GENERATION_KEY, _new_generation(), None)
+
+
+# Ключ кэша страницы для анонимного пользователя: имя маршрута, поколение данных, язык,
+# часовой пояс сессии и путь с отсортированной строкой запроса (фильтры, курсор)
+def page_cache_key(request, generation):
+    query = sorted((key, value) for key, values in request.GET.lists() for value in values)
+    raw = f'{request.path}?{query}'
+    digest = hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
+    return ':'.join([
+        'page',
+        request.resolver_match.url_name or '',
+        str(generation),
+        translation.get_language() or '',
+        timezone.get_current_timezone_name(),
+        digest,
+    ])
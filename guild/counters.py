@@ -0,0 +1,113 @@
+from collections import Counter, defaultdict
+
+from django.db.models import Count, F, IntegerField, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from guild.models import Post, Profile, Response
+
+
+# Денормализованные счётчики откликов:
+#   Post.response_count, Post.approved_response_count, Post.last_response_at,
+#   Profile.pending_moderation_count (неодобренные отклики на посты пользователя).
+# Все изменения - атомарные UPDATE с F-выражениями; число запросов зависит от числа различных
+# приращений, а не от числа строк
+
+def _add(model, field, deltas):
+    # Строки с одинаковым приращением - одним UPDATE: различных приращений обычно одно-два,
+    # а CASE на тысячи веток SQLite вычисляет для каждой строки заново
+    by_delta = defaultdict(list)
+    for pk, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(pk)
+    for delta, pks in by_delta.items():
+        model.objects.filter(pk__in=pks).update(**{field: F(field) + delta})
+
+
+def _authors(post_ids):
+    return dict(Post.objects.filter(pk__in=set(post_ids)).values_list('id', 'author_id'))
+
+
+def _pending_by_author(post_ids, authors):
+    pending = Counter()
+    for post_id in post_ids:
+        if post_id in authors:
+            pending[authors[post_id]] += 1
+    return pending
+
+
+# Время последнего отклика пересчитывается по оставшимся откликам: при удалении последнего - NULL
+def _update_last_response_at(post_ids):
+    latest = Response.objects.filter(post=OuterRef('pk')).order_by('-created_at').values('created_at')[:1]
+    Post.objects.filter(pk__in=set(post_ids)).update(last_response_at=Subquery(latest))
+
+
+# Новые отклики: список пар (post_id, is_approved)
+def responses_created(rows):
+    rows = list(rows)
+    if not rows:
+        return
+    _add(Post, 'response_count', Counter(post_id for post_id, _ in rows))
+    _add(Post, 'approved_response_count', Counter(post_id for post_id, approved in rows if approved))
+    _update_last_response_at(post_id for post_id, _ in rows)
+
+    pending_posts = [post_id for post_id, approved in rows if not approved]
+    if pending_posts:
+        _add(Profile, 'pending_moderation_count', _pending_by_author(pending_posts, _authors(pending_posts)))
+
+
+# Одобренные отклики: список post_id (по одному на отклик)
+def responses_approved(post_ids):
+    post_ids = list(post_ids)
+    if not post_ids:
+        return
+    _add(Post, 'approved_response_count', Counter(post_ids))
+    pending = _pending_by_author(post_ids, _authors(post_ids))
+    _add(Profile, 'pending_moderation_count', {pk: -count for pk, count in pending.items()})
+
+
+# Отклики, с которых сняли одобрение: список post_id
+def responses_unapproved(post_ids):
+    post_ids = list(post_ids)
+    if not post_ids:
+        return
+    _add(Post, 'approved_response_count', {pk: -count for pk, count in Counter(post_ids).items()})
+    _add(Profile, 'pending_moderation_count', _pending_by_author(post_ids, _authors(post_ids)))
+
+
+# Удалённые отклики: список кортежей (post_id, is_approved)
+def responses_deleted(rows):
+    rows = list(rows)
+    if not rows:
+        return
+    _add(Post, 'response_count', {pk: -count for pk, count in Counter(pk for pk, _ in rows).items()})
+    _add(Post, 'approved_response_count',
+         {pk: -count for pk, count in Counter(pk for pk, approved in rows if approved).items()})
+    _update_last_response_at(pk for pk, _ in rows)
+    pending_posts = [post_id for post_id, approved in rows if not approved]
+    if pending_posts:
+        pending = _pending_by_author(pending_posts, _authors(pending_posts))
+        _add(Profile, 'pending_moderation_count', {pk: -count for pk, count in pending.items()})
+
+
+def _count(queryset, group_by):
+    return Subquery(
+        queryset.order_by().values(group_by).annotate(total=Count('pk')).values('total'),
+        output_field=IntegerField(),
+    )
+
+
+# Пересчёт всех счётчиков с нуля (manage.py recount_responses): по одному UPDATE на таблицу
+def recount_all():
+    responses = Response.objects.filter(post=OuterRef('pk'))
+    posts = Post.objects.update(
+        response_count=Coalesce(_count(responses, 'post'), 0),
+        approved_response_count=Coalesce(_count(responses.filter(is_approved=True), 'post'), 0),
+        last_response_at=Subquery(
+            responses.order_by().values('post').annotate(last=Max('created_at')).values('last')
+        ),
+    )
+    pending = Response.objects.filter(post__author=OuterRef('pk'), is_approved=False)
+    profiles = Profile.objects.update(
+        pending_moderation_count=Coalesce(_count(pending, 'post__author'), 0),
+    )
+    return posts, profiles
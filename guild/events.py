@@ -0,0 +1,220 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS
+
+from guild.metrics import EVENTS_PUBLISHED
+from guild.models import Profile, Response
+
+try:
+    import redis
+except ImportError:  # redis не установлен - работает только MemoryBroker
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Redis для доставки событий между процессами (несколько воркеров uvicorn); без него события
+# доходят только до потоков SSE того же процесса - достаточно для одного воркера и разработки
+EVENTS_REDIS_URL = getattr(settings, 'EVENTS_REDIS_URL', None)
+# Комментарий в поток раз в столько секунд: прокси не закрывают соединение без данных
+EVENTS_KEEPALIVE = getattr(settings, 'EVENTS_KEEPALIVE', 15)
+# Поток закрывается через столько секунд, браузер переподключается сам (EventSource).
+# Django 4.2 не замечает отключения клиента, поэтому бесконечный поток висел бы до перезапуска
+EVENTS_STREAM_TIMEOUT = getattr(settings, 'EVENTS_STREAM_TIMEOUT', 300)
+# Через сколько миллисекунд браузер переподключается (в том числе под WSGI, где поток не держится)
+EVENTS_RETRY_MS = getattr(settings, 'EVENTS_RETRY_MS', 5000)
+# Непрочитанных событий на одно соединение; при переполнении старые отбрасываются
+EVENTS_QUEUE_SIZE = 100
+
+CHANNEL_PREFIX = 'events:user:'
+
+
+# События для пользователей (поток SSE /events/, guild/async_views.EventStreamView):
+#   response.created   - новый отклик на пост автора (автору поста)
+#   response.approved  - отклик одобрен (автору отклика)
+#   moderation.pending - изменилось число откликов, ожидающих модерации (автору постов)
+# Канал - пользователь; публикация синхронная (из transaction.on_commit), подписка - асинхронная
+
+def user_channel(user_id):
+    return f'{CHANNEL_PREFIX}{user_id}'
+
+
+# Подписка одного соединения (async with broker.subscribe(channel)): очередь asyncio в цикле событий
+# подписчика. Контекстный менеджер - класс, а не генератор: поток SSE, брошенный сервером,
+# закрывается сборщиком мусора, и подписка снимается без await
+class Subscription:
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.loop = None
+        self.queue = None
+
+    async def __aenter__(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(EVENTS_QUEUE_SIZE)
+        self.broker.add(self)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.broker.remove(self)
+
+    # Вызывается из любого потока: очередь меняется только в своём цикле событий
+    def deliver(self, message):
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # цикл событий уже закрыт, подписка сейчас удалится
+            pass
+
+    def _put(self, message):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+# Подписчики процесса по каналам
+class MemoryBroker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = {}
+
+    def publish(self, channel, message):
+        self.deliver(channel, message)
+
+    def deliver(self, channel, message):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.deliver(message)
+
+    def subscribe(self, channel):
+        return Subscription(self, channel)
+
+    def add(self, subscription):
+        with self.lock:
+            self.subscriptions.setdefault(subscription.channel, set()).add(subscription)
+
+    def remove(self, subscription):
+        with self.lock:
+            channel_subscriptions = self.subscriptions.get(subscription.channel, set())
+            channel_subscriptions.discard(subscription)
+            if not channel_subscriptions:
+                self.subscriptions.pop(subscription.channel, None)
+
+
+# Публикация - PUBLISH в Redis. Каждый процесс держит одно соединение (поток-слушатель с PSUBSCRIBE
+# на все каналы событий) и раздаёт сообщения своим подписчикам, а не по соединению на клиента SSE
+class RedisBroker(MemoryBroker):
+    def __init__(self, url):
+        if redis is None:
+            raise ImproperlyConfigured('EVENTS_REDIS_URL задан, но пакет redis не установлен')
+        super().__init__()
+        self.client = redis.Redis.from_url(url)
+        self.listener = None
+
+    def publish(self, channel, message):
+        try:
+            self.client.publish(channel, message)
+        except redis.RedisError:
+            logger.warning('Событие для %s не отправлено: Redis недоступен', channel, exc_info=True)
+
+    def add(self, subscription):
+        with self.lock:
+            if self.listener is None or not self.listener.is_alive():
+                self.listener = threading.Thread(target=self.listen, name='guild-events', daemon=True)
+                self.listener.start()
+        super().add(subscription)
+
+    # После обрыва соединение pubsub закрывается, иначе каждый повтор оставлял бы открытый сокет
+    def listen(self):
+        while True:
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.psubscribe(f'{CHANNEL_PREFIX}*')
+                for message in pubsub.listen():
+                    if message['type'] == 'pmessage':
+                        self.deliver(message['channel'].decode(), message['data'].decode())
+            except redis.RedisError:
+                logger.warning('Соединение с Redis для событий потеряно, повтор через 1 с', exc_info=True)
+                time.sleep(1)
+            finally:
+                pubsub.close()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = RedisBroker(EVENTS_REDIS_URL) if EVENTS_REDIS_URL else MemoryBroker()
+        return _broker
+
+
+def publish(user_id, event, data):
+    EVENTS_PUBLISHED.inc(event=event)
+    get_broker().publish(user_channel(user_id), json.dumps({'event': event, 'data': data}, ensure_ascii=False))
+
+
+# Кадр SSE: имя события и данные одной строкой JSON
+def format_frame(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+
+def format_event(message):
+    payload = json.loads(message)
+    return format_frame(payload['event'], payload['data'])
+
+
+# Публикация после коммита (transaction.on_commit): данные для событий читаются одним запросом
+# из основной базы, уже с новыми значениями счётчиков
+
+def _publish_pending(pending):
+    for user_id, count in pending.items():
+        publish(user_id, 'moderation.pending', {'pending': count})
+
+
+def publish_responses_created(response_ids):
+    rows = (
+        Response.objects.using(DEFAULT_DB_ALIAS).filter(pk__in=response_ids)
+        .values_list('id', 'post_id', 'post__title', 'author__user__username',
+                     'post__author__user_id', 'post__author__pending_moderation_count')
+    )
+    pending = {}
+    for response_id, post_id, title, author, post_author_id, count in rows:
+        publish(post_author_id, 'response.created',
+                {'id': response_id, 'post_id': post_id, 'post_title': title, 'author': author})
+        pending[post_author_id] = count
+    _publish_pending(pending)
+
+
+def publish_responses_approved(response_ids):
+    rows = (
+        Response.objects.using(DEFAULT_DB_ALIAS).filter(pk__in=response_ids)
+        .values_list('id', 'post_id', 'post__title', 'author__user_id',
+                     'post__author__user_id', 'post__author__pending_moderation_count')
+    )
+    pending = {}
+    for response_id, post_id, title, author_id, post_author_id, count in rows:
+        publish(author_id, 'response.approved', {'id': response_id, 'post_id': post_id, 'post_title': title})
+        pending[post_author_id] = count
+    _publish_pending(pending)
+
+
+# После удаления или снятия одобрения: новое число ожидающих у авторов постов
+def publish_moderation(post_ids):
+    rows = (
+        Profile.objects.using(DEFAULT_DB_ALIAS).filter(post__id__in=set(post_ids))
+        .values_list('user_id', 'pending_moderation_count').distinct()
+    )
+    _publish_pending(dict(rows))
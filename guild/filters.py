@@ -1,8 +1,12 @@
+from datetime import datetime, time, timedelta
+
 from django.forms import DateInput
+from django.utils import timezone
 from django_filters import CharFilter, DateFilter, ModelChoiceFilter
 from django_filters.rest_framework import FilterSet
 
 from guild.models import Post, Category
+from guild.search import filter_queryset
 
 
 class ResponseFilter(FilterSet):
@@ -12,12 +16,24 @@ class ResponseFilter(FilterSet):
 class PostFilter(FilterSet):
     created_at = DateFilter(
         field_name="created_at",
-        lookup_expr='icontains',
+        method='filter_created_at',
         widget=DateInput(format='%Y-%m-%d',
                          attrs={'type': 'date'}, ))
     category = ModelChoiceFilter(field_name="category", queryset=Category.objects.all(), label='Категория')
-    content = CharFilter(field_name="content", lookup_expr='icontains')
+    content = CharFilter(field_name="content", method='filter_content')
 
     class Meta:
         model = Post
         fields = ['category', 'created_at', 'content']
+
+    # Посты за календарный день в часовом поясе пользователя: диапазон [начало дня, начало следующего),
+    # а не icontains по строке даты, чтобы работал индекс (category, created_at, id)
+    def filter_created_at(self, queryset, name, value):
+        tz = timezone.get_current_timezone()
+        start = datetime.combine(value, time.min, tzinfo=tz)
+        end = datetime.combine(value + timedelta(days=1), time.min, tzinfo=tz)
+        return queryset.filter(created_at__gte=start, created_at__lt=end)
+
+    # Поиск по полнотекстовому индексу (заголовок и текст), а не content__icontains
+    def filter_content(self, queryset, name, value):
+        return filter_queryset(queryset, value)
@@ -2,9 +2,10 @@ from django import forms
 from django.contrib.auth import password_validation
 from django.contrib.auth.forms import UserCreationForm, SetPasswordForm, PasswordResetForm
 from django.contrib.auth.models import User, Group
-from django.core.mail import mail_admins, EmailMultiAlternatives
 
+from .mail import queue_mail, queue_mail_admins
 from .models import Post, Response, Profile, Category
+from .uploads import validate_image_upload
 
 
 # Форма регистрации
@@ -23,12 +24,8 @@ class UserRegisterForm(UserCreationForm):
             f'<b>{user.username}</b>, вы успешно зарегистрировались на '
             f'<a href="http://127.0.0.1:8000/post/">сайте</a>!'
         )
-        msg = EmailMultiAlternatives(
-            subject=subject, body=text, from_email=None, to=[user.email]
-        )
-        msg.attach_alternative(html, "text/html")
-        msg.send()
-        mail_admins(
+        queue_mail(subject, text, None, [user.email], html_message=html)
+        queue_mail_admins(
             subject='Новый пользователь!',
             message=f'Пользователь {user.username} зарегистрировался на сайте.'
         )
@@ -48,7 +45,7 @@ class ConfirmationCodeForm(forms.Form):
 
 # Форма объявления
 class PostForm(forms.ModelForm):
-    image = forms.ImageField()
+    image = forms.ImageField(validators=[validate_image_upload])
 
     class Meta:
         model = Post
@@ -70,7 +67,7 @@ class ResponseModerationForm(forms.ModelForm):
 
 # Форма профиля
 class ProfileForm(forms.ModelForm):
-    avatar = forms.ImageField()
+    avatar = forms.ImageField(validators=[validate_image_upload])
     first_name = forms.CharField(max_length=30, required=True)
     last_name = forms.CharField(max_length=30, required=True)
 
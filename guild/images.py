@@ -0,0 +1,154 @@
+import os
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from guild.caching import bump_board_generation, invalidate_post
+from guild.models import ImageJob, Post, Profile
+
+# Ширины уменьшенных копий в пикселях; копии шире оригинала не создаются
+IMAGE_WIDTHS = getattr(settings, 'IMAGE_WIDTHS', (150, 300, 600, 1200))
+IMAGE_QUALITY = getattr(settings, 'IMAGE_QUALITY', 80)
+IMAGE_BATCH_SIZE = getattr(settings, 'IMAGE_BATCH_SIZE', 20)
+IMAGE_MAX_ATTEMPTS = getattr(settings, 'IMAGE_MAX_ATTEMPTS', 3)
+IMAGE_RETRY_BACKOFF = getattr(settings, 'IMAGE_RETRY_BACKOFF', 60)  # секунды, удваиваются с каждой попыткой
+
+# target задания -> (модель, поле с файлом, поле с описанием копий)
+IMAGE_FIELDS = {
+    'post.image': (Post, 'image', 'image_variants'),
+    'profile.avatar': (Profile, 'avatar', 'avatar_variants'),
+}
+
+
+# Описание копий хранится в JSONField рядом с полем изображения:
+#   {"source": "images/a.jpg", "width": 2000, "height": 1500,
+#    "variants": [{"width": 150, "height": 113, "src": "images/a.150w.jpg", "webp": "images/a.150w.webp"}, ...]}
+# source - имя оригинала, по которому сделаны копии: после замены файла старые копии не используются
+
+def variants_ready(file, variants):
+    return bool(file and variants and variants.get('source') == file.name and variants.get('variants'))
+
+
+# Поставить в очередь изображения экземпляра, для которых ещё нет копий
+def enqueue_images(instance):
+    for target, (model, field, variants_field) in IMAGE_FIELDS.items():
+        if not isinstance(instance, model):
+            continue
+        file = getattr(instance, field)
+        if not file or getattr(instance, variants_field).get('source') == file.name:
+            continue
+        pending = ImageJob.objects.filter(target=target, object_id=instance.pk, source=file.name,
+                                          status=ImageJob.STATUS_PENDING)
+        if not pending.exists():
+            ImageJob.objects.create(target=target, object_id=instance.pk, source=file.name)
+
+
+def _encode(image, fmt):
+    buffer = BytesIO()
+    if fmt == 'WEBP':
+        image.save(buffer, 'WEBP', quality=IMAGE_QUALITY, method=4)
+    elif fmt == 'PNG':
+        image.save(buffer, 'PNG', optimize=True)
+    else:
+        image.convert('RGB').save(buffer, 'JPEG', quality=IMAGE_QUALITY, optimize=True, progressive=True)
+    return ContentFile(buffer.getvalue())
+
+
+# Уменьшенные копии оригинала в исходном формате (JPEG, либо PNG для картинок с прозрачностью) и WebP.
+# Имя копии строится от имени оригинала (images/a.jpg -> images/a.300w.jpg, images/a.300w.webp),
+# итоговое имя выбирает хранилище поля: ContentAddressedStorage кладёт файл под его sha256
+def generate_variants(storage, name):
+    with storage.open(name, 'rb') as file:
+        original = Image.open(file)
+        original = ImageOps.exif_transpose(original)
+        original.load()
+    has_alpha = original.mode in ('RGBA', 'LA') or 'transparency' in original.info
+    original = original.convert('RGBA' if has_alpha else 'RGB')
+    fallback, extension = ('PNG', 'png') if has_alpha else ('JPEG', 'jpg')
+    root = os.path.splitext(name)[0]
+
+    variants = []
+    for width in sorted({min(width, original.width) for width in IMAGE_WIDTHS}):
+        height = max(1, round(original.height * width / original.width))
+        resized = original.resize((width, height), Image.LANCZOS) if width != original.width else original
+        variants.append({
+            'width': width,
+            'height': height,
+            'src': storage.save(f'{root}.{width}w.{extension}', _encode(resized, fallback)),
+            'webp': storage.save(f'{root}.{width}w.webp', _encode(resized, 'WEBP')),
+        })
+    return {'source': name, 'width': original.width, 'height': original.height, 'variants': variants}
+
+
+def variant_files(variants):
+    return [name for variant in (variants or {}).get('variants', [])
+            for name in (variant.get('src'), variant.get('webp')) if name]
+
+
+# Каждое сохранение копии - отдельная ссылка на файл (у ContentAddressedStorage - +1 к refcount),
+# поэтому старые копии освобождаются все, даже если новая копия получила то же имя
+def _delete_variants(storage, variants):
+    for name in variant_files(variants):
+        storage.delete(name)
+
+
+def process_job(job):
+    model, field, variants_field = IMAGE_FIELDS[job.target]
+    current = model.objects.filter(pk=job.object_id).values(field, variants_field).first()
+    if current is None or current[field] != job.source:
+        # Объект удалён или файл уже заменён - для нового файла есть своё задание
+        return
+    storage = model._meta.get_field(field).storage
+    variants = generate_variants(storage, job.source)
+    # update, а не save(): без сигналов и без гонки с новой загрузкой (условие по имени файла)
+    updated = model.objects.filter(pk=job.object_id, **{field: job.source}).update(**{variants_field: variants})
+    if updated:
+        _delete_variants(storage, current[variants_field])
+        if model is Post:
+            transaction.on_commit(lambda: invalidate_post(job.object_id))
+            transaction.on_commit(bump_board_generation)
+
+
+def _claim_batch(batch_size):
+    with transaction.atomic():
+        jobs = list(
+            ImageJob.objects.select_for_update(skip_locked=True)
+            .filter(status=ImageJob.STATUS_PENDING, next_attempt_at__lte=timezone.now())
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if jobs:
+            ImageJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                next_attempt_at=timezone.now() + timedelta(seconds=IMAGE_RETRY_BACKOFF)
+            )
+    return jobs
+
+
+# Обработка одной пачки заданий. Возвращает (обработано, отложено, с ошибкой)
+def process_image_batch(batch_size=IMAGE_BATCH_SIZE):
+    jobs = _claim_batch(batch_size)
+    done = retried = failed = 0
+    for job in jobs:
+        job.attempts += 1
+        try:
+            process_job(job)
+        except Exception as exc:
+            job.last_error = f'{type(exc).__name__}: {exc}'
+            if job.attempts >= IMAGE_MAX_ATTEMPTS:
+                job.status = ImageJob.STATUS_FAILED
+                failed += 1
+            else:
+                job.next_attempt_at = timezone.now() + timedelta(seconds=IMAGE_RETRY_BACKOFF * 2 ** (job.attempts - 1))
+                retried += 1
+        else:
+            job.status = ImageJob.STATUS_DONE
+            job.processed_at = timezone.now()
+            job.last_error = ''
+            done += 1
+    if jobs:
+        ImageJob.objects.bulk_update(jobs, ['status', 'attempts', 'last_error', 'next_attempt_at', 'processed_at'])
+    return done, retried, failed
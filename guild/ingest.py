@@ -0,0 +1,227 @@
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from guild import counters
+from guild.caching import bump_board_generation, invalidate_post
+from guild.models import Category, Post, Profile, Response
+from guild.search import index_posts
+from guild.signals import muted
+
+INGEST_BATCH_SIZE = getattr(settings, 'INGEST_BATCH_SIZE', 1000)
+UPDATE_BATCH_SIZE = 200
+TITLE_MAX_LENGTH = Post._meta.get_field('title').max_length
+
+
+# Массовая загрузка постов и откликов (manage.py import_content, POST /api/import/).
+# Записи - словари, по одному на строку JSONL:
+#   {"type": "post", "ref": "old-17", "author": "username", "category": "Танки" | 3,
+#    "title": "...", "content": "...", "created_at": "2023-05-01T10:00:00+03:00"}
+#   {"type": "response", "post_ref": "old-17" | "post": 42, "author": "username",
+#    "content": "...", "is_approved": true, "created_at": "..."}
+# ref - идентификатор поста в старой системе: по нему отклики находят пост, созданный в этом же импорте,
+# поэтому посты должны идти в файле раньше своих откликов.
+# Записи обрабатываются пачками: проверка пачки - по одному запросу на авторов, категории и посты,
+# запись - bulk_create в транзакции. Сигналы отдельных строк (рассылка подписчикам, кэш, счётчики)
+# отключены; индекс поиска, счётчики откликов и кэш обновляются один раз на пачку.
+# Ошибочные записи пропускаются и попадают в errors вместе с номером строки
+
+class IngestError(ValueError):
+    pass
+
+
+def _text(record, key, max_length=None):
+    value = record.get(key)
+    if not isinstance(value, str) or not value.strip():
+        raise IngestError(f'поле {key} обязательно')
+    if max_length and len(value) > max_length:
+        raise IngestError(f'поле {key} длиннее {max_length} символов')
+    return value
+
+
+def _datetime(record):
+    value = record.get('created_at')
+    if value is None:
+        return None
+    parsed = parse_datetime(value) if isinstance(value, str) else None
+    if parsed is None:
+        raise IngestError('created_at не в формате ISO 8601')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+# Ключ для поиска по словарям: строка или число; прочие значения из JSON (списки, объекты) - None
+def _key(value):
+    return value if isinstance(value, (str, int)) and not isinstance(value, bool) else None
+
+
+class Importer:
+    def __init__(self, batch_size=INGEST_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.refs = {}
+        self.posts = 0
+        self.responses = 0
+        self.errors = []
+        self.started = time.monotonic()
+
+    @property
+    def rows(self):
+        return self.posts + self.responses
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.rows / elapsed if elapsed else 0.0
+
+    # records - итерируемое (номер строки, запись); читается потоком, в памяти одна пачка.
+    # on_chunk(importer) вызывается после каждой пачки (прогресс в management-команде)
+    def feed(self, records, on_chunk=None):
+        chunk = []
+        for line, record in records:
+            chunk.append((line, record))
+            if len(chunk) >= self.batch_size:
+                self.load(chunk)
+                chunk = []
+                if on_chunk:
+                    on_chunk(self)
+        if chunk:
+            self.load(chunk)
+            if on_chunk:
+                on_chunk(self)
+
+    def error(self, line, message):
+        self.errors.append({'line': line, 'error': str(message)})
+
+    def load(self, chunk):
+        posts, responses = [], []
+        for line, record in chunk:
+            kind = record.get('type') if isinstance(record, dict) else None
+            if kind == 'post':
+                posts.append((line, record))
+            elif kind == 'response':
+                responses.append((line, record))
+            else:
+                self.error(line, 'type должен быть post или response')
+
+        authors = self._authors(record.get('author') for _, record in posts + responses)
+        with transaction.atomic(), muted():
+            post_ids = self._load_posts(posts, authors)
+            # Снимков постов, созданных в этой же пачке, в кэше ещё нет
+            touched = self._load_responses(responses, authors) - set(post_ids)
+
+        def invalidate():
+            for post_id in touched:
+                invalidate_post(post_id)
+            bump_board_generation()
+
+        if post_ids or touched:
+            transaction.on_commit(invalidate)
+
+    def _authors(self, usernames):
+        usernames = {name for name in usernames if isinstance(name, str)}
+        return dict(Profile.objects.filter(user__username__in=usernames).values_list('user__username', 'id'))
+
+    def _categories(self, records):
+        values = {_key(record.get('category')) for _, record in records}
+        ids = {value for value in values if isinstance(value, int)}
+        names = {value for value in values if isinstance(value, str)}
+        found = {pk: pk for pk in Category.objects.filter(pk__in=ids).values_list('id', flat=True)}
+        found.update({name: pk for pk, name in Category.objects.filter(name__in=names).values_list('id', 'name')})
+        return found
+
+    def _load_posts(self, records, authors):
+        if not records:
+            return []
+        categories = self._categories(records)
+        objects, refs, dates = [], [], []
+        for line, record in records:
+            try:
+                author_id = authors.get(_key(record.get('author')))
+                if author_id is None:
+                    raise IngestError(f'нет пользователя {record.get("author")!r}')
+                category_id = categories.get(_key(record.get('category')))
+                if category_id is None:
+                    raise IngestError(f'нет категории {record.get("category")!r}')
+                post = Post(author_id=author_id, category_id=category_id,
+                            title=_text(record, 'title', TITLE_MAX_LENGTH), content=_text(record, 'content'))
+                created_at = _datetime(record)
+            except IngestError as exc:
+                self.error(line, exc)
+                continue
+            objects.append(post)
+            refs.append(record.get('ref'))
+            dates.append(created_at)
+
+        Post.objects.bulk_create(objects, batch_size=self.batch_size)
+        # auto_now_add перезаписывает created_at при вставке, поэтому исходные даты - отдельным UPDATE.
+        # bulk_update строит CASE на каждую строку пачки, поэтому пачки UPDATE небольшие
+        dated = []
+        for post, created_at in zip(objects, dates):
+            if created_at is not None:
+                post.created_at = created_at
+                dated.append(post)
+        if dated:
+            Post.objects.bulk_update(dated, ['created_at'], batch_size=UPDATE_BATCH_SIZE)
+        for post, ref in zip(objects, refs):
+            if _key(ref) is not None:
+                self.refs[ref] = post.pk
+
+        ids = [post.pk for post in objects]
+        index_posts(ids)
+        self.posts += len(objects)
+        return ids
+
+    def _load_responses(self, records, authors):
+        if not records:
+            return set()
+        direct = {_key(record.get('post')) for _, record in records} - {None}
+        existing = set(Post.objects.filter(pk__in=direct).values_list('id', flat=True))
+        objects, dates = [], []
+        for line, record in records:
+            try:
+                if 'post_ref' in record:
+                    post_id = self.refs.get(_key(record['post_ref']))
+                else:
+                    post_id = _key(record.get('post'))
+                    post_id = post_id if post_id in existing else None
+                if post_id is None:
+                    raise IngestError('пост не найден (post или post_ref)')
+                author_id = authors.get(_key(record.get('author')))
+                if author_id is None:
+                    raise IngestError(f'нет пользователя {record.get("author")!r}')
+                is_approved = record.get('is_approved', False)
+                if not isinstance(is_approved, bool):
+                    raise IngestError('is_approved должен быть true или false')
+                response = Response(post_id=post_id, author_id=author_id,
+                                    content=_text(record, 'content'), is_approved=is_approved)
+                created_at = _datetime(record)
+            except IngestError as exc:
+                self.error(line, exc)
+                continue
+            objects.append(response)
+            dates.append(created_at)
+
+        Response.objects.bulk_create(objects, batch_size=self.batch_size)
+        dated = []
+        for response, created_at in zip(objects, dates):
+            if created_at is not None:
+                response.created_at = created_at
+                dated.append(response)
+        if dated:
+            Response.objects.bulk_update(dated, ['created_at'], batch_size=UPDATE_BATCH_SIZE)
+
+        counters.responses_created((response.post_id, response.is_approved) for response in objects)
+        self.responses += len(objects)
+        return {response.post_id for response in objects}
+
+    def report(self):
+        return {
+            'posts': self.posts,
+            'responses': self.responses,
+            'errors': self.errors,
+            'rows_per_second': round(self.rate, 1),
+        }
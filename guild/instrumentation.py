@@ -0,0 +1,68 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from guild.metrics import CACHE_REQUESTS
+
+# Статистика текущего запроса; заполняется PerformanceMiddleware, кэшем и обёрткой SQL-запросов
+current_stats = ContextVar('guild_request_stats', default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.template_time = 0.0
+
+    # Обёртка для connection.execute_wrapper: считает запросы и время их выполнения
+    def sql_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_count += 1
+            self.sql_time += time.perf_counter() - started
+
+
+# Обёртка SQL-запросов ставится на каждое соединение один раз и пишет в статистику текущего запроса.
+# Контекст переходит в поток sync_to_async, поэтому запросы async ORM тоже учитываются
+# (соединения у потоков свои, execute_wrapper в middleware их не видел бы)
+def record_sql(execute, sql, params, many, context):
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats.sql_wrapper(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_sql_wrapper(sender, connection, **kwargs):
+    if record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_sql)
+
+
+def record_cache(hit):
+    CACHE_REQUESTS.inc(result='hit' if hit else 'miss')
+    stats = current_stats.get()
+    if stats is not None:
+        if hit:
+            stats.cache_hits += 1
+        else:
+            stats.cache_misses += 1
+
+
+# Рендер шаблона до возврата ответа из представления (заполнение кэша страниц):
+# PerformanceMiddleware видит уже готовый ответ, поэтому время рендера учитывается здесь
+@contextmanager
+def record_template():
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = current_stats.get()
+        if stats is not None:
+            stats.template_time += time.perf_counter() - started
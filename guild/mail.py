@@ -0,0 +1,147 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from guild.metrics import EMAILS_PROCESSED, EMAILS_QUEUED
+from guild.models import OutboxEmail
+
+OUTBOX_BATCH_SIZE = getattr(settings, 'OUTBOX_BATCH_SIZE', 100)
+OUTBOX_MAX_ATTEMPTS = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5)
+OUTBOX_RETRY_BACKOFF = getattr(settings, 'OUTBOX_RETRY_BACKOFF', 60)  # секунды, удваиваются с каждой попыткой
+
+
+# Постановка письма в очередь вместо send_mail.
+# Запись идёт в текущей транзакции, поэтому письмо уйдёт только если изменение данных закоммичено.
+# Счётчик EMAILS_QUEUED растёт тоже после коммита: откаченные письма не учитываются
+def queue_mail(subject, message, from_email, recipient_list, html_message=None):
+    transaction.on_commit(EMAILS_QUEUED.inc)
+    return OutboxEmail.objects.create(
+        subject=subject,
+        body=message,
+        html_body=html_message or '',
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL or '',
+        to=list(recipient_list),
+    )
+
+
+# Аналог send_mass_mail: datatuple из (subject, message, from_email, recipient_list),
+# записывается в очередь пачками через bulk_create
+def queue_mass_mail(datatuple, batch_size=OUTBOX_BATCH_SIZE):
+    default_from = settings.DEFAULT_FROM_EMAIL or ''
+    batch = []
+    queued = 0
+    for subject, message, from_email, recipient_list in datatuple:
+        batch.append(OutboxEmail(
+            subject=subject,
+            body=message,
+            from_email=from_email or default_from,
+            to=list(recipient_list),
+        ))
+        if len(batch) >= batch_size:
+            OutboxEmail.objects.bulk_create(batch)
+            queued += len(batch)
+            batch = []
+    if batch:
+        OutboxEmail.objects.bulk_create(batch)
+        queued += len(batch)
+    if queued:
+        transaction.on_commit(lambda: EMAILS_QUEUED.inc(queued))
+    return queued
+
+
+# Аналог mail_admins: одно письмо всем адресам из settings.ADMINS
+def queue_mail_admins(subject, message, html_message=None):
+    if not settings.ADMINS:
+        return None
+    return queue_mail(
+        f'{settings.EMAIL_SUBJECT_PREFIX}{subject}',
+        message,
+        settings.SERVER_EMAIL,
+        [address for _, address in settings.ADMINS],
+        html_message=html_message,
+    )
+
+
+def _build_message(email, connection):
+    msg = EmailMultiAlternatives(
+        subject=email.subject,
+        body=email.body,
+        from_email=email.from_email or None,
+        to=email.to,
+        connection=connection,
+    )
+    if email.html_body:
+        msg.attach_alternative(email.html_body, 'text/html')
+    return msg
+
+
+def _claim_batch(batch_size):
+    # select_for_update(skip_locked) позволяет запускать несколько воркеров на PostgreSQL;
+    # на SQLite блокировка строк не поддерживается и запрос выполняется как обычный SELECT
+    with transaction.atomic():
+        emails = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxEmail.STATUS_PENDING, next_attempt_at__lte=timezone.now())
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if emails:
+            # Отодвигаем следующую попытку, чтобы параллельный воркер не взял те же письма
+            OutboxEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+                next_attempt_at=timezone.now() + timedelta(seconds=OUTBOX_RETRY_BACKOFF)
+            )
+    return emails
+
+
+# Отправка одной пачки писем через одно SMTP-соединение.
+# Возвращает (отправлено, отложено, в мёртвых письмах). Если SMTP-соединение не открылось, пачка
+# прерывается: неудачной попыткой считается только текущее письмо, остальные остаются в очереди
+# со сроком, назначенным в _claim_batch, и не ждут каждое свой таймаут
+def send_outbox_batch(batch_size=OUTBOX_BATCH_SIZE, connection=None):
+    emails = _claim_batch(batch_size)
+    if not emails:
+        return 0, 0, 0
+
+    sent = retried = dead = 0
+    connection = connection or get_connection()
+    opened = False
+    processed = []
+    try:
+        for email in emails:
+            email.attempts += 1
+            processed.append(email)
+            try:
+                # Соединение открывается внутри обработки письма: недоступный SMTP - неудачная попытка
+                if not opened:
+                    connection.open()
+                    opened = True
+                _build_message(email, connection).send()
+            except Exception as exc:
+                email.last_error = f'{type(exc).__name__}: {exc}'
+                if email.attempts >= OUTBOX_MAX_ATTEMPTS:
+                    email.status = OutboxEmail.STATUS_DEAD
+                    dead += 1
+                else:
+                    delay = OUTBOX_RETRY_BACKOFF * 2 ** (email.attempts - 1)
+                    email.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+                    retried += 1
+                if not opened:
+                    break
+                # После ошибки SMTP-соединение может быть разорвано - следующее письмо откроет его заново
+                connection.close()
+                opened = False
+            else:
+                email.status = OutboxEmail.STATUS_SENT
+                email.sent_at = timezone.now()
+                email.last_error = ''
+                sent += 1
+    finally:
+        connection.close()
+        OutboxEmail.objects.bulk_update(
+            processed, ['status', 'attempts', 'last_error', 'next_attempt_at', 'sent_at']
+        )
+        for result, count in (('sent', sent), ('retried', retried), ('dead', dead)):
+            EMAILS_PROCESSED.inc(count, result=result)
+    return sent, retried, dead
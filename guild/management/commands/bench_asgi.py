@@ -0,0 +1,123 @@
+import json
+import logging
+import platform
+import resource
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils import timezone
+
+from guild.benchmarks.scenarios import SCENARIOS, World, run_scenario
+from guild.benchmarks.servers import SERVERS, Server, ServerError, run_slow_clients, server_available
+from guild.management.commands.bench_scenarios import _git_revision
+
+READ_SCENARIOS = ['post-list', 'post-detail', 'post-api']
+
+
+# WSGI (gunicorn, синхронные воркеры) против ASGI (uvicorn, асинхронные представления чтения)
+# под нагрузкой медленных клиентов, на данных seed_world:
+#   python manage.py bench_asgi --workers 2 --slow-clients 1000 --slow-seconds 10
+# Каждый сервер запускается отдельным процессом с одинаковым числом воркеров. Пока --slow-clients
+# соединений медленно отправляют запросы, обычные клиенты (--concurrency потоков) выполняют
+# сценарии; печатаются их запросов в секунду, задержки и ошибки, а также число запросов медленных
+# клиентов. Без медленных клиентов (--slow-clients 0) - обычное сравнение пропускной способности.
+# За nginx с буферизацией запросов медленные клиенты до gunicorn не доходят - это замер без прокси
+class Command(BaseCommand):
+    help = 'Сравнение gunicorn (WSGI) и uvicorn (ASGI) под конкурентной нагрузкой и медленными клиентами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f'Сценарии (по умолчанию {", ".join(READ_SCENARIOS)})')
+        parser.add_argument('--servers', nargs='+', default=list(SERVERS), help=f'Из {", ".join(SERVERS)}')
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--slow-clients', type=int, default=500)
+        parser.add_argument('--slow-seconds', type=float, default=5,
+                            help='За сколько секунд медленный клиент отправляет запрос')
+        parser.add_argument('--requests', type=int, default=100)
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--timeout', type=float, default=5,
+                            help='Ожидание ответа обычным клиентом, с; без ответа - ошибка')
+        parser.add_argument('--warmup', type=int, default=5, help='Неучитываемых запросов на поток')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--server-log', help='Файл для вывода серверов (по умолчанию вывод отбрасывается)')
+        parser.add_argument('--output', help='Сохранить результат в JSON')
+
+    def handle(self, *args, **options):
+        scenarios = options['scenarios'] or READ_SCENARIOS
+        unknown = (set(scenarios) - set(SCENARIOS)) | (set(options['servers']) - set(SERVERS))
+        if unknown:
+            raise CommandError(f'Неизвестные сценарии или серверы: {", ".join(sorted(unknown))}')
+        world = World()
+        if not world:
+            raise CommandError('Нет данных: сначала выполните manage.py seed_world')
+        servers = []
+        for name in options['servers']:
+            if server_available(name):
+                servers.append(name)
+            else:
+                self.stderr.write(f'{name}: модуль {SERVERS[name]["module"]} не установлен, пропускается '
+                                  f'(pip install {SERVERS[name]["module"]})')
+        if not servers:
+            raise CommandError('Нет ни одного доступного сервера')
+
+        # каждому медленному клиенту нужен дескриптор файла; дочерние процессы серверов наследуют лимит
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft != resource.RLIM_INFINITY and soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+        logging.getLogger('guild.performance').disabled = True
+        results = {}
+        for name in servers:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{name} ({SERVERS[name]["module"]}, воркеров: {options["workers"]}, '
+                f'медленных клиентов: {options["slow_clients"]})'
+            ))
+            try:
+                results[name] = self.run_server(name, world, scenarios, options)
+            except ServerError as exc:
+                raise CommandError(str(exc))
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'revision': _git_revision(),
+            'python': platform.python_version(),
+            'database': settings.DATABASES['default']['ENGINE'],
+            'options': {key: options[key] for key in ('workers', 'slow_clients', 'slow_seconds', 'requests',
+                                                      'concurrency', 'warmup', 'seed', 'timeout')},
+            'world': world.counts(),
+            'servers': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Результат сохранён в {options["output"]}')
+
+    def run_server(self, name, world, scenarios, options):
+        results = {}
+        with Server(name, workers=options['workers'], log=options['server_log']) as server:
+            stop = threading.Event()
+            slow = {'completed': 0, 'failed': 0}
+            slow_thread = threading.Thread(target=run_slow_clients, args=(
+                server.base_url, reverse('post-list'), options['slow_clients'], options['slow_seconds'], stop, slow,
+            ))
+            slow_thread.start()
+            try:
+                # медленные клиенты успевают открыть соединения до замера
+                time.sleep(min(options['slow_seconds'] / 2, 2) if options['slow_clients'] else 0)
+                for scenario in scenarios:
+                    result = run_scenario(scenario, world, requests=options['requests'],
+                                          concurrency=options['concurrency'], warmup=options['warmup'],
+                                          seed=options['seed'], base_url=server.base_url,
+                                          timeout=options['timeout'])
+                    results[scenario] = result
+                    self.stdout.write(
+                        f'{scenario:<20} {result["rps"]:>8.1f} запр/с  p50 {result["p50_ms"]:>8.2f}  '
+                        f'p95 {result["p95_ms"]:>8.2f}  p99 {result["p99_ms"]:>8.2f} мс  ошибок {result["errors"]}'
+                    )
+            finally:
+                stop.set()
+                slow_thread.join()
+        self.stdout.write(f'Медленные клиенты: выполнено {slow["completed"]}, ошибок {slow["failed"]}')
+        return {'scenarios': results, 'slow_clients': slow}
@@ -0,0 +1,46 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db.models import Min
+
+from guild.filters import PostFilter
+from guild.models import Post
+
+
+# Сравнение старого фильтра по дате (icontains по строке) и диапазонного фильтра:
+#   python manage.py bench_post_filter --date 2024-01-15 --category 1
+# Печатает план запроса (EXPLAIN) и среднее время первой страницы ленты
+class Command(BaseCommand):
+    help = 'План запроса и время фильтра ленты по дате: icontains против диапазона по индексу'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat, help='День (YYYY-MM-DD), по умолчанию - первый пост')
+        parser.add_argument('--category', type=int)
+        parser.add_argument('--runs', type=int, default=50)
+        parser.add_argument('--page-size', type=int, default=10)
+
+    def handle(self, *args, **options):
+        day = options['date']
+        if day is None:
+            first = Post.objects.aggregate(first=Min('created_at'))['first']
+            if first is None:
+                self.stderr.write('Нет постов: заполните базу, например manage.py seed_world')
+                return
+            day = first.date()
+
+        base = Post.objects.all()
+        if options['category']:
+            base = base.filter(category_id=options['category'])
+        legacy = base.filter(created_at__icontains=day.isoformat())
+        sargable = PostFilter().filter_created_at(base, 'created_at', day)
+
+        for title, queryset in (('icontains (было)', legacy), ('диапазон (стало)', sargable)):
+            page = queryset.order_by('-created_at', '-id')[:options['page_size']]
+            self.stdout.write(self.style.MIGRATE_HEADING(title))
+            self.stdout.write(page.explain())
+            started = time.perf_counter()
+            for _ in range(options['runs']):
+                list(page.all())
+            elapsed = (time.perf_counter() - started) / options['runs']
+            self.stdout.write(f'Среднее время страницы: {elapsed * 1000:.2f} мс\n')
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from guild.models import Post
+from guild.renderers import FastJSONRenderer, orjson
+from guild.serializers import PostSerializer, post_rows, post_values
+
+
+# Сравнение сериализации страницы API: PostSerializer + JSONRenderer против .values() + orjson
+#   python manage.py bench_post_serialization --rows 1000 10000
+# Печатает строки в секунду для обоих путей (выборка из базы + сериализация + рендер JSON)
+class Command(BaseCommand):
+    help = 'Скорость сериализации постов для API: ModelSerializer против быстрого пути'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000])
+        parser.add_argument('--runs', type=int, default=5)
+
+    def handle(self, *args, **options):
+        total = Post.objects.count()
+        if not total:
+            self.stderr.write('Нет постов: заполните базу, например manage.py seed_world')
+            return
+        if orjson is None:
+            self.stderr.write('orjson не установлен: быстрый путь рендерит стандартным json')
+
+        def model_serializer(queryset):
+            return JSONRenderer().render(PostSerializer(list(queryset), many=True).data)
+
+        def fast_path(queryset):
+            return FastJSONRenderer().render(post_rows(list(post_values(queryset))))
+
+        for rows in options['rows']:
+            queryset = Post.objects.order_by('-created_at', '-id')[:rows]
+            count = min(rows, total)
+            if count < rows:
+                self.stdout.write(self.style.WARNING(f'В базе только {total} постов'))
+            self.stdout.write(self.style.MIGRATE_HEADING(f'Страница из {count} строк'))
+            results = {}
+            for title, render in (('PostSerializer', model_serializer), ('values + orjson', fast_path)):
+                render(queryset.all())
+                started = time.perf_counter()
+                for _ in range(options['runs']):
+                    render(queryset.all())
+                elapsed = (time.perf_counter() - started) / options['runs']
+                results[title] = elapsed
+                self.stdout.write(f'{title:>16}: {elapsed * 1000:8.1f} мс, {count / elapsed:10.0f} строк/с')
+            speedup = results['PostSerializer'] / results['values + orjson']
+            self.stdout.write(f'Ускорение: x{speedup:.1f}\n')
@@ -0,0 +1,90 @@
+import json
+import logging
+import platform
+import subprocess
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from guild.benchmarks.scenarios import SCENARIOS, World, compare, run_scenario
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _percent(change):
+    return '-' if change is None else f'{change:+}%'
+
+
+# Нагрузочные сценарии по маршрутам сайта на данных seed_world:
+#   python manage.py bench_scenarios --requests 500 --concurrency 4 --output before.json
+#   python manage.py bench_scenarios --compare before.json
+#   python manage.py bench_scenarios --base-url http://127.0.0.1:8000 post-list post-api
+# Без --base-url запросы идут через django.test.Client в этом процессе (весь стек middleware),
+# с --base-url - по HTTP к запущенному серверу с той же базой. Печатает запросов в секунду
+# и задержки p50/p95/p99; результат можно сохранить в JSON и сравнить с прошлым прогоном
+class Command(BaseCommand):
+    help = 'Пропускная способность и задержки основных страниц и API на синтетических данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f'Сценарии из {", ".join(SCENARIOS)} (по умолчанию все)')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--warmup', type=int, default=10, help='Неучитываемых запросов на поток')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--base-url')
+        parser.add_argument('--output', help='Сохранить результат в JSON')
+        parser.add_argument('--compare', help='JSON прошлого прогона для сравнения')
+
+    def handle(self, *args, **options):
+        unknown = set(options['scenarios']) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Неизвестные сценарии: {", ".join(sorted(unknown))}')
+        world = World()
+        if not world:
+            raise CommandError('Нет данных: сначала выполните manage.py seed_world')
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                baseline = json.load(file)
+
+        # строка лога guild.performance на каждый запрос заглушила бы отчёт
+        logging.getLogger('guild.performance').disabled = True
+        results = {}
+        for name in options['scenarios'] or list(SCENARIOS):
+            result = run_scenario(name, world, requests=options['requests'], concurrency=options['concurrency'],
+                                  warmup=options['warmup'], seed=options['seed'], base_url=options['base_url'])
+            results[name] = result
+            self.stdout.write(
+                f'{name:<20} {result["rps"]:>8.1f} запр/с  p50 {result["p50_ms"]:>7.2f}  '
+                f'p95 {result["p95_ms"]:>7.2f}  p99 {result["p99_ms"]:>7.2f} мс  ошибок {result["errors"]}'
+            )
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'revision': _git_revision(),
+            'python': platform.python_version(),
+            'database': settings.DATABASES['default']['ENGINE'],
+            'options': {key: options[key] for key in ('requests', 'concurrency', 'warmup', 'seed', 'base_url')},
+            'world': world.counts(),
+            'scenarios': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Результат сохранён в {options["output"]}')
+        if baseline is not None:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'Сравнение с {options["compare"]}'))
+            for row in compare(report, baseline):
+                rps, before_rps, rps_change = row['rps']
+                p95, before_p95, p95_change = row['p95_ms']
+                self.stdout.write(
+                    f'{row["scenario"]:<20} {before_rps:>8.1f} -> {rps:>8.1f} запр/с ({_percent(rps_change)})  '
+                    f'p95 {before_p95:.2f} -> {p95:.2f} мс ({_percent(p95_change)})'
+                )
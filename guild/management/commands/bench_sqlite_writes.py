@@ -0,0 +1,141 @@
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from guild.sqlite import SQLITE_JOURNAL_MODE, SQLITE_PRAGMAS, apply_pragmas
+
+# Схема, похожая на горячие таблицы: сессии (UPSERT при каждом запросе), посты и счётчик у поста
+SCHEMA = '''
+CREATE TABLE session (key TEXT PRIMARY KEY, data TEXT NOT NULL, expire REAL NOT NULL);
+CREATE TABLE post (id INTEGER PRIMARY KEY, title TEXT NOT NULL, content TEXT NOT NULL,
+                   created REAL NOT NULL, response_count INTEGER NOT NULL DEFAULT 0);
+CREATE INDEX post_created ON post (created, id);
+CREATE TABLE response (id INTEGER PRIMARY KEY, post_id INTEGER NOT NULL REFERENCES post (id),
+                       content TEXT NOT NULL, created REAL NOT NULL);
+'''
+
+
+# Конкурентная запись в SQLite: журнал по умолчанию против SQLITE_JOURNAL_MODE и SQLITE_PRAGMAS из настроек
+#   python manage.py bench_sqlite_writes --writers 8 --readers 4 --seconds 5
+# Каждый режим - отдельный временный файл базы; писатели в своих потоках выполняют транзакции
+# "сессия + пост или отклик со счётчиком", читатели - страницы ленты. Печатает транзакции и чтения
+# в секунду, задержку коммита (p50/p95) и число ошибок "database is locked"
+class Command(BaseCommand):
+    help = 'Пропускная способность конкурентной записи в SQLite: по умолчанию и с PRAGMA из настроек'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--timeout', type=float, default=5,
+                            help='Ожидание блокировки в режиме по умолчанию, с (как timeout в sqlite3)')
+
+    def handle(self, *args, **options):
+        modes = (
+            ('по умолчанию (rollback journal, synchronous=FULL)', {}),
+            ('SQLITE_JOURNAL_MODE и SQLITE_PRAGMAS', {'journal_mode': SQLITE_JOURNAL_MODE or 'DELETE', **SQLITE_PRAGMAS}),
+        )
+        for title, pragmas in modes:
+            with tempfile.TemporaryDirectory() as directory:
+                result = self.run_mode(os.path.join(directory, 'bench.sqlite3'), pragmas, options)
+            self.stdout.write(self.style.MIGRATE_HEADING(title))
+            for name, value in pragmas.items():
+                self.stdout.write(f'  PRAGMA {name} = {value}')
+            self.stdout.write(
+                f'Транзакций записи: {result["writes"] / result["elapsed"]:.0f}/с, '
+                f'чтений: {result["reads"] / result["elapsed"]:.0f}/с, '
+                f'коммит p50 {result["p50"]:.2f} мс, p95 {result["p95"]:.2f} мс, '
+                f'ошибок блокировки: {result["busy"]}\n'
+            )
+
+    def connect(self, path, pragmas, timeout):
+        # isolation_level=None - транзакциями управляем сами, как Django в autocommit
+        db = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        if pragmas:
+            apply_pragmas(db.cursor(), pragmas)
+        return db
+
+    def run_mode(self, path, pragmas, options):
+        db = self.connect(path, pragmas, options['timeout'])
+        db.executescript(SCHEMA)
+        db.execute('BEGIN')
+        db.executemany('INSERT INTO post (title, content, created) VALUES (?, ?, ?)',
+                       ((f'Пост {i}', 'Текст ' * 50, time.time()) for i in range(1000)))
+        db.execute('COMMIT')
+        db.close()
+
+        stop = threading.Event()
+        lock = threading.Lock()
+        totals = {'writes': 0, 'reads': 0, 'busy': 0}
+        latencies = []
+
+        def writer(number):
+            db = self.connect(path, pragmas, options['timeout'])
+            writes, busy, own = 0, 0, []
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    db.execute('BEGIN')
+                    db.execute('INSERT OR REPLACE INTO session VALUES (?, ?, ?)',
+                               (f's{number}-{writes % 100}', 'x' * 200, time.time() + 3600))
+                    if writes % 2:
+                        db.execute('INSERT INTO post (title, content, created) VALUES (?, ?, ?)',
+                                   (f'Пост {number}-{writes}', 'Текст ' * 50, time.time()))
+                    else:
+                        post_id = writes % 1000 + 1
+                        db.execute('INSERT INTO response (post_id, content, created) VALUES (?, ?, ?)',
+                                   (post_id, 'Отклик', time.time()))
+                        db.execute('UPDATE post SET response_count = response_count + 1 WHERE id = ?', (post_id,))
+                    db.execute('COMMIT')
+                except sqlite3.OperationalError:
+                    busy += 1
+                    if db.in_transaction:
+                        db.execute('ROLLBACK')
+                    continue
+                own.append(time.perf_counter() - started)
+                writes += 1
+            db.close()
+            with lock:
+                totals['writes'] += writes
+                totals['busy'] += busy
+                latencies.extend(own)
+
+        def reader():
+            db = self.connect(path, pragmas, options['timeout'])
+            reads = 0
+            while not stop.is_set():
+                try:
+                    db.execute('SELECT id, title, response_count FROM post '
+                               'ORDER BY created DESC, id DESC LIMIT 10').fetchall()
+                except sqlite3.OperationalError:
+                    with lock:
+                        totals['busy'] += 1
+                    continue
+                reads += 1
+            db.close()
+            with lock:
+                totals['reads'] += reads
+
+        threads = [threading.Thread(target=writer, args=(i,)) for i in range(options['writers'])]
+        threads += [threading.Thread(target=reader) for _ in range(options['readers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(options['seconds'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        quantiles = statistics.quantiles(latencies, n=20) if len(latencies) > 1 else [0.0] * 19
+        return {
+            **totals,
+            'elapsed': elapsed,
+            'p50': (statistics.median(latencies) if latencies else 0.0) * 1000,
+            'p95': quantiles[18] * 1000,
+        }
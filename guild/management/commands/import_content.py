@@ -0,0 +1,56 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+
+from guild.ingest import INGEST_BATCH_SIZE, Importer
+
+
+def _records(stream, errors):
+    for line, raw in enumerate(stream, 1):
+        raw = raw.strip()
+        if not raw:
+            continue
+        try:
+            yield line, json.loads(raw)
+        except ValueError as exc:
+            errors.append({'line': line, 'error': f'некорректный JSON: {exc}'})
+
+
+# Загрузка постов и откликов из JSONL (формат записей - в guild/ingest.py):
+#   python manage.py import_content boards.jsonl --batch-size 2000
+#   zcat boards.jsonl.gz | python manage.py import_content -
+# Ошибочные строки пропускаются и печатаются с номером строки; в конце - строк в секунду
+class Command(BaseCommand):
+    help = 'Массовый импорт постов и откликов из JSONL без рассылки уведомлений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Файл JSONL или '-' для stdin")
+        parser.add_argument('--batch-size', type=int, default=INGEST_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        importer = Importer(batch_size=options['batch_size'])
+        parse_errors = importer.errors
+
+        def progress(importer):
+            for error in importer.errors:
+                self.stderr.write(f'Строка {error["line"]}: {error["error"]}')
+            self.failed += len(importer.errors)
+            importer.errors.clear()
+            self.stdout.write(
+                f'Постов: {importer.posts}, откликов: {importer.responses}, {importer.rate:.0f} строк/с'
+            )
+
+        self.failed = 0
+        if options['path'] == '-':
+            importer.feed(_records(sys.stdin, parse_errors), on_chunk=progress)
+        else:
+            with open(options['path'], encoding='utf-8') as stream:
+                importer.feed(_records(stream, parse_errors), on_chunk=progress)
+        if importer.errors:
+            progress(importer)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано постов: {importer.posts}, откликов: {importer.responses}, '
+            f'ошибок: {self.failed}, {importer.rate:.0f} строк/с'
+        ))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from guild.images import IMAGE_BATCH_SIZE, process_image_batch
+
+
+# Воркер очереди изображений: python manage.py process_images
+class Command(BaseCommand):
+    help = 'Создаёт уменьшенные копии загруженных изображений (исходный формат и WebP)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=IMAGE_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Пауза в секундах, когда очередь пуста')
+        parser.add_argument('--once', action='store_true', help='Разобрать очередь один раз и выйти')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        while True:
+            done, retried, failed = process_image_batch(batch_size)
+            if done or retried or failed:
+                self.stdout.write(f'Обработано: {done}, отложено: {retried}, с ошибкой: {failed}')
+            if done + retried + failed < batch_size:
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
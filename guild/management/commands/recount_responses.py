@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from guild.counters import recount_all
+
+
+# Восстановление денормализованных счётчиков откликов: python manage.py recount_responses
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики откликов у постов и число откликов на модерации у профилей'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        with transaction.atomic():
+            posts, profiles = recount_all()
+        self.stdout.write(
+            f'Постов: {posts}, профилей: {profiles}, за {time.monotonic() - started:.2f} с'
+        )
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from guild.search import reindex
+
+
+# Инкрементальная переиндексация полнотекстового поиска: python manage.py reindex_posts [--full]
+class Command(BaseCommand):
+    help = 'Обновляет поисковый индекс постов: добавляет новые и изменённые, удаляет несуществующие'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Переиндексировать все посты')
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        indexed, removed = reindex(using=options['database'], full=options['full'])
+        self.stdout.write(
+            f'Проиндексировано: {indexed}, удалено из индекса: {removed} '
+            f'за {time.monotonic() - started:.2f} с'
+        )
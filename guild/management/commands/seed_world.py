@@ -0,0 +1,40 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from guild.benchmarks.world import PASSWORD, USERNAME_PREFIX, clear_world, seed_world
+
+
+# Синтетические данные для бенчмарков (guild/benchmarks/world.py):
+#   python manage.py seed_world --users 500 --posts 50000 --responses 150000 --reset
+# Один и тот же --seed даёт одни и те же данные; пароль всех пользователей мира - bench-password
+class Command(BaseCommand):
+    help = 'Создаёт детерминированный синтетический мир: пользователи, категории, посты, отклики, подписки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--responses', type=int, default=30000)
+        parser.add_argument('--subscriptions', type=int, default=300)
+        parser.add_argument('--days', type=int, default=90, help='За сколько дней распределены посты')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--reset', action='store_true', help='Удалить мир, созданный раньше')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            clear_world()
+        elif User.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+            raise CommandError('Мир уже создан: добавьте --reset, чтобы пересоздать его')
+
+        started = time.monotonic()
+        counts = seed_world(
+            users=options['users'], categories=options['categories'], posts=options['posts'],
+            responses=options['responses'], subscriptions=options['subscriptions'],
+            days=options['days'], seed=options['seed'], batch_size=options['batch_size'],
+        )
+        elapsed = time.monotonic() - started
+        self.stdout.write(', '.join(f'{name}: {count}' for name, count in counts.items()) + f' за {elapsed:.1f} с')
+        self.stdout.write(f'Пользователи {USERNAME_PREFIX}0..{counts["users"] - 1}, пароль {PASSWORD}')
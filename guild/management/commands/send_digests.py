@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from guild.notifications import DIGEST_PERIODS, send_digests
+
+
+# Сводки новых постов по подпискам. Запускается по расписанию (cron):
+#   python manage.py send_digests --period hourly   - каждый час
+#   python manage.py send_digests --period daily    - раз в сутки
+class Command(BaseCommand):
+    help = 'Ставит в очередь сводки новых постов для подписчиков с доставкой раз в час/день'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', choices=list(DIGEST_PERIODS), required=True)
+
+    def handle(self, *args, **options):
+        queued = send_digests(options['period'])
+        self.stdout.write(f'Сводок поставлено в очередь: {queued}')
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from guild.mail import OUTBOX_BATCH_SIZE, send_outbox_batch
+
+
+# Воркер очереди исходящих писем: python manage.py send_outbox
+class Command(BaseCommand):
+    help = 'Отправляет письма из очереди OutboxEmail пачками через одно SMTP-соединение'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=OUTBOX_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Пауза в секундах, когда очередь пуста')
+        parser.add_argument('--once', action='store_true', help='Разобрать очередь один раз и выйти')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        while True:
+            try:
+                sent, retried, dead = send_outbox_batch(batch_size)
+            except Exception as exc:
+                # SMTP недоступен - письма останутся в очереди и будут взяты после паузы
+                self.stderr.write(f'Ошибка отправки: {exc}')
+                sent = retried = dead = 0
+            if sent or retried or dead:
+                self.stdout.write(f'Отправлено: {sent}, отложено: {retried}, не доставлено: {dead}')
+            if options['once']:
+                if sent + retried + dead < batch_size:
+                    break
+                continue
+            if sent + retried + dead < batch_size:
+                time.sleep(options['interval'])
@@ -0,0 +1,119 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.views import View
+
+# Как отдавать файлы из MEDIA_ROOT:
+#   'django'           - сам Django (разработка, небольшие инсталляции)
+#   'x-accel-redirect' - nginx: заголовок X-Accel-Redirect с путём во внутреннем location MEDIA_ACCEL_PREFIX
+#   'x-sendfile'       - Apache mod_xsendfile / lighttpd: заголовок X-Sendfile с путём к файлу
+# Условные запросы (304) обрабатываются в Django в любом режиме; Range при выгрузке обрабатывает прокси
+MEDIA_SERVE_MODE = getattr(settings, 'MEDIA_SERVE_MODE', 'django')
+MEDIA_ACCEL_PREFIX = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/')
+# max-age для файлов, имя которых не определяется содержимым
+MEDIA_CACHE_MAX_AGE = getattr(settings, 'MEDIA_CACHE_MAX_AGE', 60 * 60)
+MEDIA_CHUNK_SIZE = 64 * 1024
+
+# Имя из ContentAddressedStorage: .../ab/cd/<sha256>.ext - содержимое по такому имени никогда не меняется
+IMMUTABLE_RE = re.compile(r'(?:^|/)[0-9a-f]{2}/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})(?:\.[\w.]+)?$')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _file_range(path, start, length):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(MEDIA_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+# Один диапазон bytes=a-b, bytes=a- или bytes=-n -> (начало, длина); None - отдать файл целиком
+# (несколько диапазонов не поддерживаются, RFC 9110 это допускает); ValueError - диапазон вне файла
+def parse_range(header, size):
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end - start + 1
+
+
+class MediaView(View):
+    def get(self, request, path):
+        try:
+            full_path = safe_join(settings.MEDIA_ROOT, path)
+        except SuspiciousFileOperation:
+            raise Http404
+        if not os.path.isfile(full_path):
+            raise Http404
+
+        stat = os.stat(full_path)
+        immutable = IMMUTABLE_RE.search(path)
+        if immutable:
+            etag = quote_etag(immutable['digest'])
+        else:
+            etag = quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+
+        response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+        if response is None:
+            response = self._serve(request, path, full_path, stat.st_size, etag, int(stat.st_mtime))
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(stat.st_mtime)
+        if immutable:
+            patch_cache_control(response, public=True, max_age=60 * 60 * 24 * 365, immutable=True)
+        else:
+            patch_cache_control(response, public=True, max_age=MEDIA_CACHE_MAX_AGE)
+        return response
+
+    def _serve(self, request, path, full_path, size, etag, mtime):
+        content_type, encoding = mimetypes.guess_type(full_path)
+        content_type = content_type or 'application/octet-stream'
+
+        if MEDIA_SERVE_MODE == 'x-accel-redirect':
+            response = HttpResponse(content_type=content_type)
+            response.headers['X-Accel-Redirect'] = MEDIA_ACCEL_PREFIX.rstrip('/') + '/' + path.lstrip('/')
+            return response
+        if MEDIA_SERVE_MODE == 'x-sendfile':
+            response = HttpResponse(content_type=content_type)
+            response.headers['X-Sendfile'] = full_path
+            return response
+
+        # If-Range: диапазон отдаётся, только если у клиента та же версия файла
+        if_range = request.headers.get('If-Range')
+        use_range = not if_range or if_range == etag or parse_http_date_safe(if_range) == mtime
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size) if use_range else None
+        except ValueError:
+            response = HttpResponse(status=416)
+            response.headers['Content-Range'] = f'bytes */{size}'
+            return response
+
+        if byte_range is None:
+            response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+        else:
+            start, length = byte_range
+            response = StreamingHttpResponse(_file_range(full_path, start, length),
+                                             status=206, content_type=content_type)
+            response.headers['Content-Range'] = f'bytes {start}-{start + length - 1}/{size}'
+            response.headers['Content-Length'] = str(length)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Accept-Ranges'] = 'bytes'
+        return response
@@ -0,0 +1,212 @@
+import atexit
+import glob
+import json
+import math
+import os
+import threading
+import time
+
+from django.conf import settings
+
+# Папка для метрик нескольких процессов (воркеры gunicorn, send_outbox, process_images).
+# Каждый процесс пишет в неё свой снимок <pid>.json не чаще раза в METRICS_FLUSH_INTERVAL секунд,
+# /metrics складывает снимки всех процессов. Папку нужно очищать при запуске сервера.
+# Без папки /metrics показывает только метрики процесса, обработавшего запрос
+METRICS_DIR = getattr(settings, 'METRICS_DIR', None)
+METRICS_FLUSH_INTERVAL = getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0)
+# Токен сборщика для /metrics (заголовок Authorization: Bearer <токен>); None - без проверки
+METRICS_TOKEN = getattr(settings, 'METRICS_TOKEN', None)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+# Реестр метрик процесса: счётчики и гистограммы с метками, формат Prometheus.
+# Значения хранятся в словарях под одной блокировкой; после fork (gunicorn --preload) дочерний процесс
+# начинает с нуля, чтобы не посчитать значения родителя второй раз
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.registry.lock:
+            values = self.registry.values_for(self.name)
+            values[key] = values.get(key, 0) + amount
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames, buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        # номер первой корзины, в которую попадает значение (len(buckets) - только +Inf)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self.registry.lock:
+            values = self.registry.values_for(self.name)
+            # [число в каждой корзине (без накопления)..., +Inf, сумма, количество]
+            state = values.get(key)
+            if state is None:
+                state = values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self._values = {}
+        self._pid = os.getpid()
+        self._flushed_at = 0.0
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    # Вызывается под self.lock
+    def values_for(self, name):
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._values = {}
+        return self._values.setdefault(name, {})
+
+    def snapshot(self):
+        with self.lock:
+            if os.getpid() != self._pid:
+                return {}
+            return {
+                name: [[list(key), list(value) if isinstance(value, list) else value] for key, value in values.items()]
+                for name, values in self._values.items()
+            }
+
+    def flush(self):
+        if not METRICS_DIR:
+            return
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = os.path.join(METRICS_DIR, f'{os.getpid()}.json')
+        temp = f'{path}.{threading.get_ident()}.tmp'
+        with open(temp, 'w') as file:
+            json.dump(self.snapshot(), file)
+        os.replace(temp, path)
+        self._flushed_at = time.monotonic()
+
+    def maybe_flush(self):
+        if METRICS_DIR and time.monotonic() - self._flushed_at >= METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    # Снимки всех процессов (или только этого), сложенные по метрике и меткам
+    def collect(self):
+        if not METRICS_DIR:
+            snapshots = [self.snapshot()]
+        else:
+            self.flush()
+            snapshots = []
+            for path in glob.glob(os.path.join(METRICS_DIR, '*.json')):
+                try:
+                    with open(path) as file:
+                        snapshots.append(json.load(file))
+                except (OSError, ValueError):
+                    continue
+        merged = {}
+        for snapshot in snapshots:
+            for name, samples in snapshot.items():
+                values = merged.setdefault(name, {})
+                for key, value in samples:
+                    key = tuple(key)
+                    if isinstance(value, list):
+                        current = values.setdefault(key, [0] * len(value))
+                        values[key] = [a + b for a, b in zip(current, value)]
+                    else:
+                        values[key] = values.get(key, 0) + value
+        return merged
+
+    def render(self):
+        merged = self.collect()
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for key, value in sorted(merged.get(name, {}).items()):
+                labels = dict(zip(metric.labelnames, key))
+                if metric.kind == 'counter':
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip([*metric.buckets, math.inf], value):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels({**labels, "le": _number(bound)})} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(value[-2])}')
+                lines.append(f'{name}_count{_labels(labels)} {value[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _number(value):
+    return '+Inf' if value == math.inf else repr(value)
+
+
+registry = Registry()
+if METRICS_DIR:
+    atexit.register(registry.flush)
+
+REQUEST_LATENCY = registry.histogram(
+    'guild_http_request_duration_seconds', 'Время обработки запроса по маршруту', ('view', 'method'),
+)
+REQUESTS = registry.counter(
+    'guild_http_requests_total', 'Запросы по маршруту и коду ответа', ('view', 'method', 'status'),
+)
+REQUEST_QUERIES = registry.histogram(
+    'guild_http_request_db_queries', 'Число SQL-запросов на HTTP-запрос', ('view',), buckets=COUNT_BUCKETS,
+)
+DB_QUERIES = registry.counter('guild_db_queries_total', 'SQL-запросы по маршруту', ('view',))
+CACHE_REQUESTS = registry.counter('guild_cache_requests_total', 'Обращения к кэшу: hit или miss', ('result',))
+EMAILS_QUEUED = registry.counter('guild_emails_queued_total', 'Письма, поставленные в очередь')
+EMAILS_PROCESSED = registry.counter(
+    'guild_emails_processed_total', 'Письма, обработанные отправкой: sent, retried, dead', ('result',),
+)
+EVENTS_PUBLISHED = registry.counter('guild_events_published_total', 'События для потоков SSE', ('event',))
+SIGNAL_DURATION = registry.histogram(
+    'guild_signal_handler_duration_seconds', 'Время обработчиков сигналов guild/signals.py', ('handler',),
+)
+
+
+def observe_request(view, method, status, duration, stats):
+    REQUEST_LATENCY.observe(duration, view=view, method=method)
+    REQUESTS.inc(view=view, method=method, status=status)
+    REQUEST_QUERIES.observe(stats.sql_count, view=view)
+    DB_QUERIES.inc(stats.sql_count, view=view)
+    registry.maybe_flush()
@@ -1,5 +1,24 @@
+import cProfile
+import json
+import logging
+import os
+import random
+import time
+from zoneinfo import ZoneInfoNotFoundError
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DatabaseError
+from django.http import HttpResponse
 from django.shortcuts import redirect
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.deprecation import MiddlewareMixin
+
+from guild import metrics, routers
+from guild.instrumentation import RequestStats, current_stats
+
+performance_logger = logging.getLogger('guild.performance')
 
 
 class TwoFactorAuthMiddleware:
@@ -13,4 +32,188 @@ class TwoFactorAuthMiddleware:
         if not request.user.is_verified:
             # Пользователь должен подтвердить учётную запись
             return redirect(reverse('verify_otp'))
-        return self.get_response(request)
\ No newline at end of file
+        return self.get_response(request)
+
+
+# Часовой пояс, выбранный пользователем (request.session['django_timezone']),
+# применяется к выводу дат и к фильтру постов по дню.
+# MiddlewareMixin: под ASGI сессия читается в потоке, а цепочка middleware остаётся асинхронной
+class TimezoneMiddleware(MiddlewareMixin):
+    def process_request(self, request):
+        tzname = request.session.get('django_timezone')
+        try:
+            if tzname:
+                timezone.activate(tzname)
+            else:
+                timezone.deactivate()
+        except (ZoneInfoNotFoundError, ValueError):
+            timezone.deactivate()
+
+
+# Замер времени обработки запроса: общее время, число и время SQL-запросов, попадания в кэш,
+# время рендера шаблона. Результат отдаётся в заголовке Server-Timing (виден в DevTools браузера)
+# и пишется в лог guild.performance одной JSON-строкой с именем маршрута (при PERF_LOG_LEVEL=INFO).
+# Доля запросов PERF_PROFILE_SAMPLE_RATE профилируется cProfile в PERF_PROFILE_DIR
+# (смотреть: python -m pstats <файл> или snakeviz)
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PERF_PROFILE_SAMPLE_RATE', 0)
+        self.profile_dir = getattr(settings, 'PERF_PROFILE_DIR', None)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token, profiler, started = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            self.stop(token, profiler)
+        return self.finish(request, response, stats, profiler, started)
+
+    # Под ASGI cProfile видит только поток цикла событий, без кода, выполненного через sync_to_async
+    async def __acall__(self, request):
+        stats, token, profiler, started = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.stop(token, profiler)
+        return self.finish(request, response, stats, profiler, started)
+
+    # SQL-запросы считает guild.instrumentation.record_sql по current_stats
+    def start(self):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        profiler = None
+        if self.profile_dir and self.sample_rate and random.random() < self.sample_rate:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        return stats, token, profiler, time.perf_counter()
+
+    def stop(self, token, profiler):
+        if profiler is not None:
+            profiler.disable()
+        current_stats.reset(token)
+
+    def finish(self, request, response, stats, profiler, started):
+        total = time.perf_counter() - started
+
+        url_name = request.resolver_match.view_name if request.resolver_match else 'unresolved'
+        metrics.observe_request(url_name, request.method, response.status_code, total, stats)
+        response['Server-Timing'] = ', '.join([
+            f'app;dur={total * 1000:.1f}',
+            f'db;dur={stats.sql_time * 1000:.1f};desc="{stats.sql_count} queries"',
+            f'cache;desc="{stats.cache_hits} hits, {stats.cache_misses} misses"',
+            f'tpl;dur={stats.template_time * 1000:.1f}',
+        ])
+        if performance_logger.isEnabledFor(logging.INFO):
+            performance_logger.info(json.dumps({
+                'url_name': url_name,
+                'method': request.method,
+                'status': response.status_code,
+                'duration_ms': round(total * 1000, 2),
+                'sql_count': stats.sql_count,
+                'sql_ms': round(stats.sql_time * 1000, 2),
+                'cache_hits': stats.cache_hits,
+                'cache_misses': stats.cache_misses,
+                'template_ms': round(stats.template_time * 1000, 2),
+            }))
+        if profiler is not None:
+            self.dump_profile(profiler, url_name)
+        return response
+
+    # TemplateResponse рендерится после этого вызова; время рендера - до post-render callback.
+    # Уже отрендеренный ответ (кэш страниц) учтён в guild.instrumentation.record_template
+    def process_template_response(self, request, response):
+        stats = current_stats.get()
+        if stats is not None and not response.is_rendered:
+            started = time.perf_counter()
+
+            def rendered(response):
+                stats.template_time += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def dump_profile(self, profiler, url_name):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        filename = f'{url_name.replace(":", "-")}-{int(time.time() * 1000)}-{os.getpid()}.prof'
+        profiler.dump_stats(os.path.join(self.profile_dir, filename))
+
+
+# Чтения на репликах (guild.routers): GET/HEAD маршрутов из REPLICA_READ_VIEWS читают с реплики,
+# если пользователь недавно ничего не записывал. После запроса с записью ставится cookie
+# на REPLICA_PIN_SECONDS - его следующие запросы читают из основной базы и видят свои изменения.
+# Ошибка базы на реплике (в представлении или при рендере шаблона): process_exception исключает реплику
+# на REPLICA_RETRY_AFTER, а __call__ один раз повторяет запрос без неё (только GET/HEAD, поэтому повтор
+# безопасен). Стоит выше SessionMiddleware, чтобы учесть запись сессии
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+    cookie_name = 'db_pinned_until'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = routers.start_request()
+        try:
+            response = self.get_response(request)
+            routing = routers.current_routing()
+            if routing.replica_failed:
+                routing.replica_failed = False
+                response = self.get_response(request)
+        finally:
+            routers.end_request(token)
+        return self.pin(response, routing)
+
+    # Состояние маршрутизации в ContextVar: код в потоках sync_to_async видит тот же объект
+    async def __acall__(self, request):
+        token = routers.start_request()
+        try:
+            response = await self.get_response(request)
+            routing = routers.current_routing()
+            if routing.replica_failed:
+                routing.replica_failed = False
+                response = await self.get_response(request)
+        finally:
+            routers.end_request(token)
+        return self.pin(response, routing)
+
+    def pin(self, response, routing):
+        if routing.wrote:
+            pinned_until = int(time.time()) + routers.REPLICA_PIN_SECONDS
+            response.set_cookie(self.cookie_name, str(pinned_until), max_age=routers.REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
+
+    def pinned(self, request):
+        try:
+            return int(request.COOKIES.get(self.cookie_name, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (request.method in ('GET', 'HEAD') and routers.DATABASE_REPLICAS
+                and request.resolver_match.url_name in routers.REPLICA_READ_VIEWS and not self.pinned(request)):
+            routers.current_routing().replica = routers.choose_replica()
+
+    # Повтор запроса - в __call__, а не вложенный вызов цепочки из обработчика исключения.
+    # Ответ-заглушка вместо исключения: ошибка реплики не превращается в 500 в логе django.request,
+    # __call__ заменит заглушку ответом повторного запроса
+    def process_exception(self, request, exception):
+        routing = routers.current_routing()
+        if isinstance(exception, DatabaseError) and routing is not None and routing.replica:
+            routers.mark_down(routing.replica)
+            routing.replica = None
+            routing.replica_failed = True
+            return HttpResponse(status=503)
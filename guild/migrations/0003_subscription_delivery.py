@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guild', '0002_outboxemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='delivery',
+            field=models.CharField(choices=[('immediate', 'Сразу'), ('hourly', 'Раз в час'), ('daily', 'Раз в день')], default='immediate', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='subscription',
+            name='last_digest_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+# Полнотекстовый индекс постов: FTS5 в SQLite, tsvector + GIN в PostgreSQL (см. guild/search.py)
+def create_search_index(apps, schema_editor):
+    from guild.search import BACKENDS
+
+    backend = BACKENDS.get(schema_editor.connection.vendor)
+    if backend is None:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        backend.create(cursor)
+        cursor.execute('SELECT id FROM guild_post')
+        backend.index(cursor, [row[0] for row in cursor.fetchall()])
+
+
+def drop_search_index(apps, schema_editor):
+    from guild.search import BACKENDS
+
+    backend = BACKENDS.get(schema_editor.connection.vendor)
+    if backend is not None:
+        with schema_editor.connection.cursor() as cursor:
+            backend.drop(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guild', '0003_subscription_delivery'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:51
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _count(queryset, group_by):
+    return Subquery(
+        queryset.order_by().values(group_by).annotate(total=Count('pk')).values('total'),
+        output_field=IntegerField(),
+    )
+
+
+# Начальные значения счётчиков для существующих постов и профилей - как guild.counters.recount_all,
+# но на исторических моделях
+def recount_responses(apps, schema_editor):
+    Post = apps.get_model('guild', 'Post')
+    Profile = apps.get_model('guild', 'Profile')
+    Response = apps.get_model('guild', 'Response')
+    db = schema_editor.connection.alias
+
+    responses = Response.objects.using(db).filter(post=OuterRef('pk'))
+    Post.objects.using(db).update(
+        response_count=Coalesce(_count(responses, 'post'), 0),
+        approved_response_count=Coalesce(_count(responses.filter(is_approved=True), 'post'), 0),
+        last_response_at=Subquery(
+            responses.order_by().values('post').annotate(last=Max('created_at')).values('last')
+        ),
+    )
+    pending = Response.objects.using(db).filter(post__author=OuterRef('pk'), is_approved=False)
+    Profile.objects.using(db).update(
+        pending_moderation_count=Coalesce(_count(pending, 'post__author'), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guild', '0005_post_board_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='approved_response_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='last_response_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='response_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='pending_moderation_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(recount_responses, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='response',
+            index=models.Index(fields=['post', 'is_approved'], name='response_post_approved_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guild', '0008_stored_blobs'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(condition=models.Q(('subscribed', True)), fields=['category'], name='subscription_subscribed_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+# Режим журнала SQLite (settings.SQLITE_JOURNAL_MODE) сохраняется в файле базы: включается один раз
+def enable_journal_mode(apps, schema_editor):
+    from guild.sqlite import SQLITE_JOURNAL_MODE, set_journal_mode
+
+    set_journal_mode(schema_editor.connection, SQLITE_JOURNAL_MODE)
+
+
+def disable_journal_mode(apps, schema_editor):
+    from guild.sqlite import set_journal_mode
+
+    set_journal_mode(schema_editor.connection, 'DELETE')
+
+
+class Migration(migrations.Migration):
+    # PRAGMA journal_mode внутри транзакции не действует
+    atomic = False
+
+    dependencies = [
+        ('guild', '0009_subscription_subscribed_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(enable_journal_mode, disable_journal_mode),
+    ]
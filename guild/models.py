@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 from django.urls import reverse
 
@@ -14,10 +15,32 @@ class Profile(models.Model):
     ]
     bio = models.CharField(max_length=1, choices=BIO_CHOICES, default='M')
     one_time_password = models.CharField(max_length=10, null=True, blank=True)
+    # Уменьшенные копии аватара (WebP и исходный формат), заполняет manage.py process_images
+    avatar_variants = models.JSONField(default=dict, blank=True)
+    # Число неодобренных откликов на посты пользователя (поддерживается guild.counters)
+    pending_moderation_count = models.PositiveIntegerField(default=0)
+
+    # Имя файла аватара на момент загрузки из базы: по нему сигналы освобождают заменённый файл
+    _loaded_avatar = None
+    _avatar_uploaded = False
 
     def __str__(self):
         return self.user.username
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_avatar = instance.__dict__.get('avatar')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Новый файл - новая ссылка в хранилище, даже если содержимое (и имя) то же, что у старого
+        update_fields = kwargs.get('update_fields')
+        self._avatar_uploaded = (bool(self.avatar) and not self.avatar._committed
+                                 and (update_fields is None or 'avatar' in update_fields))
+        super().save(*args, **kwargs)
+        self._loaded_avatar = self.avatar.name
+
     def check_confirmation_code(self, code):
         return self.one_time_password == code
 
@@ -45,10 +68,41 @@ class Post(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     image = models.ImageField(upload_to='images/', null=True, blank=True)
+    # Уменьшенные копии изображения (WebP и исходный формат), заполняет manage.py process_images
+    image_variants = models.JSONField(default=dict, blank=True)
+    # Денормализованные счётчики откликов (поддерживаются guild.counters)
+    response_count = models.PositiveIntegerField(default=0)
+    approved_response_count = models.PositiveIntegerField(default=0)
+    last_response_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # Лента объявлений: фильтр по категории и дню, сортировка и курсор по (created_at, id)
+        indexes = [
+            models.Index(fields=['category', 'created_at', 'id'], name='post_category_created_idx'),
+            models.Index(fields=['created_at', 'id'], name='post_created_idx'),
+        ]
+
+    # Имя файла изображения на момент загрузки из базы: по нему сигналы освобождают заменённый файл
+    _loaded_image = None
+    _image_uploaded = False
 
     def __str__(self):
         return f'{self.title}: {self.content}, {self.title}: {self.category}, {self.title}: {self.image}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_image = instance.__dict__.get('image')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Новый файл - новая ссылка в хранилище, даже если содержимое (и имя) то же, что у старого
+        update_fields = kwargs.get('update_fields')
+        self._image_uploaded = (bool(self.image) and not self.image._committed
+                                and (update_fields is None or 'image' in update_fields))
+        super().save(*args, **kwargs)
+        self._loaded_image = self.image.name
+
     def get_absolute_url(self):
         return reverse('post-detail', args=[str(self.id)])
 
@@ -61,16 +115,124 @@ class Response(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_approved = models.BooleanField(default=False)
 
+    # Значение is_approved на момент загрузки из базы: по нему сигналы узнают, что отклик одобрили
+    _loaded_is_approved = False
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'is_approved'], name='response_post_approved_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_is_approved = instance.__dict__.get('is_approved', False)
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_is_approved = self.is_approved
+
 
 # Модель подписок на категории и автора поста
 class Subscription(models.Model):
     profile = models.ForeignKey(Profile, on_delete=models.CASCADE,  related_name='subscriptions')
     category = models.ForeignKey(Category, on_delete=models.CASCADE,  related_name='subscriptions')
     subscribed = models.BooleanField(default=False)
+    DELIVERY_IMMEDIATE = 'immediate'
+    DELIVERY_HOURLY = 'hourly'
+    DELIVERY_DAILY = 'daily'
+    DELIVERY_CHOICES = [
+        (DELIVERY_IMMEDIATE, 'Сразу'),
+        (DELIVERY_HOURLY, 'Раз в час'),
+        (DELIVERY_DAILY, 'Раз в день'),
+    ]
+    delivery = models.CharField(max_length=10, choices=DELIVERY_CHOICES, default=DELIVERY_IMMEDIATE)
+    last_digest_at = models.DateTimeField(null=True, blank=True)
 
     def str(self):
         return f'{self.profile.user.username} subscribed to {self.category.name}'
 
     class Meta:
         unique_together = ('profile', 'category')
-        
\ No newline at end of file
+        indexes = [
+            # Только активные подписки: построение индекса подписчиков и рассылка по категории
+            models.Index(fields=['category'], condition=models.Q(subscribed=True),
+                         name='subscription_subscribed_idx'),
+        ]
+
+
+# Исходящие письма: пишутся в той же транзакции, что и изменение данных,
+# и отправляются отдельным процессом (manage.py send_outbox)
+class OutboxEmail(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_DEAD = 'dead'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Ожидает отправки'),
+        (STATUS_SENT, 'Отправлено'),
+        (STATUS_DEAD, 'Не доставлено'),
+    ]
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True, default='')
+    from_email = models.CharField(max_length=254, blank=True, default='')
+    to = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} -> {", ".join(self.to)} ({self.status})'
+
+
+# Очередь обработки загруженных изображений: уменьшенные копии создаёт отдельный процесс
+# (manage.py process_images), а не запрос, в котором загрузили файл
+class ImageJob(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Ожидает обработки'),
+        (STATUS_DONE, 'Обработано'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+    # Поле с изображением: post.image или profile.avatar (см. guild.images.IMAGE_FIELDS)
+    target = models.CharField(max_length=50)
+    object_id = models.PositiveBigIntegerField()
+    source = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='imagejob_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.target} #{self.object_id}: {self.source} ({self.status})'
+
+
+# Файл в хранилище с адресацией по содержимому (guild.storage.ContentAddressedStorage):
+# одинаковые загрузки хранятся один раз, refcount - число ссылок на файл
+class StoredBlob(models.Model):
+    digest = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    refcount = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.name} ({self.refcount})'
@@ -0,0 +1,70 @@
+from django.db import transaction
+
+from MMORPG import settings
+from guild import counters, events
+from guild.caching import bump_board_generation, invalidate_post
+from guild.mail import queue_mass_mail
+from guild.models import Response
+from guild.signals import muted
+
+MODERATION_ACTIONS = ('approve', 'delete')
+
+
+# Массовая модерация откликов автором поста.
+# Выборка, UPDATE/DELETE и пересчёт счётчиков - по одному запросу на всю пачку, проверка владельца
+# входит в условие запроса: чужие и уже обработанные отклики просто не попадают в выборку
+
+def _pending(profile, ids):
+    return Response.objects.filter(pk__in=ids, post__author=profile, is_approved=False)
+
+
+def _invalidate(post_ids):
+    post_ids = set(post_ids)
+
+    def invalidate():
+        for post_id in post_ids:
+            invalidate_post(post_id)
+        bump_board_generation()
+
+    transaction.on_commit(invalidate)
+
+
+# Одобрить отклики и поставить в очередь письма их авторам. Возвращает число одобренных
+def approve_responses(profile, ids):
+    with transaction.atomic():
+        rows = list(
+            _pending(profile, ids)
+            .select_for_update(of=('self',))
+            .values_list('id', 'post_id', 'post__title', 'author__user__email')
+        )
+        if not rows:
+            return 0
+        Response.objects.filter(pk__in=[row[0] for row in rows]).update(is_approved=True)
+        counters.responses_approved([post_id for _, post_id, _, _ in rows])
+        queue_mass_mail(
+            ('Ваш отзыв одобрен', f'Ваш отзыв на пост "{title}" был одобрен.', settings.EMAIL_HOST_USER, [email])
+            for _, _, title, email in rows
+            if email
+        )
+        _invalidate(post_id for _, post_id, _, _ in rows)
+        approved = [pk for pk, _, _, _ in rows]
+        transaction.on_commit(lambda: events.publish_responses_approved(approved))
+    return len(rows)
+
+
+# Удалить отклики, ожидающие модерации. Возвращает число удалённых
+def delete_responses(profile, ids):
+    with transaction.atomic():
+        rows = list(
+            _pending(profile, ids)
+            .select_for_update(of=('self',))
+            .values_list('id', 'post_id')
+        )
+        if not rows:
+            return 0
+        with muted():
+            Response.objects.filter(pk__in=[pk for pk, _ in rows]).delete()
+        counters.responses_deleted([(post_id, False) for _, post_id in rows])
+        _invalidate(post_id for _, post_id in rows)
+        transaction.on_commit(lambda: events.publish_moderation([post_id for _, post_id in rows]))
+    return len(rows)
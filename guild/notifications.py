@@ -0,0 +1,98 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from guild.mail import queue_mass_mail
+from guild.models import Post, Subscription
+from guild.subscribers import category_subscribers
+
+NOTIFICATION_CHUNK_SIZE = getattr(settings, 'NOTIFICATION_CHUNK_SIZE', 2000)
+
+DIGEST_PERIODS = {
+    Subscription.DELIVERY_HOURLY: timedelta(hours=1),
+    Subscription.DELIVERY_DAILY: timedelta(days=1),
+}
+
+
+def _post_url(post_id):
+    return f'{settings.SITE_URL}post/{post_id}/'
+
+
+# Рассылка о новом посте подписчикам с мгновенной доставкой.
+# Подписчики берутся из индекса подписок в кэше (guild.subscribers): без подписчиков - ни одного запроса.
+# Индекс может отставать от базы (отписка в другом процессе), поэтому адреса выбираются частями
+# только у подписок, которые и в базе активны с мгновенной доставкой; письма ставятся в очередь пачками
+def fan_out_new_post(post):
+    profile_ids = sorted(category_subscribers(post.category_id).get(Subscription.DELIVERY_IMMEDIATE, ()))
+    if not profile_ids:
+        return 0
+    subscriptions = Subscription.objects.filter(
+        category_id=post.category_id, subscribed=True, delivery=Subscription.DELIVERY_IMMEDIATE,
+    )
+    emails = (
+        email
+        for start in range(0, len(profile_ids), NOTIFICATION_CHUNK_SIZE)
+        for email in subscriptions
+        .filter(profile_id__in=profile_ids[start:start + NOTIFICATION_CHUNK_SIZE])
+        .exclude(profile__user__email='')
+        .values_list('profile__user__email', flat=True)
+    )
+    subject = 'Новый пост в подписанной категории!'
+    message = f'В категории {post.category.name}, на которую вы подписаны, ' \
+              f'появился новый пост: {post.title}. Вы можете прочитать его, ' \
+              f'перейдя по ссылке: {_post_url(post.id)}'
+    return queue_mass_mail(
+        (subject, message, settings.EMAIL_HOST_USER, [email]) for email in emails
+    )
+
+
+def _digest_message(posts):
+    lines = ['Новые посты в категориях, на которые вы подписаны:', '']
+    for post in posts:
+        lines.append(f'[{post["category__name"]}] {post["title"]}: {_post_url(post["id"])}')
+    return '\n'.join(lines)
+
+
+# Сводка новых постов для подписчиков с доставкой раз в час/день.
+# Все новые посты из всех подписок пользователя собираются в одно письмо
+def send_digests(period, now=None):
+    now = now or timezone.now()
+    default_since = now - DIGEST_PERIODS[period]
+    subscriptions = Subscription.objects.filter(subscribed=True, delivery=period)
+
+    with transaction.atomic():
+        rows = list(
+            subscriptions
+            .exclude(profile__user__email='')
+            .values_list('profile_id', 'profile__user__email', 'category_id', 'last_digest_at')
+            .order_by('profile_id')
+        )
+        if not rows:
+            return 0
+
+        earliest = min(last_digest_at or default_since for *_, last_digest_at in rows)
+        posts_by_category = defaultdict(list)
+        posts = (
+            Post.objects
+            .filter(category_id__in={row[2] for row in rows}, created_at__gt=earliest, created_at__lte=now)
+            .order_by('created_at')
+            .values('id', 'title', 'category_id', 'category__name', 'created_at')
+        )
+        for post in posts.iterator(chunk_size=NOTIFICATION_CHUNK_SIZE):
+            posts_by_category[post['category_id']].append(post)
+
+        digests = defaultdict(list)
+        for profile_id, email, category_id, last_digest_at in rows:
+            since = last_digest_at or default_since
+            digests[email].extend(p for p in posts_by_category[category_id] if p['created_at'] > since)
+
+        queued = queue_mass_mail(
+            ('Новые посты по вашим подпискам', _digest_message(sorted(posts, key=lambda p: p['created_at'])),
+             settings.EMAIL_HOST_USER, [email])
+            for email, posts in digests.items() if posts
+        )
+        subscriptions.update(last_digest_at=now)
+    return queued
@@ -0,0 +1,167 @@
+import base64
+import json
+from datetime import date
+
+from django.db.models import Q
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+# Страница курсорной пагинации: вместо номера страницы - непрозрачные токены соседних страниц
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+# Курсорная (keyset) пагинация по уникальному набору полей, например ('-created_at', '-id').
+# Страница выбирается условием WHERE (created_at, id) < (курсор) и LIMIT, без COUNT(*) и OFFSET,
+# поэтому любая страница стоит столько же, сколько первая (при индексе по полям сортировки)
+class KeysetPaginator:
+    def __init__(self, queryset, per_page, ordering=('-created_at', '-id')):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = ordering
+        self.fields = [name.lstrip('-') for name in ordering]
+
+    def encode_cursor(self, obj, reverse):
+        values = [obj[field] if isinstance(obj, dict) else getattr(obj, field) for field in self.fields]
+        # isoformat(), а не DjangoJSONEncoder: он обрезает микросекунды, и курсор перескакивал бы строки
+        values = [value.isoformat() if isinstance(value, date) else value for value in values]
+        payload = json.dumps({'v': values, 'r': reverse}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        # Испорченный или чужой курсор означает первую страницу
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            values = payload['v']
+            if len(values) != len(self.fields):
+                return None
+            opts = self.queryset.model._meta
+            values = [opts.get_field(field).to_python(value) for field, value in zip(self.fields, values)]
+            return values, bool(payload['r'])
+        except Exception:
+            return None
+
+    def _seek(self, values, reverse):
+        # Раскрываем сравнение кортежей: (a, b) < (x, y)  =>  a < x OR (a = x AND b < y)
+        condition = Q()
+        for i, name in enumerate(self.ordering):
+            descending = name.startswith('-')
+            lookup = 'gt' if descending == reverse else 'lt'
+            equal = {field: value for field, value in zip(self.fields[:i], values[:i])}
+            condition |= Q(**equal, **{f'{self.fields[i]}__{lookup}': values[i]})
+        return condition
+
+    def _queryset(self, position):
+        reverse = bool(position and position[1])
+        ordering = self.ordering
+        if reverse:
+            ordering = [name[1:] if name.startswith('-') else f'-{name}' for name in ordering]
+        queryset = self.queryset.order_by(*ordering)
+        if position:
+            queryset = queryset.filter(self._seek(*position))
+        return queryset[:self.per_page + 1]
+
+    def _make_page(self, rows, position):
+        reverse = bool(position and position[1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+
+        if not rows:
+            return KeysetPage(rows)
+        # Идя вперёд, страницы позади точно есть, если пришли по курсору; идя назад - есть страницы впереди
+        has_next = has_more if not reverse else True
+        has_previous = has_more if reverse else position is not None
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1], reverse=False) if has_next else None,
+            previous_cursor=self.encode_cursor(rows[0], reverse=True) if has_previous else None,
+        )
+
+    def page(self, cursor=None):
+        position = self.decode_cursor(cursor) if cursor else None
+        return self._make_page(list(self._queryset(position)), position)
+
+    # То же для асинхронных представлений (async ORM)
+    async def apage(self, cursor=None):
+        position = self.decode_cursor(cursor) if cursor else None
+        return self._make_page([row async for row in self._queryset(position)], position)
+
+
+# Та же курсорная пагинация для DRF (GET /api/post/?cursor=...)
+class PostCursorPagination(BasePagination):
+    page_size = api_settings.PAGE_SIZE or 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering = ('-created_at', '-id')
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(page_size, self.max_page_size) if page_size > 0 else self.page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        paginator = KeysetPaginator(queryset, self.get_page_size(request), self.ordering)
+        self.page = paginator.page(request.query_params.get(self.cursor_query_param))
+        return list(self.page)
+
+    async def apaginate_queryset(self, queryset, request):
+        self.request = request
+        paginator = KeysetPaginator(queryset, self.get_page_size(request), self.ordering)
+        self.page = await paginator.apage(request.query_params.get(self.cursor_query_param))
+        return list(self.page)
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self._link(self.page.next_cursor),
+            'previous': self._link(self.page.previous_cursor),
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,21 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # orjson не установлен - работает стандартный JSONRenderer
+    orjson = None
+
+
+# JSON-рендерер на orjson: в несколько раз быстрее json.dumps на больших страницах.
+# Типы, которых orjson не знает (Decimal, ленивые строки переводов...), обрабатывает энкодер DRF.
+# Форматированный вывод (indent) и отсутствие orjson - через стандартный JSONRenderer
+class FastJSONRenderer(JSONRenderer):
+    _encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(data, default=self._encoder.default, option=orjson.OPT_NON_STR_KEYS)
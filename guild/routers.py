@@ -0,0 +1,110 @@
+import logging
+import random
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+# Псевдонимы реплик из DATABASES (только чтение, данные копируются с основной базы извне)
+DATABASE_REPLICAS = getattr(settings, 'DATABASE_REPLICAS', [])
+# Сколько секунд после записи чтения пользователя идут в основную базу (должно быть больше отставания реплик)
+REPLICA_PIN_SECONDS = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+# Через сколько секунд снова пробовать реплику, на которой была ошибка
+REPLICA_RETRY_AFTER = getattr(settings, 'REPLICA_RETRY_AFTER', 30)
+# Маршруты, чтения которых можно отдавать репликам (только GET/HEAD)
+REPLICA_READ_VIEWS = getattr(settings, 'REPLICA_READ_VIEWS', {'post-list', 'post-detail', 'response-list', 'post-api'})
+
+_routing = ContextVar('guild_db_routing', default=None)
+_down_until = {}
+
+
+# Состояние маршрутизации текущего запроса (ReplicaRoutingMiddleware):
+# replica - реплика для чтений (None - основная база), wrote - в запросе была запись,
+# replica_failed - чтение с реплики завершилось ошибкой, запрос нужно повторить
+class RequestRouting:
+    def __init__(self):
+        self.replica = None
+        self.wrote = False
+        self.replica_failed = False
+
+
+def current_routing():
+    return _routing.get()
+
+
+def start_request():
+    return _routing.set(RequestRouting())
+
+
+def end_request(token):
+    _routing.reset(token)
+
+
+# Чтения в блоке - из основной базы, даже если запросу назначена реплика. Для результатов, которые
+# сохраняются под текущим поколением данных (кэш страниц): отстающая реплика отдала бы данные до записи,
+# и они оставались бы в кэше до следующего изменения
+@contextmanager
+def use_primary():
+    routing = _routing.get()
+    if routing is None or routing.replica is None:
+        yield
+        return
+    replica, routing.replica = routing.replica, None
+    try:
+        yield
+    finally:
+        routing.replica = replica
+
+
+# То же, пока реплики могли не получить изменение, сделанное в момент changed_at (time.time())
+def use_primary_since(changed_at):
+    return use_primary() if time.time() - changed_at < REPLICA_PIN_SECONDS else nullcontext()
+
+
+def mark_down(alias):
+    _down_until[alias] = time.monotonic() + REPLICA_RETRY_AFTER
+    logger.warning('Реплика %s недоступна, чтения идут в основную базу %s с', alias, REPLICA_RETRY_AFTER)
+
+
+# Случайная доступная реплика или None. Соединение проверяется сразу: при CONN_MAX_AGE оно уже открыто,
+# а упавшая реплика исключается до того, как на ней начнёт выполняться представление
+def choose_replica():
+    now = time.monotonic()
+    candidates = [alias for alias in DATABASE_REPLICAS if _down_until.get(alias, 0) <= now]
+    random.shuffle(candidates)
+    for alias in candidates:
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            mark_down(alias)
+            continue
+        return alias
+    return None
+
+
+# Чтения из выбранных маршрутов - на реплику, всё остальное и любые записи - в основную базу.
+# Внутри транзакции на основной базе чтения тоже идут туда: транзакция должна видеть свои изменения
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if routing is None or routing.replica is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return routing.replica
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплик приходит вместе с данными
+        return False if db in DATABASE_REPLICAS else None
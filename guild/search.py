@@ -0,0 +1,257 @@
+import base64
+import json
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from guild.pagination import KeysetPage, KeysetPaginator
+
+# Вес заголовка относительно текста поста при ранжировании
+SEARCH_TITLE_WEIGHT = getattr(settings, 'SEARCH_TITLE_WEIGHT', 10.0)
+# Конфигурация текстового поиска PostgreSQL (simple, russian, english...)
+SEARCH_CONFIG = getattr(settings, 'SEARCH_CONFIG', 'simple')
+SEARCH_BATCH_SIZE = getattr(settings, 'SEARCH_BATCH_SIZE', 1000)
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+# Полнотекстовый индекс постов в SQLite: виртуальная таблица FTS5, rowid = id поста
+class SqliteSearchBackend:
+    table = 'guild_post_fts'
+    id_column = 'rowid'
+
+    def create(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+            f"title, content, updated_at UNINDEXED, tokenize='unicode61 remove_diacritics 2')"
+        )
+
+    def drop(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {self.table}')
+
+    # Пользовательский ввод не передаётся в MATCH как есть: из него берутся только слова,
+    # каждое ищется по префиксу, все слова обязательны
+    def match_expression(self, query):
+        words = WORD_RE.findall(query)
+        return ' '.join(f'"{word}"*' for word in words)
+
+    def match_sql(self):
+        return f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s'
+
+    def ranked_sql(self):
+        # bm25 в SQLite тем меньше, чем документ релевантнее
+        return (
+            f'SELECT rowid AS id, bm25({self.table}, %s, 1.0) AS score '
+            f'FROM {self.table} WHERE {self.table} MATCH %s',
+            [SEARCH_TITLE_WEIGHT],
+        )
+
+    def index(self, cursor, ids):
+        for chunk in _chunks(ids, SEARCH_BATCH_SIZE):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})', chunk)
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, title, content, updated_at) '
+                f'SELECT id, title, content, updated_at FROM guild_post WHERE id IN ({placeholders})',
+                chunk,
+            )
+
+    def remove(self, cursor, ids):
+        for chunk in _chunks(ids, SEARCH_BATCH_SIZE):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})', chunk)
+
+    def stale_ids(self, cursor):
+        cursor.execute(
+            f'SELECT p.id FROM guild_post p LEFT JOIN {self.table} f ON f.rowid = p.id '
+            f'WHERE f.rowid IS NULL OR f.updated_at IS NOT p.updated_at'
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+    def orphan_ids(self, cursor):
+        cursor.execute(
+            f'SELECT rowid FROM {self.table} WHERE rowid NOT IN (SELECT id FROM guild_post)'
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+# Полнотекстовый индекс постов в PostgreSQL: таблица с tsvector (заголовок - вес A, текст - вес B) и GIN-индексом
+class PostgresSearchBackend:
+    table = 'guild_post_search'
+    id_column = 'post_id'
+
+    def create(self, cursor):
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {self.table} ('
+            f'post_id bigint PRIMARY KEY, '
+            f'document tsvector NOT NULL, '
+            f'updated_at timestamp with time zone NOT NULL)'
+        )
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {self.table}_document_idx ON {self.table} USING GIN (document)'
+        )
+
+    def drop(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {self.table}')
+
+    def match_expression(self, query):
+        return ' '.join(WORD_RE.findall(query))
+
+    def match_sql(self):
+        return (
+            f'SELECT post_id FROM {self.table} '
+            f"WHERE document @@ websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+        )
+
+    def ranked_sql(self):
+        # Знак меняется, чтобы как и в SQLite меньшее значение означало более релевантный пост
+        return (
+            f'SELECT post_id AS id, -ts_rank(document, q) AS score '
+            f"FROM {self.table}, websearch_to_tsquery('{SEARCH_CONFIG}', %s) q WHERE document @@ q",
+            [],
+        )
+
+    def index(self, cursor, ids):
+        for chunk in _chunks(ids, SEARCH_BATCH_SIZE):
+            cursor.execute(
+                f'INSERT INTO {self.table} (post_id, document, updated_at) '
+                f"SELECT id, setweight(to_tsvector('{SEARCH_CONFIG}', title), 'A') || "
+                f"setweight(to_tsvector('{SEARCH_CONFIG}', content), 'B'), updated_at "
+                f'FROM guild_post WHERE id = ANY(%s) '
+                f'ON CONFLICT (post_id) DO UPDATE SET document = EXCLUDED.document, updated_at = EXCLUDED.updated_at',
+                [chunk],
+            )
+
+    def remove(self, cursor, ids):
+        for chunk in _chunks(ids, SEARCH_BATCH_SIZE):
+            cursor.execute(f'DELETE FROM {self.table} WHERE post_id = ANY(%s)', [chunk])
+
+    def stale_ids(self, cursor):
+        cursor.execute(
+            f'SELECT p.id FROM guild_post p LEFT JOIN {self.table} s ON s.post_id = p.id '
+            f'WHERE s.post_id IS NULL OR s.updated_at IS DISTINCT FROM p.updated_at'
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+    def orphan_ids(self, cursor):
+        cursor.execute(
+            f'SELECT post_id FROM {self.table} s '
+            f'WHERE NOT EXISTS (SELECT 1 FROM guild_post p WHERE p.id = s.post_id)'
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    'sqlite': SqliteSearchBackend(),
+    'postgresql': PostgresSearchBackend(),
+}
+
+
+# Бэкенд поиска для базы; для остальных СУБД полнотекстового индекса нет (None)
+def get_backend(using='default'):
+    return BACKENDS.get(connections[using].vendor)
+
+
+# Оставить в queryset только посты, подходящие под поисковый запрос
+def filter_queryset(queryset, query):
+    backend = get_backend(queryset.db)
+    if backend is None:
+        return queryset.filter(Q(title__icontains=query) | Q(content__icontains=query))
+    expression = backend.match_expression(query)
+    if not expression:
+        return queryset.none()
+    return queryset.filter(pk__in=RawSQL(backend.match_sql(), [expression]))
+
+
+def _encode_position(score, pk):
+    payload = json.dumps([score, pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def _decode_position(cursor):
+    try:
+        score, pk = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return float(score), int(pk)
+    except Exception:
+        return None
+
+
+# Страница результатов поиска, упорядоченных по релевантности.
+# Пагинация курсорная по (score, id): стоимость страницы зависит от числа совпадений,
+# а не от общего числа постов. queryset задаёт остальные фильтры (категория, дата)
+def search_page(queryset, query, per_page, cursor=None):
+    backend = get_backend(queryset.db)
+    if backend is None:
+        return KeysetPaginator(filter_queryset(queryset, query), per_page).page(cursor)
+    expression = backend.match_expression(query)
+    if not expression:
+        return KeysetPage([])
+
+    ranked, params = backend.ranked_sql()
+    ids_sql, ids_params = queryset.order_by().values('pk').query.sql_with_params()
+    sql = f'SELECT id, score FROM ({ranked} AND {backend.id_column} IN ({ids_sql})) ranked'
+    params = [*params, expression, *ids_params]
+    position = _decode_position(cursor) if cursor else None
+    if position:
+        sql += ' WHERE score > %s OR (score = %s AND id > %s)'
+        params += [position[0], position[0], position[1]]
+    sql += ' ORDER BY score, id LIMIT %s'
+    params.append(per_page + 1)
+
+    with connections[queryset.db].cursor() as db_cursor:
+        db_cursor.execute(sql, params)
+        hits = db_cursor.fetchall()
+
+    has_next = len(hits) > per_page
+    hits = hits[:per_page]
+    posts = {post.pk: post for post in queryset.filter(pk__in=[pk for pk, _ in hits])}
+    results = []
+    for pk, score in hits:
+        if pk in posts:
+            posts[pk].search_rank = -score
+            results.append(posts[pk])
+    next_cursor = _encode_position(hits[-1][1], hits[-1][0]) if has_next else None
+    return KeysetPage(results, next_cursor=next_cursor)
+
+
+# Обновление индекса для постов с данными id (после сохранения)
+def index_posts(ids, using='default'):
+    backend = get_backend(using)
+    if backend is not None and ids:
+        with connections[using].cursor() as cursor:
+            backend.index(cursor, list(ids))
+
+
+def remove_posts(ids, using='default'):
+    backend = get_backend(using)
+    if backend is not None and ids:
+        with connections[using].cursor() as cursor:
+            backend.remove(cursor, list(ids))
+
+
+# Инкрементальная переиндексация: только посты, которых нет в индексе или которые изменились
+# после индексации, и удаление из индекса несуществующих постов.
+# Возвращает (переиндексировано, удалено)
+def reindex(using='default', full=False):
+    backend = get_backend(using)
+    if backend is None:
+        return 0, 0
+    with connections[using].cursor() as cursor:
+        if full:
+            cursor.execute('SELECT id FROM guild_post')
+            stale = [row[0] for row in cursor.fetchall()]
+        else:
+            stale = backend.stale_ids(cursor)
+        orphans = backend.orphan_ids(cursor)
+        backend.index(cursor, stale)
+        backend.remove(cursor, orphans)
+    return len(stale), len(orphans)
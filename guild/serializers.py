@@ -1,9 +1,86 @@
-from rest_framework import serializers
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
 from .models import Post
 
 
-class PostSerializer(serializers.ModelSerializer):
+# Выборочные поля: ?fields=id,title,created_at - в ответе только перечисленные поля
+class SparseFieldsMixin:
+    fields_query_param = 'fields'
+
+    @classmethod
+    def requested_fields(cls, request):
+        value = request.query_params.get(cls.fields_query_param) if request is not None else None
+        if not value:
+            return None
+        return {name.strip() for name in value.split(',') if name.strip()}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+        requested = self.requested_fields(request)
+        if requested:
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+
+
+class PostSerializer(SparseFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Post
-        fields = ['author', 'title', 'content', 'category', 'image']
+        fields = ['id', 'author', 'title', 'content', 'category', 'image',
+                  'created_at', 'updated_at', 'response_count']
+        read_only_fields = ['created_at', 'updated_at', 'response_count']
+
+
+POST_READ_FIELDS = PostSerializer.Meta.fields
+
+
+# Быстрый путь чтения для API: строки берутся через .values() и превращаются в те же словари,
+# что выдаёт PostSerializer, без создания моделей и вызова полей DRF для каждой колонки.
+# id и created_at выбираются всегда - по ним строится курсор пагинации
+def post_values(queryset, fields=POST_READ_FIELDS):
+    columns = dict.fromkeys(['id', 'created_at', *fields])
+    return queryset.values(*columns)
+
+
+# Дата в формате DRF (ISO 8601 в текущем часовом поясе, UTC как 'Z'), но часовой пояс берётся
+# один раз на страницу, а не для каждого значения, как в DateTimeField.to_representation
+def _datetime_converter():
+    if api_settings.DATETIME_FORMAT != ISO_8601:
+        return serializers.DateTimeField().to_representation
+    tz = timezone.get_current_timezone()
+
+    def to_iso(value):
+        value = value.astimezone(tz).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+    return to_iso
+
+
+def _converters(fields, request):
+    to_iso = _datetime_converter()
+    storage = Post._meta.get_field('image').storage
+
+    def image_url(name):
+        if not name:
+            return None
+        url = storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+
+    converters = {'created_at': to_iso,
+                  'updated_at': to_iso,
+                  'image': image_url}
+    return [(name, converters.get(name)) for name in fields]
+
+
+def post_rows(rows, fields=POST_READ_FIELDS, request=None):
+    converters = _converters(fields, request)
+    return [
+        {name: convert(row[name]) if convert and row[name] is not None else row[name]
+         for name, convert in converters}
+        for row in rows
+    ]
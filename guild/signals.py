@@ -1,29 +1,192 @@
-from django.core.mail import send_mail
-from django.db.models.signals import post_save
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
 
 from MMORPG import settings
-from guild.models import Post, Subscription, Response
+from guild import counters, events
+from guild.caching import bump_board_generation, invalidate_post, refresh_post
+from guild.images import IMAGE_FIELDS, enqueue_images, variant_files
+from guild.mail import queue_mail
+from guild.metrics import SIGNAL_DURATION
+from guild.models import Post, Profile, Response, Subscription
+from guild.notifications import fan_out_new_post
+from guild.search import index_posts, remove_posts
+from guild.storage import release_files
+from guild.subscribers import subscription_changed
+
+_muted = ContextVar('guild_signals_muted', default=False)
+
+
+# Массовые операции (модерация, импорт) сами обновляют счётчики, кэш и рассылку одним проходом:
+# внутри muted() обработчики ниже для отдельных строк не срабатывают
+@contextmanager
+def muted():
+    token = _muted.set(True)
+    try:
+        yield
+    finally:
+        _muted.reset(token)
+
+
+# Все обработчики ниже обёрнуты этим декоратором, поэтому он же замеряет их время (метрика по имени функции)
+def unless_muted(handler):
+    @wraps(handler)
+    def wrapper(*args, **kwargs):
+        if not _muted.get():
+            started = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                SIGNAL_DURATION.observe(time.perf_counter() - started, handler=handler.__name__)
+    return wrapper
 
-#  Уведомление автору поста о новом отклике на его пост
+
+# Уведомление подписчикам категории о новом посте.
+# Рассылка после коммита: при откате поста письма не ставятся в очередь, а транзакция поста не ждёт рассылки
 @receiver(post_save, sender=Post)
+@unless_muted
 def send_new_post_notification(sender, instance, created, **kwargs):
     if created:
-        subscriptions = Subscription.objects.filter(category=instance.category, subscribed=True)
-        for subscription in subscriptions:
-            subject = 'Новый пост в подписанной категории!'
-            message = f'В категории {instance.category.name}, на которую вы подписаны, ' \
-                      f'появился новый пост: {instance.title}. Вы можете прочитать его, ' \
-                      f'перейдя по ссылке: http://127.0.0.1:8000/post/{instance.id}/'
-            send_mail(subject, message, settings.EMAIL_HOST_USER, [subscription.profile.user.email])
+        transaction.on_commit(lambda: fan_out_new_post(instance))
 
 
 # Уведомление автору отклика на пост при обобрении отклика
 @receiver(post_save, sender=Response)
+@unless_muted
 def send_approval_notification(sender, instance, created, **kwargs):
-    if not created and instance.is_approved:
+    if not created and instance.is_approved and not instance._loaded_is_approved:
         post_author = instance.author.user.email  # Получаем автора поста
         subject = 'Ваш отзыв одобрен'
         message = f'Ваш отзыв на пост "{instance.post}" был одобрен.'
-        send_mail(subject, message, settings.EMAIL_HOST_USER, [post_author])
+        queue_mail(subject, message, settings.EMAIL_HOST_USER, [post_author])
+
+
+# Поддержка полнотекстового индекса в актуальном состоянии (в той же транзакции, что и пост)
+@receiver(post_save, sender=Post)
+@unless_muted
+def update_search_index(sender, instance, using, **kwargs):
+    index_posts([instance.pk], using=using)
+
+
+@receiver(post_delete, sender=Post)
+@unless_muted
+def remove_from_search_index(sender, instance, using, **kwargs):
+    remove_posts([instance.pk], using=using)
+
+
+# Кэш снимков постов: обновляется после коммита, чтобы в кэш не попали незакоммиченные данные
+@receiver(post_save, sender=Post)
+@unless_muted
+def refresh_post_cache(sender, instance, **kwargs):
+    transaction.on_commit(lambda: refresh_post(instance.pk))
+    transaction.on_commit(bump_board_generation)
+
+
+@receiver(post_delete, sender=Post)
+@unless_muted
+def invalidate_deleted_post_cache(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: invalidate_post(pk))
+    transaction.on_commit(bump_board_generation)
+
+
+# Изменение откликов меняет счётчики откликов в снимке поста и в ленте
+@receiver(post_save, sender=Response)
+@receiver(post_delete, sender=Response)
+@unless_muted
+def invalidate_post_cache_on_response(sender, instance, **kwargs):
+    post_id = instance.post_id
+    transaction.on_commit(lambda: invalidate_post(post_id))
+    transaction.on_commit(bump_board_generation)
+
+
+# Счётчики откликов у поста и у автора поста
+@receiver(post_save, sender=Response)
+@unless_muted
+def update_response_counters(sender, instance, created, **kwargs):
+    if created:
+        counters.responses_created([(instance.post_id, instance.is_approved)])
+    elif instance.is_approved and not instance._loaded_is_approved:
+        counters.responses_approved([instance.post_id])
+    elif not instance.is_approved and instance._loaded_is_approved:
+        counters.responses_unapproved([instance.post_id])
+
+
+@receiver(post_delete, sender=Response)
+@unless_muted
+def update_response_counters_on_delete(sender, instance, **kwargs):
+    counters.responses_deleted([(instance.post_id, instance.is_approved)])
+
+
+# События для потоков SSE (guild/events.py): новый отклик - автору поста, одобрение - автору отклика,
+# любое изменение очереди модерации - новое число ожидающих автору поста
+@receiver(post_save, sender=Response)
+@unless_muted
+def publish_response_events(sender, instance, created, **kwargs):
+    response_id, post_id = instance.pk, instance.post_id
+    if created:
+        transaction.on_commit(lambda: events.publish_responses_created([response_id]))
+    elif instance.is_approved and not instance._loaded_is_approved:
+        transaction.on_commit(lambda: events.publish_responses_approved([response_id]))
+    elif not instance.is_approved and instance._loaded_is_approved:
+        transaction.on_commit(lambda: events.publish_moderation([post_id]))
+
+
+@receiver(post_delete, sender=Response)
+@unless_muted
+def publish_response_events_on_delete(sender, instance, **kwargs):
+    if not instance.is_approved:
+        post_id = instance.post_id
+        transaction.on_commit(lambda: events.publish_moderation([post_id]))
+
+
+# Новые и заменённые изображения - в очередь на создание уменьшенных копий
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Profile)
+@unless_muted
+def enqueue_image_processing(sender, instance, **kwargs):
+    enqueue_images(instance)
+
+
+# Файлы изображений освобождаются после коммита: при замене - старый оригинал (старые копии удалит
+# process_images, записав новые), при удалении объекта - оригинал и все копии.
+# Загрузка того же содержимого даёт то же имя, но ещё одну ссылку на файл - старая тоже освобождается
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Profile)
+@unless_muted
+def release_replaced_image(sender, instance, created, **kwargs):
+    for model, field, _ in IMAGE_FIELDS.values():
+        if sender is model and not created:
+            loaded = getattr(instance, f'_loaded_{field}')
+            file = getattr(instance, field)
+            if loaded and (loaded != file.name or getattr(instance, f'_{field}_uploaded')):
+                release_files(file.storage, [loaded])
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Profile)
+@unless_muted
+def release_deleted_images(sender, instance, **kwargs):
+    for model, field, variants_field in IMAGE_FIELDS.values():
+        if sender is model:
+            file = getattr(instance, field)
+            release_files(file.storage, [file.name, *variant_files(getattr(instance, variants_field))])
+
+
+# Индекс подписчиков в кэше правится после коммита подписки или отписки
+@receiver(post_save, sender=Subscription)
+@unless_muted
+def update_subscriber_index(sender, instance, **kwargs):
+    subscription_changed(instance)
+
+
+@receiver(post_delete, sender=Subscription)
+@unless_muted
+def update_subscriber_index_on_delete(sender, instance, **kwargs):
+    subscription_changed(instance, deleted=True)
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+SQLITE_PRAGMAS = getattr(settings, 'SQLITE_PRAGMAS', {})
+SQLITE_JOURNAL_MODE = getattr(settings, 'SQLITE_JOURNAL_MODE', None)
+
+
+# Настройка соединений с SQLite для работы под нагрузкой (settings.SQLITE_PRAGMAS).
+# Эти PRAGMA действуют только на соединение, поэтому применяются к каждому новому соединению;
+# при CONN_MAX_AGE это происходит редко. Режим журнала хранится в файле базы и включается
+# миграцией (set_journal_mode)
+
+def apply_pragmas(cursor, pragmas):
+    # busy_timeout первым: переключение журнала тоже ждёт, если базу держит другой процесс
+    for name in sorted(pragmas, key=lambda name: name != 'busy_timeout'):
+        cursor.execute(f'PRAGMA {name} = {pragmas[name]}')
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite' and SQLITE_PRAGMAS:
+        with connection.cursor() as cursor:
+            apply_pragmas(cursor, SQLITE_PRAGMAS)
+
+
+# Переключение режима журнала; вне транзакции, иначе SQLite его не меняет
+def set_journal_mode(connection, mode):
+    if connection.vendor == 'sqlite' and mode:
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA journal_mode = {mode}')
@@ -0,0 +1,17 @@
+from django.db import DEFAULT_DB_ALIAS
+from django.db.backends.sqlite3 import base
+
+
+# SQLite с транзакциями BEGIN IMMEDIATE (ENGINE 'guild.sqlite_backend').
+# Транзакция, начатая обычным BEGIN, берёт блокировку на запись только при первом изменении;
+# если к этому моменту другой писатель уже закоммитил, SQLite сразу возвращает "database is locked",
+# не дожидаясь busy_timeout (типичный случай - get_or_create в atomic). IMMEDIATE берёт блокировку
+# в начале транзакции, и конкурирующие писатели ждут друг друга в пределах busy_timeout.
+# Только для основной базы: все записи идут в неё (guild.routers), а транзакции на репликах
+# только читают, и блокировка на запись заняла бы файл реплики, который обновляется извне
+class DatabaseWrapper(base.DatabaseWrapper):
+    def _start_transaction_under_autocommit(self):
+        if self.alias == DEFAULT_DB_ALIAS:
+            self.cursor().execute('BEGIN IMMEDIATE')
+        else:
+            super()._start_transaction_under_autocommit()
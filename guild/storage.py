@@ -0,0 +1,103 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from guild.models import StoredBlob
+
+
+def file_digest(content):
+    sha256 = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        sha256.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return sha256.hexdigest()
+
+
+# Хранилище с адресацией по содержимому: файл лежит под своим sha256
+#   images/a.jpg -> images/3f/a2/3fa2...e9.jpg
+# Одинаковые файлы хранятся один раз; StoredBlob.refcount считает ссылки на файл, delete() уменьшает
+# счётчик и удаляет файл вместе с последней ссылкой. Файлы, сохранённые до перехода на это хранилище
+# (без StoredBlob), удаляются как обычно
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # Итоговое имя определяется содержимым в _save, переименовывать исходное не нужно
+        return name
+
+    def digest_name(self, name, digest):
+        directory, filename = posixpath.split(name.replace('\\', '/'))
+        extension = os.path.splitext(filename)[1].lower()
+        return posixpath.join(directory, digest[:2], digest[2:4], f'{digest}{extension}')
+
+    def _write(self, name, content):
+        # Запись во временный файл рядом и атомарная замена: параллельная загрузка того же содержимого
+        # не увидит недописанный файл
+        path = self.path(name)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    tmp.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp_path, self.file_permissions_mode)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _save(self, name, content):
+        digest = file_digest(content)
+        with transaction.atomic():
+            blob = StoredBlob.objects.select_for_update().filter(digest=digest).first()
+            if blob is not None:
+                StoredBlob.objects.filter(pk=blob.pk).update(refcount=F('refcount') + 1)
+                if not self.exists(blob.name):
+                    self._write(blob.name, content)
+                return blob.name
+
+            target = self.digest_name(name, digest)
+            self._write(target, content)
+            try:
+                with transaction.atomic():
+                    StoredBlob.objects.create(digest=digest, name=target, size=content.size)
+            except IntegrityError:
+                # Тот же файл одновременно сохранил другой процесс
+                StoredBlob.objects.filter(digest=digest).update(refcount=F('refcount') + 1)
+                target = StoredBlob.objects.get(digest=digest).name
+        return target
+
+    def delete(self, name):
+        with transaction.atomic():
+            blob = StoredBlob.objects.select_for_update().filter(name=name).first()
+            if blob is None:
+                return super().delete(name)
+            if blob.refcount > 1:
+                StoredBlob.objects.filter(pk=blob.pk).update(refcount=F('refcount') - 1)
+                return
+            blob.delete()
+            # Файл удаляется под блокировкой строки: параллельный _save того же содержимого дождётся
+            # коммита, не найдёт StoredBlob и запишет файл заново
+            super().delete(name)
+
+
+# Освободить файлы, на которые больше не ссылается объект (после коммита удаления или замены)
+def release_files(storage, names):
+    names = [name for name in names if name]
+
+    def release():
+        for name in names:
+            storage.delete(name)
+
+    if names:
+        transaction.on_commit(release)
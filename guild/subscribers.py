@@ -0,0 +1,121 @@
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from guild.models import Profile, Subscription
+
+SUBSCRIBERS_CACHE_TIMEOUT = getattr(settings, 'SUBSCRIBERS_CACHE_TIMEOUT', 60 * 10)
+LOCK_TIMEOUT = 5
+
+
+# Индекс подписок в кэше:
+#   subscribers:category:<id> - активные подписчики категории по способу доставки,
+#                               {delivery: упакованный массив profile_id}
+#   subscribers:user:<id>     - упакованный массив id категорий, на которые подписан пользователь
+#                               (по id пользователя: для проверки на странице профиль не загружается)
+# Индекс строится из базы при первом обращении (частичный индекс subscription_subscribed_idx)
+# и после коммита подписки/отписки правится на месте, а не перестраивается.
+# Правка - чтение и запись под коротким замком; ключи subscribers: исключены из LRU процесса
+# (LOCAL_EXCLUDE в settings.CACHES), иначе правка начиналась бы с устаревшей копии и затирала
+# подписки, добавленные другим процессом. Если замок занят, ключ удаляется и индекс
+# перестраивается при следующем чтении. Таймаут ограничивает время жизни возможного
+# расхождения (построение из базы, начатое до коммита, записанное после правки)
+
+def _category_key(category_id):
+    return f'subscribers:category:{category_id}'
+
+
+def _user_key(user_id):
+    return f'subscribers:user:{user_id}'
+
+
+# 8 байт на id вместо объекта int и элемента множества
+def _pack(ids):
+    return array('q', sorted(ids)).tobytes()
+
+
+def _unpack(data):
+    ids = array('q')
+    ids.frombytes(data)
+    return set(ids)
+
+
+def _build_category(category_id):
+    buckets = {delivery: set() for delivery, _ in Subscription.DELIVERY_CHOICES}
+    rows = Subscription.objects.filter(category_id=category_id, subscribed=True).values_list('delivery', 'profile_id')
+    for delivery, profile_id in rows:
+        buckets.setdefault(delivery, set()).add(profile_id)
+    cache.add(_category_key(category_id), {delivery: _pack(ids) for delivery, ids in buckets.items()},
+              SUBSCRIBERS_CACHE_TIMEOUT)
+    return buckets
+
+
+# Подписчики категории: {delivery: множество profile_id}
+def category_subscribers(category_id):
+    data = cache.get(_category_key(category_id))
+    if data is None:
+        return _build_category(category_id)
+    return {delivery: _unpack(packed) for delivery, packed in data.items()}
+
+
+def subscribed_categories(user_id):
+    data = cache.get(_user_key(user_id))
+    if data is None:
+        ids = Subscription.objects.filter(profile__user_id=user_id, subscribed=True).values_list('category_id', flat=True)
+        data = _pack(ids)
+        cache.add(_user_key(user_id), data, SUBSCRIBERS_CACHE_TIMEOUT)
+    return _unpack(data)
+
+
+def is_subscribed(user_id, category_id):
+    return category_id in subscribed_categories(user_id)
+
+
+def _patch(key, change):
+    lock = f'{key}:lock'
+    if not cache.add(lock, 1, LOCK_TIMEOUT):
+        cache.delete(key)
+        return
+    try:
+        data = cache.get(key)
+        if data is not None:
+            cache.set(key, change(data), SUBSCRIBERS_CACHE_TIMEOUT)
+    finally:
+        cache.delete(lock)
+
+
+def _apply(profile_id, user_id, category_id, delivery):
+    # delivery=None - подписка снята или удалена
+    def change_category(data):
+        buckets = {key: _unpack(packed) for key, packed in data.items()}
+        for key, ids in buckets.items():
+            ids.discard(profile_id)
+        if delivery is not None:
+            buckets.setdefault(delivery, set()).add(profile_id)
+        return {key: _pack(ids) for key, ids in buckets.items()}
+
+    def change_user(data):
+        ids = _unpack(data)
+        if delivery is None:
+            ids.discard(category_id)
+        else:
+            ids.add(category_id)
+        return _pack(ids)
+
+    _patch(_category_key(category_id), change_category)
+    if user_id is None:
+        user_id = Profile.objects.filter(pk=profile_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        _patch(_user_key(user_id), change_user)
+
+
+# Вызывается при сохранении/удалении подписки; кэш правится только после коммита
+def subscription_changed(subscription, deleted=False):
+    delivery = subscription.delivery if subscription.subscribed and not deleted else None
+    profile_id, category_id = subscription.profile_id, subscription.category_id
+    # Профиль обычно уже загружен вызывающим кодом; если нет - user_id ищется после коммита
+    user_id = subscription.profile.user_id if Subscription.profile.is_cached(subscription) else None
+    transaction.on_commit(lambda: _apply(profile_id, user_id, category_id, delivery))
+
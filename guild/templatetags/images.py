@@ -0,0 +1,32 @@
+from django import template
+from django.utils.html import format_html
+
+from guild.images import variants_ready
+
+register = template.Library()
+
+
+# Адаптивное изображение: <picture> с WebP и исходным форматом в srcset, браузер выбирает ширину
+# по sizes. Пока копии не готовы (или файл заменён), отдаётся оригинал с loading="lazy":
+#   {% responsive_image post.image post.image_variants alt=post.title sizes="300px" %}
+@register.simple_tag
+def responsive_image(file, variants, alt='', sizes='100vw', css_class=''):
+    if not file:
+        return ''
+    if not variants_ready(file, variants):
+        return format_html('<img src="{}" alt="{}" class="{}" loading="lazy">', file.url, alt, css_class)
+
+    storage = file.storage
+    items = variants['variants']
+
+    def srcset(key):
+        return ', '.join(f'{storage.url(variant[key])} {variant["width"]}w' for variant in items)
+
+    default = items[-1]
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" class="{}" loading="lazy" '
+        'decoding="async"></picture>',
+        srcset('webp'), sizes, storage.url(default['src']), srcset('src'), sizes,
+        default['width'], default['height'], alt, css_class,
+    )
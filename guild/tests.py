@@ -0,0 +1,1297 @@
+import hashlib
+import io
+import json
+import re
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from functools import wraps
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, Permission, User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.template.response import SimpleTemplateResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, resolve, reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from django.views import generic
+from PIL import Image as PILImage
+from rest_framework.renderers import JSONRenderer
+
+from MMORPG import settings as project_settings
+from services.modules.mixins import AnonymousPageCacheMixin
+
+from . import events, metrics, routers
+from .async_views import AsyncPostDetailView, AsyncPostListAPIView, AsyncPostListView, AsyncResponseView
+from .benchmarks.scenarios import SCENARIOS, World, run_scenario
+from .benchmarks.world import clear_world, seed_world
+from .cache_backends import TieredCache
+from .caching import board_generation, generation_time
+from .counters import recount_all
+from .images import process_image_batch
+from .mail import OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_BACKOFF, queue_mail, queue_mass_mail, send_outbox_batch
+from .models import Category, ImageJob, OutboxEmail, Post, Profile, Response, StoredBlob, Subscription
+from .moderation import approve_responses
+from .notifications import send_digests
+from .search import search_page
+from .subscribers import category_subscribers, subscription_changed
+from .serializers import PostSerializer
+from .sqlite_backend.base import DatabaseWrapper as SqliteDatabaseWrapper
+from .views import PostListView
+
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'guild.cache_backends.TieredCache',
+        'OPTIONS': project_settings.CACHES['default']['OPTIONS'],
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# Маршруты сайта с асинхронными представлениями чтения, как при ASYNC_READ_VIEWS
+urlpatterns = [
+    path('', AsyncPostListView.as_view(), name='post-list'),
+    path('post/<int:pk>/', AsyncPostDetailView.as_view(), name='post-detail'),
+    path('post/<int:post_pk>/responses/', AsyncResponseView.as_view(), name='response-list'),
+    path('api/post/', AsyncPostListAPIView.as_view(), name='post-api'),
+    path('', include('MMORPG.urls')),
+]
+
+
+# SMTP-сервер недоступен: соединение не открывается
+class RefusingEmailBackend(BaseEmailBackend):
+    opened = 0
+
+    def open(self):
+        self.opened += 1
+        raise ConnectionRefusedError('Connection refused')
+
+    def send_messages(self, email_messages):
+        self.open()
+
+
+# Очередь писем: отправка, повтор с растущей задержкой, мёртвые письма после OUTBOX_MAX_ATTEMPTS
+class OutboxTests(TestCase):
+    def test_sent(self):
+        email = queue_mail('Тема', 'Текст', None, ['reader@example.com'], html_message='<p>Текст</p>')
+        self.assertEqual(send_outbox_batch(), (1, 0, 0))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboxEmail.STATUS_SENT, 1))
+        self.assertEqual(mail.outbox[0].to, ['reader@example.com'])
+        self.assertEqual(mail.outbox[0].alternatives, [('<p>Текст</p>', 'text/html')])
+        self.assertEqual(send_outbox_batch(), (0, 0, 0))
+
+    def test_retry_with_backoff(self):
+        email = queue_mail('Тема', 'Текст', None, ['reader@example.com'])
+        for attempt in (1, 2):
+            OutboxEmail.objects.update(next_attempt_at=timezone.now())
+            started = timezone.now()
+            self.assertEqual(send_outbox_batch(connection=RefusingEmailBackend()), (0, 1, 0))
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), (OutboxEmail.STATUS_PENDING, attempt))
+            self.assertIn('ConnectionRefusedError', email.last_error)
+            delay = (email.next_attempt_at - started).total_seconds()
+            self.assertAlmostEqual(delay, OUTBOX_RETRY_BACKOFF * 2 ** (attempt - 1), delta=5)
+        # следующая попытка ещё не наступила
+        self.assertEqual(send_outbox_batch(), (0, 0, 0))
+        self.assertEqual(mail.outbox, [])
+
+    # Недоступный SMTP прерывает пачку: один таймаут вместо таймаута на каждое письмо
+    def test_connection_failure_stops_batch(self):
+        first, *rest = [queue_mail('Тема', 'Текст', None, [f'reader{i}@example.com']) for i in range(3)]
+        backend = RefusingEmailBackend()
+        started = timezone.now()
+        self.assertEqual(send_outbox_batch(connection=backend), (0, 1, 0))
+        self.assertEqual(backend.opened, 1)
+        first.refresh_from_db()
+        self.assertEqual(first.attempts, 1)
+        for email in rest:
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts, email.last_error), (OutboxEmail.STATUS_PENDING, 0, ''))
+            self.assertGreater(email.next_attempt_at, started)
+        self.assertEqual(send_outbox_batch(), (0, 0, 0))
+
+    def test_dead_letter(self):
+        email = queue_mail('Тема', 'Текст', None, ['reader@example.com'])
+        OutboxEmail.objects.update(attempts=OUTBOX_MAX_ATTEMPTS - 1)
+        self.assertEqual(send_outbox_batch(connection=RefusingEmailBackend()), (0, 0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboxEmail.STATUS_DEAD, OUTBOX_MAX_ATTEMPTS))
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(send_outbox_batch(), (0, 0, 0))
+
+
+# Сводка: новые посты из всех подписок пользователя - одно письмо, затем отметка last_digest_at
+@override_settings(CACHES=TEST_CACHES)
+class DigestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', 'author@example.com', 'password')
+        cls.author_profile = Profile.objects.create(user=author, email_confirmed=True)
+        cls.categories = [Category.objects.create(name=name) for name in ('Танки', 'Хилы')]
+        for username, delivery in (('hourly', Subscription.DELIVERY_HOURLY), ('daily', Subscription.DELIVERY_DAILY)):
+            user = User.objects.create_user(username, f'{username}@example.com', 'password')
+            profile = Profile.objects.create(user=user, email_confirmed=True)
+            for category in cls.categories:
+                Subscription.objects.create(profile=profile, category=category, subscribed=True, delivery=delivery)
+
+    def test_posts_collapse_into_one_email(self):
+        for i, category in enumerate(self.categories * 2):
+            Post.objects.create(author=self.author_profile, title=f'Пост {i}', content='Текст', category=category)
+        now = timezone.now()
+        self.assertEqual(send_digests(Subscription.DELIVERY_HOURLY, now=now), 1)
+        digest = OutboxEmail.objects.get()
+        self.assertEqual(digest.to, ['hourly@example.com'])
+        self.assertEqual([line.split(': ')[0] for line in digest.body.splitlines()[2:]],
+                         ['[Танки] Пост 0', '[Хилы] Пост 1', '[Танки] Пост 2', '[Хилы] Пост 3'])
+        hourly = Subscription.objects.filter(delivery=Subscription.DELIVERY_HOURLY)
+        self.assertEqual(set(hourly.values_list('last_digest_at', flat=True)), {now})
+        self.assertFalse(Subscription.objects.filter(delivery=Subscription.DELIVERY_DAILY,
+                                                     last_digest_at__isnull=False).exists())
+        # уже отправленные посты во вторую сводку не попадают
+        self.assertEqual(send_digests(Subscription.DELIVERY_HOURLY, now=timezone.now()), 0)
+
+    # Письма подписчикам с мгновенной доставкой ставятся в очередь после коммита поста
+    def test_immediate_notice_after_commit(self):
+        cache.clear()
+        user = User.objects.create_user('immediate', 'immediate@example.com', 'password')
+        profile = Profile.objects.create(user=user, email_confirmed=True)
+        Subscription.objects.create(profile=profile, category=self.categories[0], subscribed=True,
+                                    delivery=Subscription.DELIVERY_IMMEDIATE)
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(author=self.author_profile, title='Пост', content='Текст',
+                                category=self.categories[0])
+            self.assertFalse(OutboxEmail.objects.exists())
+        self.assertEqual(list(OutboxEmail.objects.values_list('to', flat=True)), [['immediate@example.com']])
+
+        # форма подписки на другую категорию: по умолчанию выбрана мгновенная доставка
+        other = Post.objects.create(author=self.author_profile, title='Пост', content='Текст',
+                                    category=self.categories[1])
+        self.client.force_login(user)
+        page = self.client.get(reverse('post-detail', kwargs={'pk': other.pk}))
+        self.assertContains(page, '<option value="immediate" selected>')
+
+
+# Курсорная пагинация ленты: проход вперёд и назад по постам с одинаковым created_at
+@override_settings(CACHES=TEST_CACHES)
+class PostListPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', 'author@example.com', 'password')
+        profile = Profile.objects.create(user=cls.user, email_confirmed=True)
+        category = Category.objects.create(name='Танки')
+        for i in range(25):
+            Post.objects.create(author=profile, title=f'Пост {i}', content='Текст', category=category)
+        # все посты в одну микросекунду: порядок и курсор держатся на id
+        Post.objects.update(created_at=timezone.now())
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def get_page(self, cursor=None):
+        response = self.client.get(reverse('post-list'), {'cursor': cursor} if cursor else {})
+        self.assertEqual(response.status_code, 200)
+        return response.context['posts']
+
+    def test_walk_forward_and_back(self):
+        pages = [self.get_page()]
+        while pages[-1].has_next():
+            pages.append(self.get_page(pages[-1].next_cursor))
+        ids = [post.pk for page in pages for post in page]
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual(ids, list(Post.objects.order_by('-id').values_list('id', flat=True)))
+        self.assertFalse(pages[0].has_previous())
+
+        page = pages[-1]
+        for expected in reversed(pages[:-1]):
+            page = self.get_page(page.previous_cursor)
+            self.assertEqual([post.pk for post in page], [post.pk for post in expected])
+        self.assertFalse(page.has_previous())
+
+    def test_bad_cursor_is_first_page(self):
+        first = [post.pk for post in self.get_page()]
+        for cursor in ('garbage', 'eyJ2IjpbMV0sInIiOmZhbHNlfQ', '%%%'):
+            self.assertEqual([post.pk for post in self.get_page(cursor)], first)
+
+
+# Полнотекстовый поиск FTS5: заголовок важнее текста, индекс следует за правкой и удалением постов,
+# reindex_posts догоняет изменения, прошедшие мимо сигналов
+@unittest.skipUnless(connection.vendor == 'sqlite', 'индекс FTS5 есть только в SQLite')
+@override_settings(CACHES=TEST_CACHES)
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', 'author@example.com', 'password')
+        profile = Profile.objects.create(user=author, email_confirmed=True)
+        category = Category.objects.create(name='Танки')
+        cls.in_content = Post.objects.create(author=profile, title='Ищу группу', content='Нужен хил на рейд',
+                                             category=category)
+        cls.in_title = Post.objects.create(author=profile, title='Рейд в субботу', content='Сбор в 20:00',
+                                           category=category)
+        Post.objects.create(author=profile, title='Продам меч', content='Недорого', category=category)
+
+    def search(self, query):
+        return [post.pk for post in search_page(Post.objects.all(), query, per_page=10)]
+
+    def test_ranking(self):
+        self.assertEqual(self.search('рейд'), [self.in_title.pk, self.in_content.pk])
+        self.assertEqual(self.search('рей хил'), [self.in_content.pk])
+        self.assertEqual(self.search('"*'), [])
+
+    def test_edit_and_delete(self):
+        self.in_title.title = 'Подземелье в субботу'
+        self.in_title.save()
+        self.assertEqual(self.search('рейд'), [self.in_content.pk])
+        self.assertEqual(self.search('подземелье'), [self.in_title.pk])
+        self.in_content.delete()
+        self.assertEqual(self.search('рейд'), [])
+
+    def test_reindex_command(self):
+        # update() не вызывает сигналы: индекс отстаёт, пока не запущена переиндексация
+        Post.objects.filter(pk=self.in_content.pk).update(title='Ищу танка', updated_at=timezone.now())
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO guild_post_fts (rowid, title, content) VALUES (999999, 'Танк', '')")
+        self.assertEqual(self.search('танка'), [])
+        out = io.StringIO()
+        call_command('reindex_posts', stdout=out)
+        self.assertIn('Проиндексировано: 1, удалено из индекса: 1', out.getvalue())
+        self.assertEqual(self.search('танка'), [self.in_content.pk])
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM guild_post_fts')
+            self.assertEqual(cursor.fetchone()[0], 3)
+
+
+# Фильтр по дню: границы суток - в часовом поясе из сессии, а не в UTC
+@override_settings(CACHES=TEST_CACHES)
+class PostDateFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', 'author@example.com', 'password')
+        profile = Profile.objects.create(user=author, email_confirmed=True)
+        category = Category.objects.create(name='Танки')
+        # Asia/Vladivostok - UTC+10: 10 марта по местному времени - с 9 марта 14:00 до 10 марта 14:00 UTC
+        for title, created_at in (('До полуночи', '2024-03-09T13:59:59+00:00'),
+                                  ('Начало дня', '2024-03-09T14:00:00+00:00'),
+                                  ('Конец дня', '2024-03-10T13:59:59+00:00'),
+                                  ('Следующий день', '2024-03-10T14:00:00+00:00')):
+            post = Post.objects.create(author=profile, title=title, content='Текст', category=category)
+            Post.objects.filter(pk=post.pk).update(created_at=created_at)
+
+    def setUp(self):
+        cache.clear()
+        session = self.client.session
+        session['django_timezone'] = 'Asia/Vladivostok'
+        session.save()
+
+    def test_day_in_session_timezone(self):
+        response = self.client.get(reverse('post-list'), {'created_at': '2024-03-10'})
+        self.assertEqual([post.title for post in response.context['posts']], ['Конец дня', 'Начало дня'])
+        data = self.client.get(reverse('post-api'), {'created_at': '2024-03-10'}).json()
+        self.assertEqual([post['title'] for post in data['results']], ['Конец дня', 'Начало дня'])
+
+    def test_invalid_date(self):
+        response = self.client.get(reverse('post-list'), {'created_at': '2024-02-30'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['posts']), [])
+        response = self.client.get(reverse('post-api'), {'created_at': '2024-02-30'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('created_at', response.json())
+
+
+# Страница поста строится из снимка в кэше: правка поста или откликов меняет версию снимка,
+# удалённый или ещё не созданный пост не отдаётся из старой версии
+@override_settings(CACHES=TEST_CACHES)
+class PostSnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', 'author@example.com', 'password')
+        cls.profile = Profile.objects.create(user=author, email_confirmed=True)
+        reader = User.objects.create_user('reader', 'reader@example.com', 'password')
+        cls.reader_profile = Profile.objects.create(user=reader, email_confirmed=True)
+        cls.category = Category.objects.create(name='Танки')
+        cls.post = Post.objects.create(author=cls.profile, title='Старый заголовок', content='Текст',
+                                       category=cls.category)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_post_and_response_changes(self):
+        url = reverse('post-detail', kwargs={'pk': self.post.pk})
+        self.assertContains(self.client.get(url), 'Старый заголовок')
+        self.post.title = 'Новый заголовок'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.save()
+        self.assertContains(self.client.get(url), 'Новый заголовок')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Response.objects.create(post=self.post, author=self.reader_profile, content='Отклик', is_approved=True)
+        self.assertContains(self.client.get(url), 'Все отзывы (1)')
+
+    def test_missing_post(self):
+        url = reverse('post-detail', kwargs={'pk': self.post.pk})
+        self.assertEqual(self.client.get(url).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.filter(pk=self.post.pk).delete()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        # 404 не кэшируется: пост, созданный позже с этим id, виден сразу
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(pk=self.post.pk, author=self.profile, title='Снова здесь', content='Текст',
+                                category=self.category)
+        self.assertContains(self.client.get(url), 'Снова здесь')
+
+
+# Два процесса с общим кэшем: значение из LRU процесса может отставать не дольше LOCAL_TIMEOUT,
+# ключи из LOCAL_EXCLUDE всегда читаются из общего кэша, пересчёт при промахе - один на всех
+@override_settings(CACHES=TEST_CACHES)
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        options = {'SHARED': 'shared', 'LOCAL_EXCLUDE': [r':version$'], 'LOCK_WAIT': 0.2}
+        self.first = TieredCache('', {'OPTIONS': options})
+        self.second = TieredCache('', {'OPTIONS': options})
+
+    def test_local_and_shared_tiers(self):
+        self.first.set('post:1', 'старое')
+        self.assertEqual(self.second.get('post:1'), 'старое')
+        self.first.set('post:1', 'новое')
+        self.assertEqual(caches['shared'].get('post:1'), 'новое')
+        self.assertEqual(self.second.get('post:1'), 'старое')
+        self.assertEqual(self.second.stats()['post'], {'local_hits': 1, 'shared_hits': 1, 'misses': 0})
+        self.second.delete('post:1')
+        self.assertIsNone(self.first.get('post:1', version=2))
+        self.assertIsNone(self.second.get('post:1'))
+
+    def test_local_exclude(self):
+        self.first.set('post:1:version', 'a')
+        self.assertEqual(self.second.get('post:1:version'), 'a')
+        self.first.set('post:1:version', 'b')
+        self.assertEqual(self.second.get('post:1:version'), 'b')
+        self.assertEqual(self.second.stats()['post'], {'local_hits': 0, 'shared_hits': 2, 'misses': 0})
+
+    def test_get_or_set_single_flight(self):
+        compute = mock.Mock(return_value='снимок')
+        self.assertEqual(self.first.get_or_set('post:1:v1', compute, 60), 'снимок')
+        self.assertEqual(self.second.get_or_set('post:1:v1', compute, 60), 'снимок')
+        self.assertEqual(compute.call_count, 1)
+
+        # ключ пересчитывает другой процесс: ждём его результата, а не идём в базу
+        caches['shared'].add('post:2:v1:lock', 1)
+        threading.Timer(0.05, caches['shared'].set, ('post:2:v1', 'от соседа')).start()
+        self.assertEqual(self.second.get_or_set('post:2:v1', compute, 60), 'от соседа')
+        self.assertEqual(compute.call_count, 1)
+
+    def test_aget_or_set(self):
+        async def compute():
+            return 'снимок'
+
+        self.assertEqual(async_to_sync(self.first.aget_or_set)('post:1:v1', compute, 60), 'снимок')
+        self.assertEqual(self.second.get('post:1:v1'), 'снимок')
+        self.assertIsNone(caches['shared'].get('post:1:v1:lock'))
+
+
+# Анонимным читателям страница отдаётся из кэша без запросов к базе, пока не сменится поколение ленты
+@override_settings(CACHES=TEST_CACHES)
+class AnonymousPageCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', 'author@example.com', 'password')
+        cls.profile = Profile.objects.create(user=author, email_confirmed=True)
+        cls.category = Category.objects.create(name='Танки')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_post_list(self):
+        Post.objects.create(author=self.profile, title='Первый пост', content='Текст', category=self.category)
+        self.assertContains(self.client.get(reverse('post-list')), 'Первый пост')
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(reverse('post-list')), 'Первый пост')
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(author=self.profile, title='Второй пост', content='Текст', category=self.category)
+        self.assertContains(self.client.get(reverse('post-list')), 'Второй пост')
+
+    # Страница с CSRF-токеном или изменённой сессией рендерится заново для каждого читателя
+    def test_personal_pages_not_cached(self):
+        rendered = []
+
+        class View(AnonymousPageCacheMixin, generic.View):
+            def get(self, request):
+                rendered.append(request.path)
+                if request.path == '/csrf/':
+                    get_token(request)
+                else:
+                    request.session['seen'] = True
+                return HttpResponse('ok')
+
+        for path in ('/csrf/', '/csrf/', '/session/', '/session/'):
+            request = RequestFactory().get(path)
+            request.user = AnonymousUser()
+            request.session = SessionStore()
+            request.resolver_match = resolve('/')
+            self.assertEqual(View.as_view()(request).content, b'ok')
+        self.assertEqual(rendered, ['/csrf/', '/csrf/', '/session/', '/session/'])
+
+
+# Число запросов к базе на страницах-списках не должно зависеть от числа строк на странице
+@override_settings(CACHES=TEST_CACHES)
+class ListViewQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', 'author@example.com', 'password')
+        cls.profile = Profile.objects.create(user=cls.user, email_confirmed=True)
+        cls.reader = User.objects.create_user('reader', 'reader@example.com', 'password')
+        cls.reader_profile = Profile.objects.create(user=cls.reader, email_confirmed=True)
+        cls.categories = [Category.objects.create(name=f'Категория {i}') for i in range(10)]
+        cls.post = cls.create_posts(1)[0]
+
+    @classmethod
+    def create_posts(cls, count):
+        return [
+            Post.objects.create(author=cls.profile, title=f'Пост {i}', content='Текст',
+                                category=cls.categories[i % len(cls.categories)])
+            for i in range(count)
+        ]
+
+    def create_responses(self, count, is_approved):
+        for i in range(count):
+            Response.objects.create(post=self.post, author=self.reader_profile,
+                                    content=f'Отклик {i}', is_approved=is_approved)
+
+    def setUp(self):
+        cache.clear()
+
+    # Запросов столько же и после того, как строк на странице стало больше
+    def assertQueriesStable(self, client, url, grow):
+        cache.clear()
+        with CaptureQueriesContext(connection) as before:
+            self.assertEqual(client.get(url).status_code, 200)
+        grow()
+        cache.clear()
+        with self.assertNumQueries(len(before)):
+            self.assertEqual(client.get(url).status_code, 200)
+        return len(before)
+
+    def test_post_list(self):
+        url = reverse('post-list')
+        queries = self.assertQueriesStable(self.client, url, lambda: self.create_posts(15))
+        self.assertLessEqual(queries, 2)
+
+    def test_response_list(self):
+        url = reverse('response-list', kwargs={'post_pk': self.post.pk})
+        queries = self.assertQueriesStable(self.client, url, lambda: self.create_responses(10, True))
+        self.assertLessEqual(queries, 1)
+
+    def test_response_moderation(self):
+        self.client.force_login(self.user)
+        url = reverse('response-moderation')
+        self.assertQueriesStable(self.client, url, lambda: self.create_responses(10, False))
+
+    def test_subscriptions(self):
+        self.client.force_login(self.reader)
+
+        def subscribe_all():
+            for category in self.categories[1:]:
+                Subscription.objects.create(profile=self.reader_profile, category=category, subscribed=True)
+
+        Subscription.objects.create(profile=self.reader_profile, category=self.categories[0], subscribed=True)
+        self.assertQueriesStable(self.client, reverse('subscriptions'), subscribe_all)
+
+
+# Server-Timing и строка лога guild.performance; рендер при заполнении кэша страниц тоже учитывается
+@override_settings(CACHES=TEST_CACHES)
+class PerformanceMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', 'author@example.com', 'password')
+        profile = Profile.objects.create(user=author, email_confirmed=True)
+        category = Category.objects.create(name='Танки')
+        Post.objects.create(author=profile, title='Пост', content='Текст', category=category)
+
+    def setUp(self):
+        cache.clear()
+
+    # {метрика: dur} и число SQL-запросов из описания db
+    def server_timing(self, response):
+        header = response.headers['Server-Timing']
+        durations = {name: float(value) for name, value in re.findall(r'(\w+);dur=([\d.]+)', header)}
+        return durations, int(re.search(r'db;[^,]*desc="(\d+) queries"', header).group(1))
+
+    def test_server_timing(self):
+        with self.assertLogs('guild.performance', 'INFO') as logs:
+            response = self.client.get(reverse('post-list'))
+        durations, queries = self.server_timing(response)
+        self.assertEqual(set(durations), {'app', 'db', 'tpl'})
+        self.assertIn('cache;desc=', response.headers['Server-Timing'])
+        self.assertGreater(durations['tpl'], 0)
+        self.assertGreater(durations['app'], durations['tpl'])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['url_name'], record['status'], record['sql_count']), ('post-list', 200, queries))
+
+        # страница из кэша: без запросов и без рендера
+        durations, queries = self.server_timing(self.client.get(reverse('post-list')))
+        self.assertEqual((queries, durations['tpl']), (0, 0))
+
+    # При уровне WARNING строка лога не собирается
+    def test_log_line_skipped_below_info(self):
+        with mock.patch('guild.middlewares.json.dumps') as dumps:
+            self.client.get(reverse('post-list'))
+        dumps.assert_not_called()
+
+
+# Счётчики откликов следуют за созданием, одобрением, снятием одобрения и удалением отклика;
+# recount_all восстанавливает их с нуля
+@override_settings(CACHES=TEST_CACHES)
+class ResponseCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', 'author@example.com', 'password')
+        cls.profile = Profile.objects.create(user=author, email_confirmed=True)
+        reader = User.objects.create_user('reader', 'reader@example.com', 'password')
+        cls.reader_profile = Profile.objects.create(user=reader, email_confirmed=True)
+        category = Category.objects.create(name='Танки')
+        cls.post = Post.objects.create(author=cls.profile, title='Пост', content='Текст', category=category)
+
+    def setUp(self):
+        cache.clear()
+
+    def assertCounters(self, total, approved, pending, last_response_at):
+        self.post.refresh_from_db()
+        self.profile.refresh_from_db()
+        self.assertEqual(
+            (self.post.response_count, self.post.approved_response_count, self.profile.pending_moderation_count,
+             self.post.last_response_at),
+            (total, approved, pending, last_response_at),
+        )
+
+    def test_signal_paths(self):
+        first = Response.objects.create(post=self.post, author=self.reader_profile, content='Первый')
+        self.assertCounters(1, 0, 1, first.created_at)
+        first.is_approved = True
+        first.save()
+        self.assertCounters(1, 1, 0, first.created_at)
+        first.is_approved = False
+        first.save()
+        self.assertCounters(1, 0, 1, first.created_at)
+
+        second = Response.objects.create(post=self.post, author=self.reader_profile, content='Второй',
+                                         is_approved=True)
+        self.assertCounters(2, 1, 1, second.created_at)
+        second.delete()
+        self.assertCounters(1, 0, 1, first.created_at)
+        first.delete()
+        self.assertCounters(0, 0, 0, None)
+
+    def test_recount_all(self):
+        responses = [Response.objects.create(post=self.post, author=self.reader_profile, content=f'Отклик {i}',
+                                             is_approved=i % 2 == 0) for i in range(3)]
+        Post.objects.update(response_count=0, approved_response_count=0, last_response_at=None)
+        Profile.objects.update(pending_moderation_count=7)
+        self.assertEqual(recount_all(), (1, 2))
+        self.assertCounters(3, 2, 1, responses[-1].created_at)
+        self.reader_profile.refresh_from_db()
+        self.assertEqual(self.reader_profile.pending_moderation_count, 0)
+
+
+# Массовая модерация: один UPDATE/DELETE на пачку, только свои отклики, письма - одной вставкой
+@override_settings(CACHES=TEST_CACHES)
+class BulkModerationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', 'author@example.com', 'password')
+        cls.profile = Profile.objects.create(user=cls.user, email_confirmed=True)
+        other = User.objects.create_user('other', 'other@example.com', 'password')
+        cls.other_profile = Profile.objects.create(user=other, email_confirmed=True)
+        cls.reader = User.objects.create_user('reader', 'reader@example.com', 'password')
+        cls.reader_profile = Profile.objects.create(user=cls.reader, email_confirmed=True)
+        category = Category.objects.create(name='Категория')
+        cls.post = Post.objects.create(author=cls.profile, title='Пост', content='Текст', category=category)
+        cls.other_post = Post.objects.create(author=cls.other_profile, title='Чужой', content='Текст',
+                                             category=category)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def create_responses(self, post, count):
+        return [
+            Response.objects.create(post=post, author=self.reader_profile, content=f'Отклик {i}')
+            for i in range(count)
+        ]
+
+    def moderate(self, action, responses):
+        return self.client.post(reverse('response-moderation'),
+                                {'action': action, 'ids': [response.pk for response in responses]})
+
+    def test_approve(self):
+        own = self.create_responses(self.post, 5)
+        foreign = self.create_responses(self.other_post, 2)
+        self.assertEqual(self.moderate('approve', own + foreign).status_code, 302)
+
+        self.assertEqual(Response.objects.filter(post=self.post, is_approved=True).count(), 5)
+        self.assertEqual(Response.objects.filter(post=self.other_post, is_approved=True).count(), 0)
+        self.assertEqual(OutboxEmail.objects.count(), 5)
+        self.post.refresh_from_db()
+        self.profile.refresh_from_db()
+        self.assertEqual(self.post.approved_response_count, 5)
+        self.assertEqual(self.profile.pending_moderation_count, 0)
+
+    def test_query_count_does_not_grow(self):
+        few_responses = self.create_responses(self.post, 2)
+        with CaptureQueriesContext(connection) as few:
+            self.moderate('approve', few_responses)
+        many = self.create_responses(self.post, 20)
+        with self.assertNumQueries(len(few)):
+            self.moderate('approve', many)
+
+    def test_delete(self):
+        own = self.create_responses(self.post, 3)
+        foreign = self.create_responses(self.other_post, 1)
+        self.moderate('delete', own + foreign)
+
+        self.assertFalse(Response.objects.filter(post=self.post).exists())
+        self.assertEqual(Response.objects.filter(post=self.other_post).count(), 1)
+        self.post.refresh_from_db()
+        self.profile.refresh_from_db()
+        self.assertEqual(self.post.response_count, 0)
+        self.assertEqual(self.profile.pending_moderation_count, 0)
+
+
+# API постов: фильтры, курсор, выборочные поля и 304 по ETag
+@override_settings(CACHES=TEST_CACHES)
+class PostApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('author', 'author@example.com', 'password')
+        profile = Profile.objects.create(user=user, email_confirmed=True)
+        cls.categories = [Category.objects.create(name=f'Категория {i}') for i in range(2)]
+        for i in range(15):
+            Post.objects.create(author=profile, title=f'Пост {i}', content='Текст',
+                                category=cls.categories[i % 2])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_filter_and_paginate(self):
+        url = reverse('post-api')
+        first = self.client.get(url, {'category': self.categories[0].pk, 'page_size': 5}).json()
+        self.assertEqual(len(first['results']), 5)
+        self.assertEqual({post['category'] for post in first['results']}, {self.categories[0].pk})
+        second = self.client.get(first['next']).json()
+        self.assertEqual(len(second['results']), 3)
+        self.assertIsNone(second['next'])
+
+    def test_sparse_fields(self):
+        data = self.client.get(reverse('post-api'), {'fields': 'id,title'}).json()
+        self.assertEqual(set(data['results'][0]), {'id', 'title'})
+
+    def test_not_modified(self):
+        url = reverse('post-api')
+        first = self.client.get(url)
+        etag = first.headers['ETag']
+        self.assertEqual(first.headers['Last-Modified'], http_date(generation_time(board_generation())))
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['Last-Modified'], first.headers['Last-Modified'])
+        self.assertEqual(self.client.get(url, {'page_size': 5}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        post = Post.objects.first()
+        post.title = 'Новый'
+        with self.captureOnCommitCallbacks(execute=True):
+            post.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            post.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(post.pk, [row['id'] for row in response.json()['results']])
+
+    # Быстрый путь (.values() + orjson) отдаёт то же, что и PostSerializer
+    def test_fast_path_matches_serializer(self):
+        data = self.client.get(reverse('post-api'), {'page_size': 20}).json()['results']
+        posts = Post.objects.order_by('-created_at', '-id')
+        self.assertEqual(data, json.loads(JSONRenderer().render(PostSerializer(posts, many=True).data)))
+
+
+# Массовый импорт: пачки без уведомлений подписчикам, ошибочные записи пропускаются
+@override_settings(CACHES=TEST_CACHES)
+class ContentImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        author = User.objects.create_user('author', 'author@example.com', 'password')
+        Profile.objects.create(user=author, email_confirmed=True)
+        reader = User.objects.create_user('reader', 'reader@example.com', 'password')
+        reader_profile = Profile.objects.create(user=reader, email_confirmed=True)
+        cls.category = Category.objects.create(name='Танки')
+        Subscription.objects.create(profile=reader_profile, category=cls.category, subscribed=True)
+
+    def test_import(self):
+        records = [
+            {'type': 'post', 'ref': 'old-1', 'author': 'author', 'category': 'Танки', 'title': 'Старый пост',
+             'content': 'Текст', 'created_at': '2020-01-02T03:04:05+00:00'},
+            {'type': 'response', 'post_ref': 'old-1', 'author': 'reader', 'content': 'Отклик', 'is_approved': True},
+            {'type': 'response', 'post_ref': 'old-1', 'author': 'reader', 'content': 'Ещё'},
+            {'type': 'post', 'author': 'nobody', 'category': 'Танки', 'title': 'Пост', 'content': 'Текст'},
+            {'type': 'response', 'post_ref': 'old-404', 'author': 'reader', 'content': 'Отклик'},
+        ]
+        url = reverse('content-import')
+        self.assertEqual(self.client.post(url, records, content_type='application/json').status_code, 403)
+
+        self.client.force_login(self.admin)
+        report = self.client.post(url, records, content_type='application/json').json()
+        self.assertEqual((report['posts'], report['responses']), (1, 2))
+        self.assertEqual([error['line'] for error in report['errors']], [4, 5])
+
+        post = Post.objects.get(title='Старый пост')
+        self.assertEqual(post.created_at.year, 2020)
+        self.assertEqual((post.response_count, post.approved_response_count), (2, 1))
+        self.assertEqual(post.author.pending_moderation_count, 1)
+        self.assertFalse(OutboxEmail.objects.exists())
+
+
+# Уменьшенные копии изображений создаёт воркер, страница поста отдаёт их через srcset
+@override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=tempfile.mkdtemp())
+class ImagePipelineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(shutil.rmtree, settings.MEDIA_ROOT, ignore_errors=True)
+
+    def test_variants(self):
+        buffer = io.BytesIO()
+        PILImage.new('RGB', (800, 400), 'red').save(buffer, 'JPEG')
+        user = User.objects.create_user('author', 'author@example.com', 'password')
+        profile = Profile.objects.create(user=user, email_confirmed=True)
+        post = Post.objects.create(author=profile, title='Пост', content='Текст',
+                                   category=Category.objects.create(name='Категория'),
+                                   image=SimpleUploadedFile('big.jpg', buffer.getvalue(), 'image/jpeg'))
+        self.assertEqual(ImageJob.objects.filter(status=ImageJob.STATUS_PENDING).count(), 1)
+        self.assertNotIn('srcset', self.client.get(post.get_absolute_url()).content.decode())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(process_image_batch(), (1, 0, 0))
+        post.refresh_from_db()
+        variants = post.image_variants['variants']
+        self.assertEqual([(variant['width'], variant['height']) for variant in variants], [(150, 75), (300, 150), (600, 300), (800, 400)])
+        self.assertTrue(all(default_storage.exists(variant['webp']) for variant in variants))
+
+        page = self.client.get(post.get_absolute_url()).content.decode()
+        self.assertIn('type="image/webp"', page)
+        self.assertIn('300w', page)
+
+        # повторная обработка того же оригинала даёт файлы с теми же именами; старые ссылки освобождаются
+        ImageJob.objects.create(target='post.image', object_id=post.pk, source=post.image.name)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(process_image_batch(), (1, 0, 0))
+        post.refresh_from_db()
+        self.assertEqual(post.image_variants['variants'], variants)
+        names = [name for variant in variants for name in (variant['src'], variant['webp'])]
+        self.assertEqual(set(StoredBlob.objects.filter(name__in=names).values_list('refcount', flat=True)), {1})
+
+
+# Хранилище по содержимому: одинаковые загрузки - один файл со счётчиком ссылок
+@override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=tempfile.mkdtemp())
+class ContentAddressedStorageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', 'author@example.com', 'password')
+        cls.user.user_permissions.add(Permission.objects.get(codename='add_post'))
+        cls.profile = Profile.objects.create(user=cls.user, email_confirmed=True)
+        cls.category = Category.objects.create(name='Категория')
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(shutil.rmtree, settings.MEDIA_ROOT, ignore_errors=True)
+        self.client.force_login(self.user)
+
+    def upload(self, content, name='screen.png'):
+        return self.client.post(reverse('post-create'), {
+            'title': 'Пост', 'content': 'Текст', 'category': self.category.pk,
+            'image': SimpleUploadedFile(name, content),
+        })
+
+    def png(self):
+        buffer = io.BytesIO()
+        PILImage.new('RGB', (10, 10), 'blue').save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def test_dedupe(self):
+        content = self.png()
+        self.upload(content, 'first.png')
+        self.upload(content, 'second.png')
+        first, second = Post.objects.order_by('id')
+        self.assertEqual(first.image.name, second.image.name)
+        digest = hashlib.sha256(content).hexdigest()
+        self.assertEqual(first.image.name, f'images/{digest[:2]}/{digest[2:4]}/{digest}.png')
+        self.assertEqual(StoredBlob.objects.get().refcount, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(second.image.name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(default_storage.exists(second.image.name))
+        self.assertFalse(StoredBlob.objects.exists())
+
+    # Повторная загрузка того же содержимого не оставляет лишнюю ссылку на файл
+    def test_same_content_reupload(self):
+        content = self.png()
+        self.upload(content)
+        post = Post.objects.get()
+        name = post.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            post.image = SimpleUploadedFile('again.png', content)
+            post.save()
+        self.assertEqual(post.image.name, name)
+        self.assertEqual(StoredBlob.objects.get().refcount, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            post.delete()
+        self.assertFalse(default_storage.exists(name))
+
+    def test_rejects_invalid_image(self):
+        response = self.upload(b'#!/bin/sh\nrm -rf /', 'evil.png')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].errors['image'])
+        with mock.patch('guild.uploads.MEDIA_MAX_UPLOAD_SIZE', 100):
+            response = self.upload(self.png() + b'\0' * 200)
+        self.assertEqual(response.context['form'].errors.as_data()['image'][0].code, 'file_too_large')
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(StoredBlob.objects.exists())
+
+    # Ограничения касаются только полей изображений, а не любых загрузок
+    def test_other_uploads_not_checked(self):
+        self.client.logout()
+        response = self.client.post(reverse('login'), {'username': 'author', 'password': 'wrong',
+                                                        'notes': SimpleUploadedFile('notes.txt', b'text')})
+        self.assertEqual(response.status_code, 200)
+
+
+# Отдача загруженных файлов: ETag, Range и долгий кэш для имён по содержимому
+@override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=tempfile.mkdtemp())
+class MediaViewTests(TestCase):
+    def setUp(self):
+        self.addCleanup(shutil.rmtree, settings.MEDIA_ROOT, ignore_errors=True)
+        self.content = bytes(range(256)) * 4
+        self.name = default_storage.save('images/file.bin', ContentFile(self.content))
+        self.url = f'{settings.MEDIA_URL}{self.name}'
+
+    def test_conditional_and_immutable(self):
+        response = self.client.get(self.url)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        etag = response.headers['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.headers['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=5000-').status_code, 416)
+        stale = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"other"')
+        self.assertEqual(stale.status_code, 200)
+
+    @mock.patch('guild.media.MEDIA_SERVE_MODE', 'x-accel-redirect')
+    def test_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.headers['X-Accel-Redirect'], f'/protected-media/{self.name}')
+        self.assertEqual(response.content, b'')
+
+
+# Индекс подписчиков в кэше правится на месте после подписки и отписки, без перестроения из базы
+@override_settings(CACHES=TEST_CACHES)
+class SubscriberIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', 'author@example.com', 'password')
+        cls.author_profile = Profile.objects.create(user=author, email_confirmed=True)
+        cls.reader = User.objects.create_user('reader', 'reader@example.com', 'password')
+        Profile.objects.create(user=cls.reader, email_confirmed=True)
+        cls.category = Category.objects.create(name='Танки')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def create_post(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(author=self.author_profile, title='Пост', content='Текст',
+                                       category=self.category)
+
+    def test_subscribe_and_unsubscribe(self):
+        post = self.create_post()
+        self.assertFalse(OutboxEmail.objects.exists())
+        page = self.client.get(reverse('post-detail', kwargs={'pk': post.pk}))
+        self.assertContains(page, 'Подписаться на эту категорию')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('subscribe', kwargs={'pk': self.category.pk}), {'delivery': 'immediate'})
+        # индекс уже в кэше: проверка подписки на странице не читает Subscription
+        with CaptureQueriesContext(connection) as queries:
+            page = self.client.get(reverse('post-detail', kwargs={'pk': post.pk}))
+        self.assertContains(page, 'Вы подписаны на эту категорию')
+        self.assertFalse([q for q in queries if 'guild_subscription' in q['sql']])
+        self.create_post()
+        notices = OutboxEmail.objects.filter(subject='Новый пост в подписанной категории!')
+        self.assertEqual(list(notices.values_list('to', flat=True)), [['reader@example.com']])
+
+        # индекс отстал от базы (update() без сигналов): рассылка идёт только по активным подпискам
+        Subscription.objects.update(delivery=Subscription.DELIVERY_DAILY)
+        self.create_post()
+        self.assertEqual(notices.count(), 1)
+        Subscription.objects.update(delivery=Subscription.DELIVERY_IMMEDIATE)
+
+        subscription = Subscription.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('unsubscribe', kwargs={'pk': subscription.pk}))
+        self.create_post()
+        self.assertEqual(notices.count(), 1)
+        page = self.client.get(reverse('post-detail', kwargs={'pk': post.pk}))
+        self.assertContains(page, 'Подписаться на эту категорию')
+
+    # Два процесса правят индекс по очереди: второй не начинает правку с копии из своего LRU
+    def test_two_processes(self):
+        first, second = (TieredCache('', {'OPTIONS': project_settings.CACHES['default']['OPTIONS']})
+                         for _ in range(2))
+        profiles = []
+        for username in ('first', 'second'):
+            user = User.objects.create_user(username, f'{username}@example.com', 'password')
+            profiles.append(Profile.objects.create(user=user, email_confirmed=True))
+        for process in (first, second):
+            with mock.patch('guild.subscribers.cache', process):
+                category_subscribers(self.category.pk)
+        for process, profile in zip((first, second), profiles):
+            subscription = Subscription(profile=profile, category=self.category, subscribed=True)
+            with mock.patch('guild.subscribers.cache', process), self.captureOnCommitCallbacks(execute=True):
+                subscription_changed(subscription)
+        self.assertEqual(category_subscribers(self.category.pk)[Subscription.DELIVERY_IMMEDIATE],
+                         {profile.pk for profile in profiles})
+
+
+# Чтения выбранных маршрутов - с реплики, пока пользователь ничего не записывал
+@mock.patch('guild.routers.DATABASE_REPLICAS', ['replica1'])
+class ReplicaRoutingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'reader@example.com', 'password')
+        Profile.objects.create(user=cls.user, email_confirmed=True)
+        cls.category = Category.objects.create(name='Танки')
+
+    @mock.patch('guild.routers.choose_replica', return_value=None)
+    def test_pinned_after_write(self, choose_replica):
+        self.client.get(reverse('post-list'))
+        self.assertEqual(choose_replica.call_count, 1)
+
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('subscribe', kwargs={'pk': self.category.pk}))
+        self.assertIn('db_pinned_until', response.cookies)
+        self.client.get(reverse('post-list'))
+        self.assertEqual(choose_replica.call_count, 1)
+
+    # Ошибка базы на реплике - в представлении или при отложенном рендере шаблона: реплика исключается,
+    # запрос повторяется один раз
+    def assertRetried(self, patch):
+        self.client.force_login(self.user)
+        with mock.patch('guild.routers._down_until', {}), patch, \
+                mock.patch('guild.routers.choose_replica', side_effect=lambda: None if routers._down_until else 'replica1'), \
+                self.assertNoLogs('django.request', 'ERROR'):
+            response = self.client.get(reverse('post-list'))
+            self.assertEqual(list(routers._down_until), ['replica1'])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Танки')
+
+    def failing_on_replica(self, method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            if routers.current_routing().replica:
+                raise DatabaseError('replica is down')
+            return method(*args, **kwargs)
+        return wrapper
+
+    def test_view_error_retried(self):
+        self.assertRetried(mock.patch.object(PostListView, 'get_context_data',
+                                             self.failing_on_replica(PostListView.get_context_data)))
+
+    def test_render_error_retried(self):
+        rendered_content = property(self.failing_on_replica(SimpleTemplateResponse.rendered_content.fget))
+        self.assertRetried(mock.patch.object(SimpleTemplateResponse, 'rendered_content', rendered_content))
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    def test_router(self):
+        router = routers.ReplicaRouter()
+        self.assertEqual(router.db_for_read(Post), 'default')
+        token = routers.start_request()
+        try:
+            routing = routers.current_routing()
+            routing.replica = 'replica1'
+            self.assertEqual(router.db_for_read(Post), 'replica1')
+            self.assertEqual(router.db_for_write(Post), 'default')
+            self.assertTrue(routing.wrote)
+            with routers.use_primary_since(time.time()):
+                self.assertEqual(router.db_for_read(Post), 'default')
+            with routers.use_primary_since(0):
+                self.assertEqual(router.db_for_read(Post), 'replica1')
+        finally:
+            routers.end_request(token)
+        self.assertEqual(router.db_for_read(Post), 'default')
+
+    # BEGIN IMMEDIATE - только на основной базе, на репликах транзакции начинаются обычным BEGIN
+    def test_begin_immediate_on_primary_only(self):
+        for alias, expected in (('default', ['BEGIN IMMEDIATE']), ('replica1', ['BEGIN'])):
+            wrapper = SqliteDatabaseWrapper({**connection.settings_dict, 'NAME': ':memory:'}, alias)
+            wrapper.force_debug_cursor = True
+            try:
+                wrapper.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+                self.assertEqual([query['sql'] for query in wrapper.queries if 'BEGIN' in query['sql']], expected)
+            finally:
+                wrapper.close()
+
+    # Страница для кэша рендерится по основной базе, после рендера запросу снова назначена реплика
+    @override_settings(CACHES=TEST_CACHES)
+    def test_page_cache_filled_from_primary(self):
+        seen = []
+
+        class View(AnonymousPageCacheMixin, generic.View):
+            def get(self, request):
+                seen.append(routers.ReplicaRouter().db_for_read(Post))
+                return HttpResponse('ok')
+
+        caches['shared'].clear()
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        request.resolver_match = resolve('/')
+        token = routers.start_request()
+        try:
+            routers.current_routing().replica = 'replica1'
+            self.assertEqual(View.as_view()(request).content, b'ok')
+            self.assertEqual(routers.current_routing().replica, 'replica1')
+        finally:
+            routers.end_request(token)
+        self.assertEqual(seen, ['default'])
+
+
+# Синтетический мир детерминирован, сценарии нагрузки проходят по настоящим маршрутам без ошибок
+# (TransactionTestCase: потоки сценариев работают через свои соединения и должны видеть данные)
+@override_settings(CACHES=TEST_CACHES)
+class BenchmarkWorldTests(TransactionTestCase):
+    def test_seed_and_scenarios(self):
+        counts = seed_world(users=5, categories=2, posts=30, responses=60, subscriptions=4, seed=7)
+        self.assertEqual((counts['posts'], counts['responses']), (30, 60))
+        titles = list(Post.objects.order_by('id').values_list('title', flat=True))
+        self.assertEqual(Post.objects.aggregate(total=Sum('response_count'))['total'], 60)
+
+        clear_world()
+        self.assertFalse(Post.objects.exists())
+        seed_world(users=5, categories=2, posts=30, responses=60, subscriptions=4, seed=7)
+        self.assertEqual(list(Post.objects.order_by('id').values_list('title', flat=True)), titles)
+
+        world = World()
+        for name in SCENARIOS:
+            result = run_scenario(name, world, requests=4, concurrency=1, warmup=1)
+            self.assertEqual((result['requests'], result['errors']), (4, 0), name)
+
+
+# /metrics: формат Prometheus, сложение снимков нескольких процессов из METRICS_DIR
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def test_exposition(self):
+        self.client.get(reverse('post-list'))
+        text = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('# TYPE guild_http_request_duration_seconds histogram', text)
+        self.assertIn('guild_http_request_duration_seconds_bucket{view="post-list",method="GET",le="+Inf"}', text)
+        self.assertIn('guild_http_requests_total{view="post-list",method="GET",status="200"}', text)
+
+    def test_multiprocess(self):
+        registry = metrics.Registry()
+        emails = registry.counter('emails_total', 'Письма', ('result',))
+        emails.inc(2, result='sent')
+        # снимок другого воркера
+        with open(f'{self.directory}/1.json', 'w') as file:
+            json.dump({'emails_total': [[['sent'], 3], [['dead'], 1]]}, file)
+        with mock.patch('guild.metrics.METRICS_DIR', self.directory):
+            text = registry.render()
+        self.assertIn('emails_total{result="sent"} 5', text)
+        self.assertIn('emails_total{result="dead"} 1', text)
+
+    # Письма из откаченной транзакции в счётчик не попадают
+    def test_emails_queued_after_commit(self):
+        def queued():
+            with metrics.registry.lock:
+                return metrics.registry.values_for(metrics.EMAILS_QUEUED.name).get((), 0)
+
+        before = queued()
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            queue_mail('Тема', 'Текст', None, ['reader@example.com'])
+            queue_mass_mail([('Тема', 'Текст', None, [f'reader{i}@example.com']) for i in range(3)])
+        self.assertEqual(queued(), before)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(queued(), before + 4)
+
+    @mock.patch('guild.metrics.METRICS_TOKEN', 'secret')
+    def test_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+
+# Асинхронные представления чтения через ASGI (AsyncClient): те же страницы и ответы API
+@override_settings(CACHES=TEST_CACHES, ROOT_URLCONF='guild.tests')
+class AsyncReadViewsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', 'author@example.com', 'password')
+        profile = Profile.objects.create(user=cls.user, email_confirmed=True)
+        cls.categories = [Category.objects.create(name=f'Категория {i}') for i in range(2)]
+        cls.posts = [
+            Post.objects.create(author=profile, title=f'Пост {i}', content='Текст', category=cls.categories[i % 2])
+            for i in range(15)
+        ]
+        Response.objects.create(post=cls.posts[0], author=profile, content='Одобренный отклик', is_approved=True)
+        Response.objects.create(post=cls.posts[0], author=profile, content='Скрытый отклик')
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_pages(self):
+        response = await self.async_client.get(reverse('post-list'))
+        self.assertContains(response, '<h3>Пост 5</h3>')
+        self.assertNotContains(response, '<h3>Пост 4</h3>')
+        self.assertContains(response, 'cursor=')
+        self.assertRegex(response.headers['Server-Timing'], r'"[1-9]\d* queries"')
+        # повтор анонимной страницы - из кэша страниц
+        cached = await self.async_client.get(reverse('post-list'))
+        self.assertIn('"0 queries"', cached.headers['Server-Timing'])
+
+        response = await self.async_client.get(reverse('post-detail', kwargs={'pk': self.posts[0].pk}))
+        self.assertContains(response, 'Пост 0')
+        response = await self.async_client.get(reverse('post-detail', kwargs={'pk': 0}))
+        self.assertEqual(response.status_code, 404)
+
+        response = await self.async_client.get(reverse('response-list', kwargs={'post_pk': self.posts[0].pk}))
+        self.assertContains(response, 'Одобренный отклик')
+        self.assertNotContains(response, 'Скрытый отклик')
+
+        # вошедший пользователь: мимо кэша страниц, с проверкой подписки
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get(reverse('post-detail', kwargs={'pk': self.posts[0].pk}))
+        self.assertContains(response, 'subscribe')
+
+    async def test_post_api(self):
+        url = reverse('post-api')
+        first = await self.async_client.get(url, {'category': self.categories[0].pk, 'page_size': 5})
+        data = first.json()
+        self.assertEqual(len(data['results']), 5)
+        self.assertEqual({post['category'] for post in data['results']}, {self.categories[0].pk})
+        self.assertIn('Last-Modified', first.headers)
+        second = (await self.async_client.get(data['next'])).json()
+        self.assertEqual(len(second['results']), 3)
+
+        response = await self.async_client.get(url, {'fields': 'id,title'}, headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'title'})
+        response = await self.async_client.get(url, {'category': self.categories[0].pk, 'page_size': 5},
+                                               headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual((await self.async_client.get(url, {'category': 'x'})).status_code, 400)
+
+
+# Поток SSE: состояние очереди модерации, затем события нового отклика и одобрения
+@override_settings(CACHES=TEST_CACHES)
+class EventStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password')
+        cls.profile = Profile.objects.create(user=cls.author, email_confirmed=True)
+        cls.reader = User.objects.create_user('reader', 'reader@example.com', 'password')
+        cls.reader_profile = Profile.objects.create(user=cls.reader, email_confirmed=True)
+        category = Category.objects.create(name='Категория')
+        cls.post = Post.objects.create(author=cls.profile, title='Рейд', content='Текст', category=category)
+
+    def respond(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Response.objects.create(post=self.post, author=self.reader_profile, content='Иду')
+
+    def approve(self, response):
+        with self.captureOnCommitCallbacks(execute=True):
+            approve_responses(self.profile, [response.pk])
+
+    async def read_events(self, stream, count):
+        frames = [(await anext(stream)).decode() for _ in range(count)]
+        return [(frame.split('\n')[0], json.loads(frame.split('\n')[1][len('data: '):])) for frame in frames]
+
+    async def test_stream(self):
+        await sync_to_async(self.async_client.force_login)(self.author)
+        response = await self.async_client.get(reverse('events'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content
+        self.assertEqual(await anext(stream), f'retry: {events.EVENTS_RETRY_MS}\n\n'.encode())
+        self.assertEqual(await self.read_events(stream, 1), [('event: moderation.pending', {'pending': 0})])
+
+        created = await sync_to_async(self.respond)()
+        self.assertEqual(await self.read_events(stream, 2), [
+            ('event: response.created',
+             {'id': created.pk, 'post_id': self.post.pk, 'post_title': 'Рейд', 'author': 'reader'}),
+            ('event: moderation.pending', {'pending': 1}),
+        ])
+        # одобрение - автору отклика; автор поста получает только новое число ожидающих
+        async with events.get_broker().subscribe(events.user_channel(self.reader.pk)) as reader_events:
+            await sync_to_async(self.approve)(created)
+            self.assertEqual(json.loads(await reader_events.get()), {
+                'event': 'response.approved', 'data': {'id': created.pk, 'post_id': self.post.pk, 'post_title': 'Рейд'},
+            })
+        self.assertEqual(await self.read_events(stream, 1), [('event: moderation.pending', {'pending': 0})])
+        await stream.aclose()
+
+    def test_wsgi_and_anonymous(self):
+        self.assertEqual(self.client.get(reverse('events')).status_code, 401)
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('events'))
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn('retry: ', body)
+        self.assertIn('event: moderation.pending', body)
+
+    # Слушатель Redis закрывает pubsub после каждого обрыва соединения
+    def test_redis_listener_closes_pubsub(self):
+        class RedisError(Exception):
+            pass
+
+        class Stop(BaseException):
+            pass
+
+        pubsub = mock.Mock()
+        pubsub.listen.side_effect = [RedisError('connection lost'), Stop()]
+        fake_redis = mock.Mock(RedisError=RedisError)
+        fake_redis.Redis.from_url.return_value.pubsub.return_value = pubsub
+        with mock.patch('guild.events.redis', fake_redis), mock.patch('guild.events.time.sleep'), \
+                self.assertLogs('guild.events', 'WARNING'):
+            broker = events.RedisBroker('redis://localhost')
+            with self.assertRaises(Stop):
+                broker.listen()
+        self.assertEqual(pubsub.close.call_count, 2)
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.template.defaultfilters import filesizeformat
+
+# Ограничения загрузки изображений: размер файла и типы, определяемые по первым байтам, а не по имени
+MEDIA_MAX_UPLOAD_SIZE = getattr(settings, 'MEDIA_MAX_UPLOAD_SIZE', 10 * 1024 * 1024)
+MEDIA_ALLOWED_TYPES = getattr(settings, 'MEDIA_ALLOWED_TYPES', ('image/jpeg', 'image/png', 'image/gif', 'image/webp'))
+
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+
+def sniff_content_type(head):
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    for signature, content_type in SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    return None
+
+
+# Валидатор полей изображений в формах (PostForm.image, ProfileForm.avatar).
+# Проверяются только эти поля: остальные загрузки идут через стандартные обработчики Django без ограничений
+def validate_image_upload(file):
+    if file.size > MEDIA_MAX_UPLOAD_SIZE:
+        raise ValidationError('Файл больше %(limit)s', code='file_too_large',
+                              params={'limit': filesizeformat(MEDIA_MAX_UPLOAD_SIZE)})
+    file.seek(0)
+    head = file.read(16)
+    file.seek(0)
+    if sniff_content_type(head) not in MEDIA_ALLOWED_TYPES:
+        raise ValidationError('Недопустимый тип файла', code='invalid_image_type')
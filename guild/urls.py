@@ -1,24 +1,35 @@
 from django.urls import path
 
-from django.conf.urls.static import static
 from MMORPG import settings
 from django.contrib.auth import views as auth_views
 
 from guild import views
+from guild.async_views import AsyncPostDetailView, AsyncPostListAPIView, AsyncPostListView, AsyncResponseView, \
+    EventStreamView
+from guild.media import MediaView
 from guild.views import ResponseApproveView, ResponseModerationView, PostListView, PostDetailView, PostCreateView, \
     PostUpdateView, PostDeleteView, ResponseCreateView, ResponseView, UserRegisterView, \
     ProfileUpdateView, ResponseDeleteView, SubscriptionView, UnsubscribeView, ConfirmRegistrationView, \
     UserPasswordChangeView, UserForgotPasswordView, UserPasswordResetConfirmView
 
+# Под ASGI ленту, пост, отклики и GET /api/post/ обслуживают асинхронные представления
+if getattr(settings, 'ASYNC_READ_VIEWS', False):
+    read_views = (AsyncPostListView, AsyncPostDetailView, AsyncResponseView, AsyncPostListAPIView)
+else:
+    read_views = (PostListView, PostDetailView, ResponseView, views.PostListCreate)
+post_list_view, post_detail_view, response_list_view, post_api_view = (view.as_view() for view in read_views)
+
 urlpatterns = [
-                  path('', PostListView.as_view(), name='post-list'),
-                  path('post/<int:pk>/', PostDetailView.as_view(), name='post-detail'),
+                  path('', post_list_view, name='post-list'),
+                  path('post/<int:pk>/', post_detail_view, name='post-detail'),
                   path('post/new/', PostCreateView.as_view(), name='post-create'),
                   path('post/<int:pk>/update/', PostUpdateView.as_view(), name='post-update'),
                   path('post/<int:pk>/delete/', PostDeleteView.as_view(), name='post-delete'),
                   path('post/<int:pk>/response/new/', ResponseCreateView.as_view(), name='response-create'),
-                  path('post/<int:post_pk>/responses/', ResponseView.as_view(), name='response-list'),
+                  path('post/<int:post_pk>/responses/', response_list_view, name='response-list'),
                   path('responses/moderation/', ResponseModerationView.as_view(), name='response-moderation'),
+                  # Новые отклики, одобрения и очередь модерации в реальном времени (SSE, лучше под ASGI)
+                  path('events/', EventStreamView.as_view(), name='events'),
                   path('response/<int:pk>/approve/', ResponseApproveView.as_view(), name='response-approve'),
                   path('response/<int:pk>/delete/', ResponseDeleteView.as_view(), name='response-delete'),
                   path('category/<int:pk>/subscribe/', SubscriptionView.as_view(), name='subscribe'),
@@ -39,5 +50,9 @@ urlpatterns = [
                        name='password_reset_complete'),
                   path('set-new-password/<uidb64>/<token>/', UserPasswordResetConfirmView.as_view(),
                        name='password_reset_confirm'),
-                  path('api/post/', views.PostListCreate.as_view()),
-              ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+                  path('api/post/', post_api_view, name='post-api'),
+                  path('api/import/', views.ContentImportView.as_view(), name='content-import'),
+                  path('metrics', views.MetricsView.as_view(), name='metrics'),
+                  # Загруженные файлы: условные запросы, Range, выгрузка в nginx/Apache (MEDIA_SERVE_MODE)
+                  path(f'{settings.MEDIA_URL.strip("/")}/<path:path>', MediaView.as_view(), name='media'),
+              ]
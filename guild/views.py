@@ -1,90 +1,125 @@
+import hashlib
+
 import pyotp
 from django.contrib.auth import login
 from django.contrib.auth.views import PasswordChangeView, PasswordResetView, PasswordResetConfirmView
 from django.contrib.messages.views import SuccessMessageMixin
 
 from django.contrib.sites.shortcuts import get_current_site
-from django.core.cache import cache
-from django.http import HttpResponseRedirect
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseRedirect, Http404
 from django.urls import reverse, reverse_lazy
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date, quote_etag, urlencode
 from django.views import View
 
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin, UserPassesTestMixin
 from django_filters.views import FilterView
-from rest_framework import generics
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import generics, status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response as APIResponse
+from rest_framework.views import APIView
 
 from MMORPG import settings
+from services.modules.mixins import AnonymousPageCacheMixin
 
 from .forms import ProfileForm, PostForm, ConfirmationCodeForm, ResponseFilterForm, UserPasswordChangeForm, \
     UserForgotPasswordForm, CustomSetPasswordForm
+from .caching import board_generation, generation_time, get_post_snapshot, post_version
+from .ingest import Importer
+from . import metrics, routers
+from .mail import queue_mail
 from .models import Post, Response, Profile, Category, Subscription
-from django.core.mail import send_mail
+from .moderation import MODERATION_ACTIONS, approve_responses, delete_responses
 from django.shortcuts import redirect, get_object_or_404, render
-from django.core.paginator import Paginator
 
 import pytz
 
 from django.contrib import messages
 from .forms import UserRegisterForm
 from .filters import ResponseFilter, PostFilter
-from .serializers import PostSerializer
+from .pagination import KeysetPaginator, PostCursorPagination
+from .search import search_page
+from .subscribers import is_subscribed
+from .serializers import POST_READ_FIELDS, PostSerializer, post_rows, post_values
 
 
 # Показать все объявления
-class PostListView(ListView, FilterView):
+class PostListView(AnonymousPageCacheMixin, FilterView):
     model = Post
-    ordering = '-created_at'
     context_object_name = 'posts'
     template_name = 'post_list.html'
     paginate_by = 10  # Количество объявлений на странице
     filterset_class = PostFilter
 
+    # Автор и категория загружаются тем же запросом, что и посты страницы
+    def get_queryset(self):
+        return (
+            Post.objects
+            .select_related('author__user', 'category')
+            .only('id', 'title', 'content', 'created_at', 'response_count',
+                  'author', 'author__user', 'author__user__username',
+                  'category', 'category__name')
+        )
+
+    # Курсорная пагинация по (created_at, id): фильтр применяется один раз в FilterView.get,
+    # страница выбирается одним запросом без COUNT(*) и OFFSET
+    # При поиске по тексту результаты упорядочены по релевантности
+    def paginate_queryset(self, queryset, page_size):
+        cursor = self.request.GET.get('cursor')
+        query = getattr(self.filterset.form, 'cleaned_data', {}).get('content')
+        if query:
+            page = search_page(queryset, query, page_size, cursor)
+        else:
+            page = KeysetPaginator(queryset, page_size).page(cursor)
+        return None, page, page.object_list, page.has_other_pages()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        paginator = Paginator(self.get_queryset(), self.paginate_by)
-        page = self.request.GET.get('page')
-        posts = paginator.get_page(page)
+        query = self.request.GET.copy()
+        query.pop('cursor', None)
+        query.pop('page', None)
+        context['query_string'] = query.urlencode()
+        context['posts'] = context['page_obj']
         context['filterset'] = self.filterset
-        context['posts'] = posts
-        context['filter'] = PostFilter(self.request.GET, queryset=self.get_queryset())
         context['current_time'] = timezone.localtime(timezone.now())
         context['timezones'] = pytz.common_timezones
         return context
 
-    def get_queryset(self):
-        queryset = super().get_queryset()
-        self.filterset = PostFilter(self.request.GET, queryset)
-        return self.filterset.qs
-
     def post(self, request):
         request.session['django_timezone'] = request.POST['timezone']
         return redirect('/')
 
 
 # Показать объявление
-class PostDetailView(DetailView):
+class PostDetailView(AnonymousPageCacheMixin, DetailView):
     model = Post
     form_class = PostForm
     context_object_name = 'post'
     template_name = 'post_detail.html'
 
-    def get_object(self, *args, **kwargs):  # переопределяем метод получения объекта
-
-        obj = cache.get(f'post_{self.kwargs["pk"]}', None)
-
-        # если объекта нет в кэше, то получаем его и записываем в кэш
-        if not obj:
-            obj = super().get_object(queryset=self.queryset)
-            cache.set(f'post_{self.kwargs["pk"]}', obj)
+    # Страница поста сбрасывается вместе со снимком поста (изменение поста или откликов)
+    def get_page_generation(self):
+        return post_version(self.kwargs['pk'])
 
+    def get_object(self, *args, **kwargs):  # переопределяем метод получения объекта
+        # снимок поста из кэша (с автором, категорией и числом откликов), сбрасывается сигналами
+        obj = get_post_snapshot(self.kwargs['pk'])
+        if obj is None:
+            raise Http404('Объявление не найдено')
         return obj
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['current_time'] = timezone.localtime(timezone.now())
         context['timezones'] = pytz.common_timezones
+        # Страница анонимного пользователя кэшируется, подписка проверяется только для вошедших
+        if self.request.user.is_authenticated:
+            context['is_subscribed'] = is_subscribed(self.request.user.pk, self.object.category_id)
         return context
 
     def post(self, request):
@@ -174,7 +209,11 @@ class ResponseView(ListView):
         # Получаем id поста из URL
         post_id = self.kwargs['post_pk']
         # Возвращаем все отзывы для данного поста
-        return Response.objects.filter(post__id=post_id, is_approved=True)
+        return (
+            Response.objects
+            .filter(post__id=post_id, is_approved=True)
+            .select_related('author__user', 'post__category')
+        )
 
 
 # Модерация откликов на пост и отправка письма автору поста
@@ -193,7 +232,11 @@ class ResponseModerationView(LoginRequiredMixin, ListView):
         return super().form_valid(form) and HttpResponseRedirect('/')
 
     def get_queryset(self):
-        queryset = Response.objects.filter(post__author=self.request.user.profile, is_approved=False)
+        queryset = (
+            Response.objects
+            .filter(post__author=self.request.user.profile, is_approved=False)
+            .select_related('author__user', 'post__category')
+        )
         category_filter = self.request.GET.get('category')
         if category_filter:
             queryset = queryset.filter(post__category_id=category_filter)
@@ -206,6 +249,22 @@ class ResponseModerationView(LoginRequiredMixin, ListView):
         context['filter_form'] = ResponseFilterForm()
         return context
 
+    # Массовая модерация: action=approve|delete и список отмеченных откликов ids
+    def post(self, request, *args, **kwargs):
+        profile = request.user.profile
+        if not profile.email_confirmed:
+            return redirect('confirm')
+        action = request.POST.get('action')
+        ids = [int(pk) for pk in request.POST.getlist('ids') if pk.isdigit()]
+        if action in MODERATION_ACTIONS and ids:
+            if action == 'approve':
+                approve_responses(profile, ids)
+            else:
+                delete_responses(profile, ids)
+        url = reverse('response-moderation')
+        category = request.POST.get('category')
+        return redirect(f'{url}?{urlencode({"category": category})}' if category else url)
+
 
 # Подтвердить отклик на пост
 class ResponseApproveView(View):
@@ -233,14 +292,14 @@ class ResponseCreateView(LoginRequiredMixin, CreateView):
         if self.request.user.profile.email_confirmed:
             form.instance.author = self.request.user.profile
             form.instance.post = Post.objects.get(pk=self.kwargs['pk'])
-            response = form.save()
-            send_mail(
-                'Получен новый ответ',
-                f'Вы получили новый ответ на свое сообщение: {response.post.title}',
-                settings.EMAIL_HOST_USER,
-                [response.post.author.user.email],
-                fail_silently=False,
-            )
+            with transaction.atomic():
+                response = form.save()
+                queue_mail(
+                    'Получен новый ответ',
+                    f'Вы получили новый ответ на свое сообщение: {response.post.title}',
+                    settings.EMAIL_HOST_USER,
+                    [response.post.author.user.email],
+                )
         else:
             return redirect('confirm')
         return redirect('post-detail', pk=response.post.pk)
@@ -282,6 +341,7 @@ class UserRegisterView(CreateView):
     template_name = 'profiles/register.html'
     success_url = reverse_lazy('login')
 
+    @transaction.atomic
     def form_valid(self, form):
         valid = super().form_valid(form)
         user = self.object
@@ -298,12 +358,11 @@ class UserRegisterView(CreateView):
         profile.save()
 
         # Отправка кода подтверждения пользователю, например, по почте или SMS
-        send_mail(
+        queue_mail(
             'Код подтверждения',
             f'Ваш код подтверждения: {one_time_password}',
             settings.EMAIL_HOST_USER,
             [user.email],
-            fail_silently=False,
         )
 
         # Редирект на страницу верификации одноразового кода
@@ -344,20 +403,29 @@ class SubscriptionView(ListView):
     model = Subscription
 
     def get_queryset(self):
-        return Subscription.objects.filter(profile=self.request.user.profile)
+        return Subscription.objects.filter(profile=self.request.user.profile).select_related('category')
 
     def post(self, request, *args, **kwargs):
         category = get_object_or_404(Category, id=kwargs['pk'])
         profile = Profile.objects.get(user=request.user)
-        subscription, created = Subscription.objects.get_or_create(profile=profile, category=category)
-        if created:
-            subscription.subscribed = True
-            subscription.save()
-            # Отправка письма
-            subject = 'Вы успешно подписались!'
-            message = f'Вы подписались на категорию {category.name}. Вы можете отписаться, перейдя по ' \
-                      f'ссылке: http://{get_current_site(request)}/unsubscribe/{subscription.id}/'
-            send_mail(subject, message, settings.EMAIL_HOST_USER, [request.user.email])
+        delivery = request.POST.get('delivery')
+        if delivery not in dict(Subscription.DELIVERY_CHOICES):
+            delivery = Subscription.DELIVERY_IMMEDIATE
+        with transaction.atomic():
+            subscription, created = Subscription.objects.get_or_create(
+                profile=profile, category=category, defaults={'subscribed': True, 'delivery': delivery},
+            )
+            resubscribed = not created and not subscription.subscribed
+            if not created and (resubscribed or subscription.delivery != delivery):
+                subscription.subscribed = True
+                subscription.delivery = delivery
+                subscription.save(update_fields=['subscribed', 'delivery'])
+            if created or resubscribed:
+                # Отправка письма
+                subject = 'Вы успешно подписались!'
+                message = f'Вы подписались на категорию {category.name}. Вы можете отписаться, перейдя по ' \
+                          f'ссылке: http://{get_current_site(request)}/unsubscribe/{subscription.id}/'
+                queue_mail(subject, message, settings.EMAIL_HOST_USER, [request.user.email])
         return redirect('subscriptions')
 
 
@@ -369,12 +437,13 @@ class UnsubscribeView(DeleteView):
 
     def delete(self, request, *args, **kwargs):
         subscription = get_object_or_404(Subscription, id=kwargs['pk'])
-        subscription.subscribed = False
-        subscription.save()
-        # Отправка письма
-        subject = 'Вы успешно отписались!'
-        message = f'Вы отписались от категории {subscription.category.name}.'
-        send_mail(subject, message, settings.EMAIL_HOST_USER, [request.user.email])
+        with transaction.atomic():
+            subscription.subscribed = False
+            subscription.save()
+            # Отправка письма
+            subject = 'Вы успешно отписались!'
+            message = f'Вы отписались от категории {subscription.category.name}.'
+            queue_mail(subject, message, settings.EMAIL_HOST_USER, [request.user.email])
         return redirect('subscriptions')
 
 
@@ -439,6 +508,64 @@ class UserPasswordResetConfirmView(SuccessMessageMixin, PasswordResetConfirmView
         return reverse_lazy('password_reset_complete')
 
 
+# API постов: курсорная пагинация, фильтры PostFilter, ?fields=... и условный GET.
+# Список отдаётся через .values() (post_rows) и рендерится orjson (FastJSONRenderer).
+# ETag строится по поколению ленты (guild.caching.board_generation) и строке запроса;
+# если клиент прислал тот же ETag, ответ 304 без запросов к базе и сериализации.
+# Last-Modified - время смены поколения; валидатором остаётся ETag: секунд в Last-Modified мало,
+# чтобы отличить два изменения ленты в пределах одной секунды
 class PostListCreate(generics.ListCreateAPIView):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
+    pagination_class = PostCursorPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = PostFilter
+
+    # Чтение - быстрым путём: .values() по нужным колонкам и словари без ModelSerializer
+    def list(self, request, *args, **kwargs):
+        requested = PostSerializer.requested_fields(request)
+        fields = [name for name in POST_READ_FIELDS if requested is None or name in requested]
+        page = self.paginate_queryset(post_values(self.filter_queryset(self.get_queryset()), fields))
+        return self.get_paginated_response(post_rows(page, fields, request))
+
+    # Поколение меняется при любом изменении постов и откликов, в том числе при удалении
+    def get(self, request, *args, **kwargs):
+        generation = board_generation()
+        raw = f'{generation}|{request.get_full_path()}|{request.accepted_renderer.format}'
+        etag = quote_etag(hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest())
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            # Ответ помечается текущим поколением: сразу после записи реплика могла её ещё не получить
+            with routers.use_primary_since(generation_time(generation)):
+                response = self.list(request, *args, **kwargs)
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(generation_time(generation))
+        return response
+
+
+# Массовый импорт постов и откликов (только администраторы): список записей в формате guild/ingest.py
+class ContentImportView(APIView):
+    permission_classes = [IsAdminUser]
+    max_records = 10000
+
+    def post(self, request, *args, **kwargs):
+        records = request.data if isinstance(request.data, list) else request.data.get('records')
+        if not isinstance(records, list):
+            return APIResponse({'detail': 'Ожидается список записей'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(records) > self.max_records:
+            return APIResponse({'detail': f'Не больше {self.max_records} записей за запрос'},
+                               status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        importer = Importer()
+        importer.feed(enumerate(records, 1))
+        return APIResponse(importer.report(), status=status.HTTP_201_CREATED)
+
+
+# Метрики в текстовом формате Prometheus (guild/metrics.py). Если задан METRICS_TOKEN,
+# сборщик должен передать его в заголовке Authorization: Bearer <токен>
+class MetricsView(View):
+    def get(self, request):
+        token = metrics.METRICS_TOKEN
+        if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse(status=401)
+        return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,8 +1,14 @@
+from asgiref.sync import sync_to_async
 from django.contrib import messages
 from django.shortcuts import redirect
 from django.contrib.auth.mixins import UserPassesTestMixin
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
 
+from guild import routers
+from guild.caching import PAGE_CACHE_TIMEOUT, aboard_generation, board_generation, page_cache_key
+from guild.instrumentation import record_template
+
 
 class UserIsNotAuthenticated(UserPassesTestMixin):
     def test_func(self):
@@ -13,3 +19,73 @@ class UserIsNotAuthenticated(UserPassesTestMixin):
 
     def handle_no_permission(self):
         return redirect('post-list')
+
+
+# Кэш целых страниц для анонимных пользователей.
+# Авторизованные пользователи и не-GET запросы идут мимо кэша. Ключ страницы содержит
+# поколение данных (get_page_generation), поэтому изменения постов сбрасывают кэш сразу
+class AnonymousPageCacheMixin:
+    page_cache_timeout = PAGE_CACHE_TIMEOUT
+
+    def get_page_generation(self):
+        return board_generation()
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+            return super().dispatch(request, *args, **kwargs)
+
+        key = page_cache_key(request, self.get_page_generation())
+        fresh = None
+
+        # При промахе страницу рендерит один процесс (get_or_set с блокировкой), остальные ждут её.
+        # Рендер - сразу и по основной базе, чтобы в кэш попала готовая страница без отставания реплик
+        def render():
+            nonlocal fresh
+            with routers.use_primary():
+                fresh = super(AnonymousPageCacheMixin, self).dispatch(request, *args, **kwargs)
+                if hasattr(fresh, 'render') and callable(fresh.render):
+                    with record_template():
+                        fresh.render()
+            return fresh if _cacheable(request, fresh) else None
+
+        response = cache.get_or_set(key, render, self.page_cache_timeout)
+        return fresh if response is None else response
+
+
+# Персональные страницы не кэшируются. CSRF-токен ({% csrf_token %}, get_token) и изменённая сессия
+# превращаются в cookie уже после представления (CsrfViewMiddleware, SessionMiddleware),
+# поэтому проверяются по запросу, а не по response.cookies
+def _cacheable(request, response):
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return False
+    session = getattr(request, 'session', None)
+    return not request.META.get('CSRF_COOKIE_NEEDS_UPDATE') and not (session is not None and session.modified)
+
+
+# Тот же кэш для асинхронных представлений (guild/async_views.py). Пользователь сессии загружается
+# в потоке: в Django 4.2 request.user синхронный. TemplateResponse рендерится в потоке, как это
+# сделал бы обработчик запроса
+class AsyncAnonymousPageCacheMixin:
+    page_cache_timeout = PAGE_CACHE_TIMEOUT
+
+    async def get_page_generation(self):
+        return await aboard_generation()
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or await sync_to_async(lambda: request.user.is_authenticated)():
+            return await super().dispatch(request, *args, **kwargs)
+
+        key = page_cache_key(request, await self.get_page_generation())
+        fresh = None
+
+        async def render():
+            nonlocal fresh
+            with routers.use_primary():
+                fresh = await super(AsyncAnonymousPageCacheMixin, self).dispatch(request, *args, **kwargs)
+                if hasattr(fresh, 'render') and callable(fresh.render):
+                    with record_template():
+                        await sync_to_async(fresh.render)()
+            return fresh if _cacheable(request, fresh) else None
+
+        response = await cache.aget_or_set(key, render, self.page_cache_timeout)
+        return fresh if response is None else response